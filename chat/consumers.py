@@ -1,14 +1,37 @@
 import json
 import logging
-from urllib.parse import unquote
+from urllib.parse import unquote, urlparse
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from chat.models import PrivateMessage
+from uploads.delivery import signed_url, is_own_upload
 
 logger = logging.getLogger(__name__)
 
+
+def stored_name(file_url):
+    ''' storage name of a media url sent by the client, without its host or media token '''
+    return unquote(urlparse(file_url).path).replace('/media/', '', 1)
+
+
+def attachment_name(user, file_url):
+    '''
+    storage name of a file attached by user, None unless it is one of their own
+    chat uploads: the message would otherwise share any stored file with the room
+    '''
+    name = stored_name(file_url)
+    if name.startswith('chat_files/') and is_own_upload(user, name):
+        return name
+    return None
+
+
+def file_url_for(user, name):
+    # every member of the room gets a link signed for themselves
+    return signed_url(user, name) if name else None
+
+
 class ChatConsumer(AsyncWebsocketConsumer):
     """ handling real-time group chat communication for a specific Course."""
     async def connect(self):
@@ -46,6 +69,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
             # Ensure the user is actually logged in before processing
             if user.is_authenticated:
                 saved_msg = await self.save_message(user, self.course_id, message, file_url)
+                if saved_msg is None:
+                    await self.send(text_data=json.dumps({'error': 'Invalid attachment.'}))
+                    return
                 # Broadcast the message to all channels in this group
                 await self.channel_layer.group_send(
                     self.room_group_name,
@@ -53,7 +79,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                         'type': 'chat_message',
                         'id': saved_msg.id,
                         'message': message,
-                        'file_url': file_url,
+                        'file': saved_msg.file.name or None,
                         'user': user.username,
                         'timestamp': timezone.now().strftime('%H:%M')
                     }
@@ -69,7 +95,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
         await self.send(text_data=json.dumps({
             'id': event.get('id'),
             'message': event['message'],
-            'file_url': event.get('file_url'),
+            'file_url': file_url_for(self.scope['user'], event.get('file')),
             'user': event['user'],
             'timestamp': event['timestamp']
         }))
@@ -78,7 +104,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
     def save_message(self, user, course_id, message, file_url):
         '''
         ensures Django ORM queries run in a separate thread pool and do not 
-        block the main async event loop.
+        block the main async event loop. returns None when the attachment is refused
         '''
         from courses.models import Course
         from chat.models import Message
@@ -87,8 +113,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
         msg = Message(sender=user, course=course, content=message)
         
         if file_url:
-            decoded_url = unquote(file_url)
-            msg.file.name = decoded_url.replace('/media/', '')
+            msg.file.name = attachment_name(user, file_url)
+            if msg.file.name is None:
+                return None
             
         msg.save()
         return msg
@@ -119,6 +146,9 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
 
             if sender.is_authenticated and target_user_id:
                 saved_msg = await self.save_private_message(sender, target_user_id, message, file_url)
+                if saved_msg is None:
+                    await self.send(text_data=json.dumps({'error': 'Invalid attachment.'}))
+                    return
 
                 await self.channel_layer.group_send(
                     self.room_group_name,
@@ -126,7 +156,7 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
                         'type': 'chat_message',
                         'id': saved_msg.id,
                         'message': message,
-                        'file_url': file_url, 
+                        'file': saved_msg.file.name or None,
                         'user': sender.username,
                         'timestamp': timezone.now().strftime('%H:%M')
                     }
@@ -142,7 +172,7 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
         await self.send(text_data=json.dumps({
             'id': event.get('id'),
             'message': event['message'],
-            'file_url': event.get('file_url'),
+            'file_url': file_url_for(self.scope['user'], event.get('file')),
             'user': event['user'],
             'timestamp': event['timestamp']
         }))
@@ -157,8 +187,9 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
         msg = PrivateMessage(sender=sender, recipient=target, content=message)
         
         if file_url:
-            decoded_url = unquote(file_url)
-            msg.file.name = decoded_url.replace('/media/', '')
+            msg.file.name = attachment_name(sender, file_url)
+            if msg.file.name is None:
+                return None
             
         msg.save()
 
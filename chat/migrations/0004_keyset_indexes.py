@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['course', '-timestamp', '-id'], name='chat_msg_course_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='privatemessage',
+            index=models.Index(fields=['sender', 'recipient', '-timestamp', '-id'], name='chat_pm_pair_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-17 20:02
+
+from django.db import migrations, models
+
+
+def mark_existing_read(apps, schema_editor):
+    # messages sent before read tracking existed are not counted as unread
+    PrivateMessage = apps.get_model('chat', 'PrivateMessage')
+    PrivateMessage.objects.update(is_read=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='privatemessage',
+            name='is_read',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_existing_read, migrations.RunPython.noop),
+    ]
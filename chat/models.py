@@ -19,6 +19,10 @@ class Message(models.Model):
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # keyset pagination of a course room's history
+            models.Index(fields=['course', '-timestamp', '-id'], name='chat_msg_course_ts_idx'),
+        ]
 
     def __str__(self):
         return f'{self.sender.username}: {self.content[:20]}'   
@@ -33,9 +37,15 @@ class PrivateMessage(models.Model):
     
     file = models.FileField(upload_to='chat_files/', blank=True, null=True)
     timestamp = models.DateTimeField(auto_now_add=True)
+    # set once the recipient opened the conversation
+    is_read = models.BooleanField(default=False)
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # keyset pagination of a conversation, each direction is one index range
+            models.Index(fields=['sender', 'recipient', '-timestamp', '-id'], name='chat_pm_pair_ts_idx'),
+        ]
 
     def __str__(self):
         return f"From {self.sender} to {self.recipient}"
\ No newline at end of file
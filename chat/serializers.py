@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from .models import Message, PrivateMessage
+from uploads.fields import ImageVariantsField, MediaUrlField
 
 User = get_user_model()
 
@@ -9,15 +10,18 @@ class ChatUserSnippetSerializer(serializers.ModelSerializer):
     A highly optimized, lightweight serializer for user info in chats.
     Prevents leaking sensitive data (email, role) into the public chat payload.
     """
+    photo_variants = ImageVariantsField(source='photo')
+
     class Meta:
         model = User
-        fields = ['id', 'username', 'photo']
+        fields = ['id', 'username', 'photo', 'photo_variants']
 
 class ChatMessageSerializer(serializers.ModelSerializer):
     """
     Serializer for course group chat history.
     """
     sender_info = ChatUserSnippetSerializer(source='sender', read_only=True)
+    file = MediaUrlField()
     formatted_timestamp = serializers.SerializerMethodField()
 
     class Meta:
@@ -33,6 +37,7 @@ class PrivateMessageSerializer(serializers.ModelSerializer):
     """
     sender_info = ChatUserSnippetSerializer(source='sender', read_only=True)
     recipient_info = ChatUserSnippetSerializer(source='recipient', read_only=True)
+    file = MediaUrlField()
     formatted_timestamp = serializers.SerializerMethodField()
 
     class Meta:
@@ -1,13 +1,32 @@
+import shutil
+import tempfile
 from django.urls import reverse
+from django.test import override_settings
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.core.files.uploadedfile import SimpleUploadedFile
 from users.tests.factories import CustomUserFactory
 from courses.tests.factories import CourseFactory
-from .factories import PrivateMessageFactory
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from rest_framework_simplejwt.tokens import AccessToken
+from chat.middleware import JWTAuthMiddleware
+from chat.models import Message
+from chat.routing import websocket_urlpatterns
+from .factories import PrivateMessageFactory, MessageFactory
 
+TEMP_MEDIA = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA)
 class ChatAPIIntegrationTests(APITestCase):
-    
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA, ignore_errors=True)
+
     def setUp(self):
         self.student = CustomUserFactory(role='student')
         self.hacker = CustomUserFactory(role='student') # Not enrolled
@@ -53,4 +72,61 @@ class ChatAPIIntegrationTests(APITestCase):
         response = self.client.post(url, {'file': mock_image}, format='multipart')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertIn('url', response.data)
-        self.assertEqual(response.data['name'], 'test_image.jpg')
\ No newline at end of file
+        self.assertEqual(response.data['name'], 'test_image.jpg')
+
+    def test_only_own_uploads_can_be_attached(self):
+        """Security: a message cannot attach a stored file its sender did not upload."""
+        self.client.force_authenticate(user=self.teacher)
+        upload = self.client.post(reverse('chat:api_chat_file_upload'), {
+            'file': SimpleUploadedFile('answers.pdf', b'%PDF-1.4 answers', content_type='application/pdf'),
+        }, format='multipart')
+        self.client.force_authenticate(user=self.student)
+        own = self.client.post(reverse('chat:api_chat_file_upload'), {
+            'file': SimpleUploadedFile('notes.pdf', b'%PDF-1.4 notes', content_type='application/pdf'),
+        }, format='multipart')
+
+        async def send(file_url):
+            application = JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+            communicator = WebsocketCommunicator(application, f'/ws/chat/{self.course.id}/?token={AccessToken.for_user(self.student)}')
+            await communicator.connect()
+            await communicator.send_json_to({'message': 'see attached', 'file_url': file_url})
+            reply = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return reply
+
+        for file_url in [upload.data['url'], '/media/files/notes.pdf', '/media/chat_files/../files/notes.pdf']:
+            self.assertEqual(async_to_sync(send)(file_url), {'error': 'Invalid attachment.'})
+        self.assertFalse(Message.objects.exists())
+        reply = async_to_sync(send)(own.data['url'])
+        self.assertEqual(Message.objects.get().file.name, reply['file_url'].split('?')[0].replace('/media/', '', 1))
+
+    def test_course_chat_history_cursor_walks_full_history(self):
+        """Keyset pagination: following `next` returns every message exactly once, newest first."""
+        messages = [MessageFactory(course=self.course, sender=self.student) for _ in range(120)]
+        self.client.force_authenticate(user=self.student)
+        url = reverse('chat:api_course_chat_history', kwargs={'course_id': self.course.id})
+
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 50)
+            seen.extend(message['id'] for message in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(seen, [m.id for m in reversed(messages)])
+
+    def test_private_chat_history_returns_next_cursor(self):
+        """Private history pages are oldest-first for display and expose a cursor to older messages."""
+        for _ in range(55):
+            PrivateMessageFactory(sender=self.student, recipient=self.teacher)
+        self.client.force_authenticate(user=self.student)
+        url = reverse('chat:api_private_chat_history', kwargs={'target_user_id': self.teacher.id})
+
+        first = self.client.get(url)
+        self.assertEqual(len(first.data['messages']), 50)
+        ids = [m['id'] for m in first.data['messages']]
+        self.assertEqual(ids, sorted(ids))
+        older = self.client.get(first.data['next'])
+        self.assertEqual(len(older.data['messages']), 5)
+        self.assertIsNone(older.data['next'])
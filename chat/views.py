@@ -6,21 +6,33 @@ from rest_framework.exceptions import PermissionDenied
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
 from django.db.models import Q
-from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
 from courses.models import Course
 from .models import PrivateMessage, Message
 from .serializers import ChatMessageSerializer, PrivateMessageSerializer
+from config.pagination import KeysetPagination
+from users import counters
+from uploads.fields import variant_urls
+from uploads.tasks import queue_image_variants
+from uploads.blobs import store_blob
+from uploads.delivery import signed_url
 
 User = get_user_model()
 
+class ChatHistoryPagination(KeysetPagination):
+    """
+    50 messages per page, newest first; follow `next` to scroll further back.
+    """
+    page_size = 50
+    timestamp_field = 'timestamp'
+
 class CourseChatHistoryAPIView(generics.ListAPIView):
     """
-    GET /api/chat/courses/<course_id>/history/
-    Retrieve the latest 50 messages for a course chat room.
+    GET /api/chat/courses/<course_id>/history/?cursor=<next>
+    Retrieve the latest 50 messages for a course chat room, older pages through the cursor.
     """
     serializer_class = ChatMessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ChatHistoryPagination
 
     def get_queryset(self):
         course = get_object_or_404(Course, id=self.kwargs['course_id'])
@@ -29,15 +41,17 @@ class CourseChatHistoryAPIView(generics.ListAPIView):
         if self.request.user not in course.students.all() and self.request.user.id != course.owner.id:
             raise PermissionDenied("You do not have access to this course's chat.")
             
-        return course.chat_messages.all().order_by('-timestamp')[:50]
+        return course.chat_messages.select_related('sender')
 
 class PrivateChatHistoryAPIView(generics.ListAPIView):
     """
-    GET /api/chat/private/<target_user_id>/history/
-    Retrieve the latest 50 messages between the current user and a target user.
+    GET /api/chat/private/<target_user_id>/history/?cursor=<next>
+    Retrieve the latest 50 messages between the current user and a target user,
+    older pages through the cursor.
     """
     serializer_class = PrivateMessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ChatHistoryPagination
 
     def get_queryset(self):
         target_user = get_object_or_404(User, id=self.kwargs['target_user_id'])
@@ -49,23 +63,32 @@ class PrivateChatHistoryAPIView(generics.ListAPIView):
         return PrivateMessage.objects.filter(
             Q(sender=self.request.user, recipient=target_user) | 
             Q(sender=target_user, recipient=self.request.user)
-        ).order_by('-timestamp')[:50]
+        ).select_related('sender', 'recipient')
 
     def list(self, request, *args, **kwargs):
         """
         override list method to return chat list and room name for web socket
         """
         queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
         
         target_user_id = self.kwargs['target_user_id']
         user1_id = min(request.user.id, int(target_user_id))
         user2_id = max(request.user.id, int(target_user_id))
         room_name = f"private_{user1_id}_{user2_id}"
 
-        serializer = self.get_serializer(queryset[::-1], many=True)
+        # opening the conversation reads everything the partner sent
+        read = PrivateMessage.objects.filter(
+            sender_id=target_user_id, recipient=request.user, is_read=False
+        ).update(is_read=True)
+        counters.add([request.user.id], 'unread_messages', -read)
+
+        # pages come newest first, the chat window shows them oldest first
+        serializer = self.get_serializer(page[::-1], many=True)
         return Response({
             "room_name": room_name,
-            "messages": serializer.data
+            "messages": serializer.data,
+            "next": self.paginator.get_next_link()
         })
 
 class ChatFileUploadAPIView(APIView):
@@ -82,14 +105,18 @@ class ChatFileUploadAPIView(APIView):
         if not uploaded_file:
             return Response({"error": "No file provided."}, status=status.HTTP_400_BAD_REQUEST)
 
-        file_name = f"chat_files/{request.user.id}_{uploaded_file.name}"
-        path = default_storage.save(file_name, ContentFile(uploaded_file.read()))
-        file_url = default_storage.url(path)
+        # stored once per content under its hash, saved chunk by chunk from the
+        # uploaded file; large files use /api/uploads/sessions/
+        path = store_blob(uploaded_file, 'chat_files', uploaded_file.name, owner=request.user)
+        file_url = signed_url(request.user, path)
+        # images get resized copies for the chat window, other files are left alone
+        queue_image_variants(path)
 
         return Response({
             "status": "ok", 
             "url": file_url, 
-            "name": uploaded_file.name
+            "name": uploaded_file.name,
+            "variants": variant_urls(path, request),
         }, status=status.HTTP_201_CREATED)
 
 class MessageDeleteView(generics.DestroyAPIView):
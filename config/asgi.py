@@ -12,6 +12,7 @@ from django.core.asgi import get_asgi_application
 from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 import chat.routing
+import users.routing
 from chat.middleware import JWTAuthMiddleware
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
@@ -21,7 +22,7 @@ application = ProtocolTypeRouter({
     'http':django_asgi_app,
     'websocket': JWTAuthMiddleware(
         URLRouter(
-            chat.routing.websocket_urlpatterns
+            chat.routing.websocket_urlpatterns + users.routing.websocket_urlpatterns
         )
     )
 })
\ No newline at end of file
@@ -0,0 +1,170 @@
+import json
+import base64
+import heapq
+from collections import OrderedDict
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opaque cursor pagination on (timestamp, id), newest first.
+    Every page is a range scan on a (timestamp, id) index: there is no COUNT(*)
+    and no OFFSET, so the hundredth page costs the same as the first one.
+    Views pick the timestamp column with `cursor_timestamp_field`.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    timestamp_field = 'created'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.timestamp_field = getattr(view, 'cursor_timestamp_field', self.timestamp_field)
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(f'-{self.timestamp_field}', '-id')
+        position = self.decode_cursor(request)
+        if position is not None:
+            timestamp, pk = position
+            queryset = queryset.filter(
+                Q(**{f'{self.timestamp_field}__lt': timestamp}) |
+                Q(**{self.timestamp_field: timestamp, 'id__lt': pk})
+            )
+
+        # one extra row tells whether there is a next page
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.page = rows[:page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(requested, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            timestamp, pk = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            timestamp = parse_datetime(timestamp)
+            if timestamp is None:
+                raise ValueError
+            return timestamp, int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row):
+        position = [getattr(row, self.timestamp_field).isoformat(), row.pk]
+        return base64.urlsafe_b64encode(json.dumps(position).encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Opaque cursor returned in `next`.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+class MergedKeysetPagination(KeysetPagination):
+    """
+    Keyset pagination over several querysets merged into one feed, newest first.
+    Views return the querysets from `get_feed_sources()`; they must share the
+    timestamp column. Rows are ordered by (timestamp, source, id) descending and
+    the cursor carries all three, so each source is still read with one range
+    scan of page_size + 1 rows per page. Every returned row gets a `feed_source`
+    attribute with the index of the queryset it came from.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.timestamp_field = getattr(view, 'cursor_timestamp_field', self.timestamp_field)
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        candidates = []
+        for source, queryset in enumerate(view.get_feed_sources()):
+            queryset = queryset.order_by(f'-{self.timestamp_field}', '-id')
+            if position is not None:
+                queryset = queryset.filter(self.after_position(source, position))
+            for row in queryset[:page_size + 1]:
+                row.feed_source = source
+                candidates.append(row)
+
+        rows = heapq.nlargest(page_size + 1, candidates, key=self.sort_key)
+        self.has_next = len(rows) > page_size
+        self.page = rows[:page_size]
+        return self.page
+
+    def sort_key(self, row):
+        return getattr(row, self.timestamp_field), row.feed_source, row.pk
+
+    def after_position(self, source, position):
+        # rows strictly after (timestamp, last_source, pk) in descending order
+        timestamp, last_source, pk = position
+        older = Q(**{f'{self.timestamp_field}__lt': timestamp})
+        if source < last_source:
+            return older | Q(**{self.timestamp_field: timestamp})
+        if source == last_source:
+            return older | Q(**{self.timestamp_field: timestamp, 'id__lt': pk})
+        return older
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            timestamp, source, pk = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            timestamp = parse_datetime(timestamp)
+            if timestamp is None:
+                raise ValueError
+            return timestamp, int(source), int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row):
+        position = [getattr(row, self.timestamp_field).isoformat(), row.feed_source, row.pk]
+        return base64.urlsafe_b64encode(json.dumps(position).encode('ascii')).decode('ascii')
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 import os
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -39,6 +40,9 @@ X_FRAME_OPTIONS = 'SAMEORIGIN'
 
 # use Docker REDIS_URL, if not found, use local redis address
 redis_url = os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1')
+# shared caches only talk to redis when REDIS_URL is configured (docker-compose),
+# local runs and the test suite keep everything in-process
+USE_REDIS = 'REDIS_URL' in os.environ
 
 # Application definition
 
@@ -61,6 +65,7 @@ INSTALLED_APPS = [
     'courses.apps.CoursesConfig',
     'students.apps.StudentsConfig',
     'chat.apps.ChatConfig',
+    'uploads.apps.UploadsConfig',
 ]
 
 REST_FRAMEWORK = {
@@ -197,5 +202,89 @@ CHANNEL_LAYERS = {
         'CONFIG': {
             "hosts": [redis_url],
         },
+    } if USE_REDIS else {
+        # single process only, enough for local runs and the test suite
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
     },
-}
\ No newline at end of file
+}
+
+# shared cache (redis in docker) plus a small process-local tier in front of it
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': redis_url,
+    } if USE_REDIS else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'elearning-shared',
+    },
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'elearning-local',
+        'TIMEOUT': 60,
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+
+# lifetime of cached public catalog responses, entries are also invalidated on every write
+CATALOG_CACHE_TIMEOUT = 300
+# lifetime of cached completion bitmaps (seconds), dropped on every change of their student
+# and course, the lifetime only bounds a bitmap rebuilt by a read racing a write
+PROGRESS_BITMAP_CACHE_TIMEOUT = 300
+
+# celery: without a broker (tests, local runs) tasks run eagerly in the calling process
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL')
+CELERY_TASK_ALWAYS_EAGER = not CELERY_BROKER_URL
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_TASK_ACKS_LATE = True
+# periodic tasks, run by `celery -A config beat`
+CELERY_BEAT_SCHEDULE = {
+    'update-analytics': {
+        'task': 'courses.tasks.update_analytics',
+        'schedule': timedelta(minutes=10),
+    },
+    'rebuild-recent-analytics': {
+        'task': 'courses.tasks.rebuild_recent_analytics',
+        'schedule': crontab(hour=3, minute=30),
+    },
+}
+
+# teacher analytics rollups: rows younger than this (seconds) wait for the next run
+ANALYTICS_ROLLUP_LAG = int(os.environ.get('ANALYTICS_ROLLUP_LAG', 60))
+# days recounted by the nightly rebuild, catching unenrollments, edited reviews and deleted messages
+ANALYTICS_REBUILD_DAYS = 2
+
+# chunked uploads: chunks are kept on local disk until the upload is completed
+UPLOAD_TEMP_DIR = os.environ.get('UPLOAD_TEMP_DIR', os.path.join(BASE_DIR, 'tmp', 'uploads'))
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_MAX_CHUNK_SIZE = 32 * 1024 * 1024
+UPLOAD_MAX_SIZE = 2 * 1024 * 1024 * 1024
+# unfinished upload sessions older than this are removed by purge_upload_sessions
+UPLOAD_SESSION_TTL_HOURS = 24
+
+# media is served by uploads.views.ProtectedMediaView, which checks access and then
+# hands the transfer to the web server when configured:
+#   'x-accel'    nginx, MEDIA_ROOT exposed as an internal location at MEDIA_ACCEL_PREFIX
+#   'x-sendfile' apache mod_xsendfile / lighttpd
+#   ''           streamed by Django (FileResponse, byte ranges supported)
+MEDIA_ACCEL = os.environ.get('MEDIA_ACCEL', '')
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+# seconds a granted access decision is reused, e.g. for the many range requests of one download
+MEDIA_ACCESS_CACHE_TIMEOUT = 300
+# protected media links carry a token for one file, valid for one to two of these windows (seconds)
+MEDIA_TOKEN_LIFETIME = 60 * 60
+# image variants one client may have rendered on request (the others are served from storage)
+IMAGE_VARIANT_RENDER_RATE = '30/min'
+
+# multipart uploads are hashed while they stream in, see uploads.blobs
+FILE_UPLOAD_HANDLERS = [
+    'uploads.handlers.HashingMemoryFileUploadHandler',
+    'uploads.handlers.HashingTemporaryFileUploadHandler',
+]
+# unreferenced blobs younger than this are kept (an upload about to be attached)
+BLOB_GRACE_HOURS = 24
+
+# content completion is moving from courses.Content.completed_users to
+# students.UserContentProgress (see students.completion):
+#   'dual'       reads both tables, writes both (until backfill_completions finished)
+#   'canonical'  reads and writes UserContentProgress only
+COMPLETION_SOURCE = os.environ.get('COMPLETION_SOURCE', 'dual')
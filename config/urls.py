@@ -15,9 +15,8 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
 # OpenAPI Documentation Views
 from drf_spectacular.views import (
     SpectacularAPIView, 
@@ -26,6 +25,7 @@ from drf_spectacular.views import (
 )
 from rest_framework_simplejwt.views import TokenRefreshView
 from users.views import CustomTokenObtainPairView
+from uploads.views import ProtectedMediaView
 
 urlpatterns = [
     path('api/token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
@@ -38,13 +38,13 @@ urlpatterns = [
     path('api/courses/', include('courses.urls')),
     path('api/students/', include('students.urls')),
     path('api/chat/', include('chat.urls')),
+    path('api/uploads/', include('uploads.urls')),
+
+    # uploaded media, access checked per file (course files, chat attachments)
+    re_path(r'^%s(?P<name>.+)$' % settings.MEDIA_URL.lstrip('/'), ProtectedMediaView.as_view(), name='protected_media'),
 
     # Swagger documentation
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
     path('', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
 ]
-
-# for media files
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from .models import Subject, Course, Module, CourseReview
-from .models import Text, File, Image, Video, Content
+from .models import Text, File, Image, Video, Content, CourseImportJob
 # superuser
 # testing 11234
 
@@ -22,6 +22,9 @@ class CourseAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('title',)}
     inlines = [ModuleInline]
     filter_horizontal = ('co_instructors', 'blocked_students') 
+    # maintained by signals, see courses.ratings
+    readonly_fields = ['review_count', 'rating_sum', 'rating_1_count', 'rating_2_count',
+                       'rating_3_count', 'rating_4_count', 'rating_5_count']
 
 @admin.register(CourseReview)
 class CourseReviewAdmin(admin.ModelAdmin):
@@ -37,4 +40,8 @@ admin.site.register(Text)
 admin.site.register(File)
 admin.site.register(Image)
 admin.site.register(Video)
-    
\ No newline at end of file
+    
+@admin.register(CourseImportJob)
+class CourseImportJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'owner', 'course', 'status', 'progress', 'created']
+    list_filter = ['status']
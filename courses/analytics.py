@@ -0,0 +1,293 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from chat.models import Message
+from students.models import Enrollment, UserContentProgress
+from .models import Module, CourseReview, CourseDailyStats, ModuleDailyStats, RollupWatermark
+
+# teacher analytics are read from daily rollups, never from the activity tables.
+# every append-only source table is added to the rollups in id order past its
+# watermark, the nightly rebuild recounts the last days to catch edits and deletes.
+# completions are a state instead (a synced unmark or re-mark rewrites the row),
+# see roll_up_completions
+SOURCES = {
+    'enrollments': {
+        'rows': lambda: Enrollment.objects.all(),
+        'timestamp': 'date_joined',
+        'course': 'course_id',
+        'field': 'enrollments',
+    },
+    'reviews': {
+        'rows': lambda: CourseReview.objects.all(),
+        'timestamp': 'created',
+        'course': 'course_id',
+        'rating': 'rating',
+        'field': 'reviews',
+    },
+    'messages': {
+        'rows': lambda: Message.objects.all(),
+        'timestamp': 'timestamp',
+        'course': 'course_id',
+        'field': 'messages',
+    },
+}
+COUNTERS = ['enrollments', 'completions', 'reviews', 'messages'] + [f'rating_{rating}_count' for rating in range(1, 6)]
+ROLLUP_BATCH_SIZE = 5000
+
+
+def lock_watermarks(names):
+    ''' the watermarks of some sources, locked until the end of the transaction '''
+    RollupWatermark.objects.bulk_create([RollupWatermark(source=name) for name in names], ignore_conflicts=True)
+    return {
+        watermark.source: watermark
+        for watermark in RollupWatermark.objects.select_for_update().filter(source__in=names).order_by('source')
+    }
+
+
+def count_rows(source, rows):
+    '''
+    one grouped query over rows of a source: {(course id, date): Counter of
+    stats fields}
+    '''
+    keys = {'course_key': F(source['course']), 'day': TruncDate(source['timestamp'])}
+    if 'rating' in source:
+        keys['rating_key'] = F(source['rating'])
+
+    course_counts = defaultdict(Counter)
+    for group in rows.order_by().values(**keys).annotate(n=Count('id')):
+        counts = course_counts[(group['course_key'], group['day'])]
+        counts[source['field']] += group['n']
+        if 'rating_key' in group:
+            counts[f"rating_{group['rating_key']}_count"] += group['n']
+    return course_counts
+
+
+def add_counts(course_counts, module_counts=None):
+    '''
+    add counts (negative ones subtract) to the stats rows, creating the missing
+    days. module_counts is {(module id, course id, date): completions}
+    '''
+    if course_counts:
+        course_ids, dates = {key[0] for key in course_counts}, {key[1] for key in course_counts}
+        existing = {
+            (row.course_id, row.date): row
+            for row in CourseDailyStats.objects.filter(course_id__in=course_ids, date__in=dates)
+        }
+        created = []
+        for (course_id, date), counts in course_counts.items():
+            row = existing.get((course_id, date))
+            if row is None:
+                row = CourseDailyStats(course_id=course_id, date=date)
+                created.append(row)
+            for field, n in counts.items():
+                setattr(row, field, getattr(row, field) + n)
+        CourseDailyStats.objects.bulk_update(list(existing.values()), COUNTERS)
+        CourseDailyStats.objects.bulk_create(created)
+
+    if module_counts:
+        module_ids, dates = {key[0] for key in module_counts}, {key[2] for key in module_counts}
+        existing = {
+            (row.module_id, row.date): row
+            for row in ModuleDailyStats.objects.filter(module_id__in=module_ids, date__in=dates)
+        }
+        created = []
+        for (module_id, course_id, date), n in module_counts.items():
+            row = existing.get((module_id, date))
+            if row is None:
+                row = ModuleDailyStats(module_id=module_id, course_id=course_id, date=date)
+                created.append(row)
+            row.completions += n
+        ModuleDailyStats.objects.bulk_update(list(existing.values()), ['completions'])
+        ModuleDailyStats.objects.bulk_create(created)
+
+
+def roll_up(name, batch_size=ROLLUP_BATCH_SIZE):
+    '''
+    add the rows of a source past its watermark to the stats, a batch per
+    transaction that also moves the watermark, so a row is counted once even
+    when runs overlap or stop halfway. rows younger than ANALYTICS_ROLLUP_LAG
+    are left for the next run, a transaction committing late can still hold a
+    lower id. a batch stops at the first of them, the watermark never moves
+    past a row that was not counted. returns the number of rows added
+    '''
+    source = SOURCES[name]
+    cutoff = timezone.now() - timedelta(seconds=settings.ANALYTICS_ROLLUP_LAG)
+    added = 0
+    while True:
+        with transaction.atomic():
+            watermark = lock_watermarks([name])[name]
+            rows = source['rows']().filter(id__gt=watermark.position)
+            first_recent = (
+                rows.filter(**{f"{source['timestamp']}__gte": cutoff}).order_by('id').values_list('id', flat=True).first()
+            )
+            if first_recent is not None:
+                rows = rows.filter(id__lt=first_recent)
+            ids = list(rows.order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return added
+            batch = rows.filter(id__lte=ids[-1])
+            add_counts(count_rows(source, batch))
+            added += batch.count()
+            watermark.position = ids[-1]
+            watermark.save(update_fields=['position', 'updated'])
+        if len(ids) < batch_size:
+            return added
+
+
+def roll_up_completion_batch(batch_size):
+    '''
+    move the completions of a batch of flagged progress rows: out of the day
+    they were counted on, into the day of their changed_at when completed.
+    must run inside a transaction. returns the number of rows
+    '''
+    rows = list(
+        UserContentProgress.objects.select_for_update(of=('self',)).filter(rolled_up=False).order_by('id')
+        .values('id', 'completed', 'changed_at', 'counted_on', 'content__module_id', 'content__module__course_id')[:batch_size]
+    )
+    course_counts = defaultdict(Counter)
+    module_counts = Counter()
+    counted_on = defaultdict(list)
+    for row in rows:
+        course_id, module_id = row['content__module__course_id'], row['content__module_id']
+        if row['counted_on'] is not None:
+            course_counts[(course_id, row['counted_on'])]['completions'] -= 1
+            module_counts[(module_id, course_id, row['counted_on'])] -= 1
+        day = timezone.localdate(row['changed_at']) if row['completed'] else None
+        if day is not None:
+            course_counts[(course_id, day)]['completions'] += 1
+            module_counts[(module_id, course_id, day)] += 1
+        counted_on[day].append(row['id'])
+    add_counts(course_counts, module_counts)
+    for day, ids in counted_on.items():
+        UserContentProgress.objects.filter(id__in=ids).update(rolled_up=True, counted_on=day)
+    return len(rows)
+
+
+def roll_up_completions(batch_size=ROLLUP_BATCH_SIZE):
+    '''
+    completions are counted on the day of their last change. every write of a
+    progress row clears its rolled_up flag, so marks, unmarks and revived
+    tombstones are all seen, whatever their id, and a row committed late is
+    never skipped. returns the number of rows rolled up
+    '''
+    rolled_up = 0
+    while True:
+        with transaction.atomic():
+            # serializes the runs, like the other sources
+            lock_watermarks(['completions'])
+            done = roll_up_completion_batch(batch_size)
+        rolled_up += done
+        if done < batch_size:
+            return rolled_up
+
+
+def update_rollups():
+    ''' roll up every source, returns {source: rows added} '''
+    added = {name: roll_up(name) for name in SOURCES}
+    added['completions'] = roll_up_completions()
+    return added
+
+
+def recount_ratings(watermark, until, course_ids=None):
+    '''
+    recount the rating distribution of the days before until, which rebuild
+    does not delete. the review counts of those days are kept
+    '''
+    rating_fields = [f'rating_{rating}_count' for rating in range(1, 6)]
+    stats = CourseDailyStats.objects.filter(date__lt=until)
+    rows = SOURCES['reviews']['rows']().filter(id__lte=watermark.position, created__date__lt=until)
+    if course_ids is not None:
+        stats, rows = stats.filter(course_id__in=course_ids), rows.filter(course_id__in=course_ids)
+    stats.update(**{field: 0 for field in rating_fields})
+    course_counts = count_rows(SOURCES['reviews'], rows)
+    for counts in course_counts.values():
+        del counts['reviews']
+    add_counts(course_counts)
+
+
+def rebuild_rollups(since=None, course_ids=None):
+    '''
+    recount the stats from the source tables, from the date since (everything
+    when None), of some courses or all of them. only rows behind the
+    watermarks are counted, the newer ones are still added by roll_up.
+    completions are recounted from the day their rows are counted on, after
+    rolling up the flagged rows. a rating can be edited long after its review
+    was created, so the rating distribution is recounted on every day
+    '''
+    with transaction.atomic():
+        watermarks = lock_watermarks(list(SOURCES) + ['completions'])
+        while roll_up_completion_batch(ROLLUP_BATCH_SIZE) == ROLLUP_BATCH_SIZE:
+            pass
+        stats = CourseDailyStats.objects.all()
+        module_stats = ModuleDailyStats.objects.all()
+        if since is not None:
+            stats, module_stats = stats.filter(date__gte=since), module_stats.filter(date__gte=since)
+        if course_ids is not None:
+            stats, module_stats = stats.filter(course_id__in=course_ids), module_stats.filter(course_id__in=course_ids)
+        stats.delete()
+        module_stats.delete()
+
+        for name, source in SOURCES.items():
+            rows = source['rows']().filter(id__lte=watermarks[name].position)
+            if since is not None:
+                rows = rows.filter(**{f"{source['timestamp']}__date__gte": since})
+            if course_ids is not None:
+                rows = rows.filter(**{f"{source['course']}__in": course_ids})
+            add_counts(count_rows(source, rows))
+
+        if since is not None:
+            recount_ratings(watermarks['reviews'], since, course_ids)
+
+        completed = UserContentProgress.objects.filter(counted_on__isnull=False)
+        if since is not None:
+            completed = completed.filter(counted_on__gte=since)
+        if course_ids is not None:
+            completed = completed.filter(content__module__course_id__in=course_ids)
+        course_counts = defaultdict(Counter)
+        module_counts = Counter()
+        groups = completed.order_by().values('counted_on', 'content__module_id', 'content__module__course_id').annotate(n=Count('id'))
+        for group in groups:
+            course_id, day = group['content__module__course_id'], group['counted_on']
+            course_counts[(course_id, day)]['completions'] += group['n']
+            module_counts[(group['content__module_id'], course_id, day)] += group['n']
+        add_counts(course_counts, module_counts)
+
+
+def course_analytics(course, start, end):
+    '''
+    analytics of a course between two dates (included), from the rollups only:
+    activity per day, totals, review distribution and completions per module
+    '''
+    stats = CourseDailyStats.objects.filter(course=course, date__range=(start, end))
+    totals = stats.aggregate(**{field: Sum(field) for field in COUNTERS})
+    by_date = {row['date']: row for row in stats.values('date', 'enrollments', 'completions', 'reviews', 'messages')}
+    empty = {'enrollments': 0, 'completions': 0, 'reviews': 0, 'messages': 0}
+    daily = []
+    for offset in range((end - start).days + 1):
+        date = start + timedelta(days=offset)
+        daily.append(by_date.get(date, {**empty, 'date': date}))
+
+    completions = dict(
+        ModuleDailyStats.objects.filter(course=course, date__range=(start, end))
+        .values('module_id').annotate(n=Sum('completions')).values_list('module_id', 'n')
+    )
+    modules = [
+        {'module_id': module_id, 'title': title, 'completions': completions.get(module_id, 0)}
+        for module_id, title in Module.objects.filter(course=course).order_by('order').values_list('id', 'title')
+    ]
+    updated = RollupWatermark.objects.order_by('updated').values_list('updated', flat=True).first()
+
+    return {
+        'course': course.pk,
+        'start': start,
+        'end': end,
+        'updated': updated,
+        'totals': {field: totals[field] or 0 for field in empty},
+        'review_distribution': {str(rating): totals[f'rating_{rating}_count'] or 0 for rating in range(1, 6)},
+        'daily': daily,
+        'modules': modules,
+    }
@@ -0,0 +1,147 @@
+import os
+import json
+import zipfile
+import logging
+from itertools import islice
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from .models import Module, Content, Text, Video, Image, File
+from .loaders import resolve_content_items
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMAT = 'elearning-course'
+EXPORT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+# contents loaded (and their items resolved) per query while exporting
+EXPORT_BATCH_SIZE = 200
+# bytes copied from storage into the archive at a time
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+class StreamBuffer:
+    '''
+    write-only file object for zipfile: collects what the archive writes until
+    the stream drains it. it has no seek(), so zipfile writes data descriptors
+    instead of going back to patch local headers, and never needs the whole file
+    '''
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offset = 0
+
+    def write(self, data):
+        self.buffer += data
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def item_entry(item):
+    ''' manifest fields of a Text/Video/Image/File item, without the media path '''
+    if isinstance(item, Text):
+        return {'type': 'text', 'title': item.title, 'content': item.content}
+    if isinstance(item, Video):
+        return {'type': 'video', 'title': item.title, 'url': item.url}
+    if isinstance(item, Image):
+        return {'type': 'image', 'title': item.title}
+    if isinstance(item, File):
+        return {'type': 'file', 'title': item.title}
+    return None
+
+
+def media_arcname(prefix, name):
+    return f'media/{prefix}/{os.path.basename(name)}'
+
+
+def iter_contents(course):
+    ''' contents of the course in display order, items resolved one batch at a time '''
+    contents = Content.objects.filter(module__course=course).order_by('module__order', 'module_id', 'order', 'id')
+    iterator = contents.iterator(chunk_size=EXPORT_BATCH_SIZE)
+    while True:
+        batch = list(islice(iterator, EXPORT_BATCH_SIZE))
+        if not batch:
+            return
+        yield from resolve_content_items(batch)
+
+
+def copy_media(archive, out, name, arcname):
+    '''
+    copy a stored file into the archive block by block, yielding the archive
+    bytes produced so far after every block
+    '''
+    # media is already compressed (pdf, zip, images), store it as is
+    info = zipfile.ZipInfo(arcname, date_time=timezone.localtime().timetuple()[:6])
+    info.compress_type = zipfile.ZIP_STORED
+    with default_storage.open(name, 'rb') as source, archive.open(info, mode='w', force_zip64=True) as target:
+        while block := source.read(COPY_BLOCK_SIZE):
+            target.write(block)
+            yield out.drain()
+
+
+def stream_course_export(course):
+    '''
+    yield a ZIP archive of the course as it is written: the media files of its
+    contents and a manifest.json describing the course, its modules and their
+    ordered contents (written last, media paths are only known by then).
+    memory use is one copy block plus the manifest, whatever the size of the media
+    '''
+    out = StreamBuffer()
+    archive = zipfile.ZipFile(out, mode='w', compression=zipfile.ZIP_DEFLATED, allowZip64=True)
+
+    manifest = {
+        'format': EXPORT_FORMAT,
+        'version': EXPORT_VERSION,
+        'exported_at': timezone.now().isoformat(),
+        'course': {
+            'title': course.title,
+            'overview': course.overview,
+            'course_code': course.course_code,
+            'subject': {'title': course.subject.title, 'slug': course.subject.slug},
+            'image': None,
+        },
+        'modules': [],
+    }
+
+    def media(name, prefix):
+        '''archive name of a stored file, None (and nothing to copy) when it is missing'''
+        if name and default_storage.exists(name):
+            return media_arcname(prefix, name)
+        logger.warning(f"Export of course {course.pk}: media '{name}' is missing, skipped.")
+        return None
+
+    modules = {}
+    for module in Module.objects.filter(course=course).order_by('order', 'id'):
+        modules[module.pk] = {'title': module.title, 'description': module.description, 'order': module.order, 'contents': []}
+        manifest['modules'].append(modules[module.pk])
+
+    arcname = media(course.image.name if course.image else None, 'course')
+    if arcname:
+        yield from copy_media(archive, out, course.image.name, arcname)
+        manifest['course']['image'] = arcname
+
+    for content in iter_contents(course):
+        entry = item_entry(content.item)
+        if entry is None:
+            continue
+        entry['order'] = content.order
+        if entry['type'] in ('image', 'file'):
+            entry['file'] = media(content.item.file.name, content.pk)
+            # an image or file without its media cannot be imported, the item is left out
+            if entry['file'] is None:
+                continue
+            yield from copy_media(archive, out, content.item.file.name, entry['file'])
+        modules[content.module_id]['contents'].append(entry)
+
+    archive.writestr(MANIFEST_NAME, json.dumps(manifest, indent=2, ensure_ascii=False))
+    archive.close()
+    yield out.drain()
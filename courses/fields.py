@@ -1,15 +1,21 @@
-from django.db import models
+from django.db import models, transaction, router
 from django.db.models import Max
 
 class OrderField(models.PositiveIntegerField):
     """
-    A custom field that automatically assigns an order value based on 
+    A custom field that automatically assigns an order value based on
     the maximum existing value within a specific subset of objects.
     """
     def __init__(self, for_fields=None, *args, **kwargs):
         self.for_fields = for_fields
         super().__init__(*args, **kwargs)
 
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.for_fields:
+            kwargs['for_fields'] = self.for_fields
+        return name, path, args, kwargs
+
     def pre_save(self, model_instance, add):
         """
         Calculates the order value before saving the object to the database.
@@ -19,20 +25,42 @@ class OrderField(models.PositiveIntegerField):
             qs = self.model.objects.all()
             if self.for_fields:
                 # Filter by related fields (e.g., all modules within the same course)
-                query = {field: getattr(model_instance, field) for field in self.for_fields}
+                query = {}
+                for field_name in self.for_fields:
+                    attname = self.model._meta.get_field(field_name).attname
+                    query[attname] = getattr(model_instance, attname)
                 qs = qs.filter(**query)
-            
+                self.lock_parents(model_instance)
+
             # use Max() aggregation instead of fetching the object.
             last_item = qs.aggregate(max_value=Max(self.attname))
-            
+
             if last_item['max_value'] is not None:
                 value = last_item['max_value'] + 1
             else:
                 # If it's the first item, start at 0
                 value = 0
-            
+
             # Assign the calculated value to the instance
             setattr(model_instance, self.attname, value)
             return value
         else:
-            return super().pre_save(model_instance, add)
\ No newline at end of file
+            return super().pre_save(model_instance, add)
+
+    def lock_parents(self, model_instance):
+        """
+        Locks the parent rows (e.g. the course of a module) with SELECT ... FOR UPDATE,
+        so concurrent appends and bulk reorders of the same parent run one after another
+        and never read the same Max(). Only possible inside a transaction, callers that
+        append concurrently should save within transaction.atomic().
+        """
+        using = router.db_for_write(self.model, instance=model_instance)
+        if not transaction.get_connection(using).in_atomic_block:
+            return
+        for field_name in self.for_fields:
+            field = self.model._meta.get_field(field_name)
+            if field.is_relation:
+                parent_model = field.remote_field.model
+                parent_model._default_manager.using(using).select_for_update().filter(
+                    pk=getattr(model_instance, field.attname)
+                ).exists()
@@ -0,0 +1,262 @@
+import os
+import json
+import zipfile
+import logging
+from collections import Counter
+from django.core.files import File as DjangoFile
+from django.core.files.storage import default_storage
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Max
+from users.models import Notification, Announcement
+from uploads.blobs import store_blob, change_refs_many
+from uploads.tasks import queue_image_variants
+from students import progress
+from .models import Subject, Course, Module, Content, Text, Video, Image, File, CourseImportJob
+from .exports import EXPORT_FORMAT, EXPORT_VERSION, MANIFEST_NAME
+from .slugs import UniqueValueAllocator
+from .response_cache import bump_versions, course_scope
+from . import search
+
+logger = logging.getLogger(__name__)
+
+ITEM_MODELS = {'text': Text, 'video': Video, 'image': Image, 'file': File}
+# blob folder of the media of each item type
+MEDIA_FOLDERS = {'image': 'images', 'file': 'files'}
+FILE_EXTENSIONS = ('.pdf', '.zip')
+# share of the progress spent storing media, the database writes take the rest
+MEDIA_PROGRESS = 90
+# archives uploaded for an import, deleted when it finished. archives sent through
+# the chunked upload protocol are blobs and left to the blob garbage collection
+IMPORT_FOLDER = 'imports'
+
+
+class CourseImportError(Exception):
+    pass
+
+
+def read_manifest(archive):
+    ''' load and check the manifest.json of an export archive '''
+    try:
+        manifest = json.loads(archive.read(MANIFEST_NAME))
+    except KeyError:
+        raise CourseImportError(f"The archive has no {MANIFEST_NAME}.")
+    except ValueError:
+        raise CourseImportError(f"{MANIFEST_NAME} is not valid JSON.")
+    if not isinstance(manifest, dict) or manifest.get('format') != EXPORT_FORMAT:
+        raise CourseImportError("The archive is not a course export.")
+    if manifest.get('version') != EXPORT_VERSION:
+        raise CourseImportError(f"Unsupported export version {manifest.get('version')}.")
+
+    course = manifest.get('course')
+    if not isinstance(course, dict) or not course.get('title'):
+        raise CourseImportError("The manifest has no course title.")
+    names = set(archive.namelist())
+    modules = manifest.get('modules') or []
+    if not isinstance(modules, list):
+        raise CourseImportError("The manifest modules must be a list.")
+    for module in modules:
+        if not isinstance(module, dict) or not isinstance(module.get('title'), str) or not module['title']:
+            raise CourseImportError("Every module needs a title.")
+        contents = module.get('contents') or []
+        if not isinstance(contents, list):
+            raise CourseImportError(f"The contents of module '{module['title']}' must be a list.")
+        for entry in contents:
+            if not isinstance(entry, dict):
+                raise CourseImportError(f"Module '{module['title']}' has an invalid content.")
+            kind = entry.get('type')
+            if kind not in ITEM_MODELS:
+                raise CourseImportError(f"Unknown content type '{kind}'.")
+            if not isinstance(entry.get('title'), str) or not entry['title']:
+                raise CourseImportError(f"A {kind} in module '{module['title']}' has no title.")
+            # orders are sorted against each other, bool is an int but not an order
+            order = entry.get('order', 0)
+            if not isinstance(order, int) or isinstance(order, bool):
+                raise CourseImportError(f"'{entry['title']}' has an invalid order.")
+            media = entry.get('file')
+            if kind in MEDIA_FOLDERS and (not isinstance(media, str) or media not in names):
+                raise CourseImportError(f"Media '{media}' of '{entry['title']}' is missing from the archive.")
+            if kind == 'file' and not media.lower().endswith(FILE_EXTENSIONS):
+                raise CourseImportError(f"'{entry['title']}' must be a PDF or ZIP file.")
+    if course.get('image') and course['image'] not in names:
+        raise CourseImportError(f"Course image '{course['image']}' is missing from the archive.")
+    return manifest
+
+
+def archive_file(archive, arcname):
+    ''' a django File reading one member of the archive '''
+    info = archive.getinfo(arcname)
+    file = DjangoFile(archive.open(info), name=os.path.basename(arcname))
+    file.size = info.file_size
+    return file
+
+
+def set_progress(job, progress, **fields):
+    # a plain UPDATE, visible to the status endpoint while the job runs
+    job.progress = progress
+    for name, value in fields.items():
+        setattr(job, name, value)
+    CourseImportJob.objects.filter(pk=job.pk).update(progress=progress, **fields)
+
+
+def store_media(archive, manifest, job):
+    '''
+    copy the media of the archive into storage before the database transaction,
+    so the transaction stays short. media goes into the content-addressed blob
+    store, a file imported twice is stored once.
+    returns {arcname: storage name}
+    '''
+    entries = [
+        (entry['file'], MEDIA_FOLDERS[entry['type']])
+        for module in manifest.get('modules') or []
+        for entry in module.get('contents') or []
+        if entry['type'] in MEDIA_FOLDERS
+    ]
+    stored = {}
+    image = manifest['course'].get('image')
+    total = len(entries) + bool(image)
+    if image:
+        with archive_file(archive, image) as file:
+            stored[image] = default_storage.save(f'course_images/{file.name}', file)
+        set_progress(job, MEDIA_PROGRESS // total)
+    for done, (arcname, folder) in enumerate(entries, start=len(stored) + 1):
+        if arcname not in stored:
+            with archive_file(archive, arcname) as file:
+                stored[arcname] = store_blob(file, folder, file.name, owner=job.owner)
+        set_progress(job, MEDIA_PROGRESS * done // total)
+    return stored
+
+
+def build_course(job, manifest, stored):
+    '''
+    create the course (or append to job.course), its modules, items and contents
+    with one bulk_create per model. orders are assigned here instead of by
+    OrderField, so nothing is read back row by row.
+    must run inside a transaction
+    '''
+    data = manifest['course']
+    course = job.course
+    if course is None:
+        subject_data = data.get('subject') or {}
+        subject, _ = Subject.objects.get_or_create(
+            slug=subject_data.get('slug') or 'imported',
+            defaults={'title': subject_data.get('title') or 'Imported'},
+        )
+        course = Course(
+            owner=job.owner,
+            subject=subject,
+            title=data['title'],
+            overview=data.get('overview') or '',
+            course_code=UniqueValueAllocator(Course, 'course_code').allocate(data.get('course_code') or 'IMPORT'),
+            image=stored.get(data.get('image')),
+        )
+        course.save()
+        first_order = 0
+    else:
+        # lock the course so concurrent module appends do not take the same orders
+        Course.objects.select_for_update().filter(pk=course.pk).exists()
+        last_order = course.modules.aggregate(max_value=Max('order'))['max_value']
+        first_order = 0 if last_order is None else last_order + 1
+
+    module_entries = manifest.get('modules') or []
+    modules = Module.objects.bulk_create([
+        Module(course=course, title=entry['title'], description=entry.get('description') or '', order=first_order + position)
+        for position, entry in enumerate(module_entries)
+    ])
+
+    # items grouped per type, each remembering the module and position of its content
+    items = {kind: [] for kind in ITEM_MODELS}
+    placements = {kind: [] for kind in ITEM_MODELS}
+    for module, module_entry in zip(modules, module_entries):
+        entries = sorted(module_entry.get('contents') or [], key=lambda entry: entry.get('order', 0))
+        for position, entry in enumerate(entries):
+            kind = entry['type']
+            fields = {'owner': job.owner, 'title': entry['title']}
+            if kind == 'text':
+                fields['content'] = entry.get('content') or ''
+            elif kind == 'video':
+                fields['url'] = entry.get('url') or ''
+            else:
+                fields['file'] = stored[entry['file']]
+            items[kind].append(ITEM_MODELS[kind](**fields))
+            placements[kind].append((module, position))
+
+    contents = []
+    blob_refs = Counter()
+    for kind, model in ITEM_MODELS.items():
+        if not items[kind]:
+            continue
+        content_type = ContentType.objects.get_for_model(model)
+        for item, (module, position) in zip(model.objects.bulk_create(items[kind]), placements[kind]):
+            contents.append(Content(module=module, content_type=content_type, object_id=item.pk, order=position))
+            if kind in MEDIA_FOLDERS:
+                blob_refs[item.file.name] += 1
+    # bulk_create skips Content.save, reserve the completion ordinals at once
+    for content, ordinal in zip(contents, Course.allocate_ordinals(course.pk, len(contents))):
+        content.ordinal = ordinal
+    Content.objects.bulk_create(contents)
+
+    # bulk_create skips the signals, do what they would have done once for the batch
+    change_refs_many(blob_refs)
+    progress.content_added(course.pk, len(contents))
+    for image in items['image']:
+        queue_image_variants(image.file.name)
+    search.index_course(course.pk)
+    bump_versions([course_scope(course.pk), 'catalog'])
+    return course, len(modules), len(contents)
+
+
+def notify_import(job, course, new_course, module_count, content_count):
+    '''
+    one summary event for the whole import instead of one per content:
+    a notification for the teacher and, when the course already had
+    students, a single announcement for them
+    '''
+    summary = f"{module_count} module(s) and {content_count} content item(s)"
+    Notification.objects.create(
+        recipient=job.owner,
+        title="Course import finished",
+        message=f"Imported {summary} into '{course.title}'.",
+        link=f"/courses/{course.pk}/edit",
+    )
+    if not new_course and content_count and course.students.exists():
+        Announcement.objects.create(
+            course=course,
+            event_key=f'import:{job.pk}',
+            title="New Course Material!",
+            message=f"Teacher {job.owner.username} just added {summary} to '{course.title}'.",
+            link=f"/student/course/{course.pk}",
+        )
+
+
+def run_import(job):
+    '''
+    import the archive of a job: media first, then every row in one transaction.
+    the job row records the progress, the outcome and the course
+    '''
+    set_progress(job, 0, status='running', message='')
+    try:
+        with default_storage.open(job.archive, 'rb') as source, zipfile.ZipFile(source) as archive:
+            manifest = read_manifest(archive)
+            stored = store_media(archive, manifest, job)
+        new_course = job.course is None
+        with transaction.atomic():
+            course, module_count, content_count = build_course(job, manifest, stored)
+            notify_import(job, course, new_course, module_count, content_count)
+    except (CourseImportError, zipfile.BadZipFile) as e:
+        logger.warning(f"Course import {job.pk} failed: {e}")
+        set_progress(job, job.progress, status='failed', message=str(e))
+        return None
+    except Exception:
+        # a storage or database error must not leave the job running forever
+        logger.exception(f"Course import {job.pk} failed unexpectedly.")
+        set_progress(job, job.progress, status='failed', message="The import failed, please try again later.")
+        return None
+    finally:
+        if job.archive.startswith(f'{IMPORT_FOLDER}/'):
+            default_storage.delete(job.archive)
+
+    set_progress(job, 100, status='done', course=course,
+                 message=f"Imported {module_count} module(s) and {content_count} content item(s).")
+    logger.info(f"Course import {job.pk} created {content_count} contents in course {course.pk}.")
+    return course
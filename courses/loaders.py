@@ -0,0 +1,30 @@
+from collections import defaultdict
+from django.contrib.contenttypes.models import ContentType
+from .models import Content
+
+
+def resolve_content_items(contents):
+    '''
+    load the generic item of every Content row in one query per content type
+    (Text, Video, Image, File) instead of one query per row.
+    the loaded items are stored in the GenericForeignKey cache, so serializers
+    reading content.item afterwards do not touch the database again
+    '''
+    contents = list(contents)
+    ids_by_type = defaultdict(set)
+    for content in contents:
+        ids_by_type[content.content_type_id].add(content.object_id)
+
+    items = {}
+    for content_type_id, object_ids in ids_by_type.items():
+        # get_for_id is served from the ContentType cache after the first lookup
+        model_class = ContentType.objects.get_for_id(content_type_id).model_class()
+        for pk, item in model_class.objects.in_bulk(object_ids).items():
+            items[(content_type_id, pk)] = item
+
+    item_field = Content._meta.get_field('item')
+    for content in contents:
+        # missing items are cached as None so they are not looked up again
+        item_field.set_cached_value(content, items.get((content.content_type_id, content.object_id)))
+    return contents
+
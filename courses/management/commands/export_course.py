@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from courses.models import Course
+from courses.exports import stream_course_export
+
+
+class Command(BaseCommand):
+    help = 'Export a course (modules, contents and media) as a ZIP archive with a manifest'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_id', type=int)
+        parser.add_argument('output', help='path of the ZIP file to write')
+
+    def handle(self, *args, **options):
+        course = Course.objects.select_related('subject').filter(pk=options['course_id']).first()
+        if course is None:
+            raise CommandError(f"Course {options['course_id']} does not exist.")
+        written = 0
+        with open(options['output'], 'wb') as output:
+            for block in stream_course_export(course):
+                output.write(block)
+                written += len(block)
+        self.stdout.write(self.style.SUCCESS(f"Exported '{course.title}' to {options['output']} ({written} bytes)."))
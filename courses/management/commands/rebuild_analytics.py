@@ -0,0 +1,23 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from courses.analytics import rebuild_rollups, update_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recount the teacher analytics rollups from the activity tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='first day to recount (YYYY-MM-DD), everything by default')
+        parser.add_argument('--course', type=int, action='append', dest='courses', help='course id, can be repeated')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError(f"Invalid date '{options['since']}'.")
+        # add the rows past the watermarks first, the rebuild only counts rows behind them
+        update_rollups()
+        rebuild_rollups(since=since, course_ids=options['courses'])
+        self.stdout.write(self.style.SUCCESS("Analytics rollups rebuilt."))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from courses.models import Course
+from courses.ratings import rebuild_rating_aggregates
+from courses.response_cache import bump_versions, course_scope
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the stored review count, rating sum and star histogram of courses from their reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='*', type=int, help='only rebuild these courses (default: all)')
+
+    def handle(self, *args, **options):
+        queryset = Course.objects.all()
+        if options['course_ids']:
+            queryset = queryset.filter(pk__in=options['course_ids'])
+        updated = rebuild_rating_aggregates(queryset)
+        # the UPDATE bypasses signals, drop the cached pages showing ratings
+        bump_versions(['catalog'] + [course_scope(pk) for pk in queryset.values_list('pk', flat=True)])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates for {updated} course(s).'))
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:46
+
+import courses.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0006_course_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='order_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='module',
+            name='order_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='content',
+            name='order',
+            field=courses.fields.OrderField(blank=True, for_fields=['module']),
+        ),
+        migrations.AlterField(
+            model_name='module',
+            name='order',
+            field=courses.fields.OrderField(blank=True, for_fields=['course']),
+        ),
+    ]
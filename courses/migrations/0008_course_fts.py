@@ -0,0 +1,44 @@
+from django.db import migrations
+
+
+FTS_TABLE = 'courses_course_fts'
+
+
+def create_fts_index(apps, schema_editor):
+    '''
+    SQLite only: create the FTS5 table behind the catalog search and fill it
+    with the existing courses. other backends keep the icontains search
+    '''
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+        'title, overview, subject, modules, course_code, '
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    Course = apps.get_model('courses', 'Course')
+    Module = apps.get_model('courses', 'Module')
+    for course in Course.objects.select_related('subject').iterator(chunk_size=500):
+        module_titles = ' '.join(Module.objects.filter(course=course).values_list('title', flat=True))
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, overview, subject, modules, course_code) '
+            'VALUES (%s, %s, %s, %s, %s, %s)',
+            [course.pk, course.title, course.overview, course.subject.title, module_titles, course.course_code],
+        )
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_ordering_versions'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-17 21:05
+
+from django.db import migrations, models
+
+
+def assign_ordinals(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    Content = apps.get_model('courses', 'Content')
+    # existing contents get their current display position, course by course
+    for course_id in Course.objects.values_list('pk', flat=True).iterator():
+        contents = list(Content.objects.filter(module__course_id=course_id).order_by('module__order', 'module_id', 'order', 'id'))
+        for ordinal, content in enumerate(contents):
+            content.ordinal = ordinal
+        Content.objects.bulk_update(contents, ['ordinal'], batch_size=1000)
+        Course.objects.filter(pk=course_id).update(next_ordinal=len(contents))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_course_import_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='next_ordinal',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='content',
+            name='ordinal',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(assign_ordinals, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='content',
+            name='ordinal',
+            field=models.PositiveIntegerField(blank=True),
+        ),
+    ]
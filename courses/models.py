@@ -1,10 +1,11 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.utils.text import slugify
 from django.core.validators import FileExtensionValidator
 from .fields import OrderField
+from .slugs import UniqueValueAllocator
 
 # Create your models here.
 class Subject(models.Model):
@@ -46,37 +47,91 @@ class Course(models.Model):
     image = models.ImageField(upload_to='course_images/', blank=True, null=True)
     overview = models.TextField()
     created = models.DateTimeField(auto_now_add=True)
+    # bumped on every bulk reorder of the modules, used to detect concurrent edits
+    order_version = models.PositiveIntegerField(default=0)
+    # next Content.ordinal handed out in this course, ordinals are never reused
+    next_ordinal = models.PositiveIntegerField(default=0)
+
+    # denormalised review aggregates, kept in sync by courses.signals
+    # and rebuilt from scratch with `manage.py rebuild_course_ratings`
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    # star histogram, one counter per rating value
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ['-created']
 
+    # how often save() picks a new slug when a concurrent save took the allocated one
+    SLUG_ALLOCATION_ATTEMPTS = 3
+
     def save(self,*args, **kwargs):
         '''
         automatically generate a unique slug based on the
         course title if doesn't already exist
         '''
-        if not self.slug:
-            self.slug = slugify(self.title)
-            original_slug = self.slug
-            counter = 1
-            # check for collisions and append a number until the slug is unique
-            while Course.objects.filter(slug=self.slug).exists():
-                self.slug = f'{original_slug}-{counter}'
-                counter +=1
-        
-        super().save(*args, **kwargs)
+        if self.slug:
+            return super().save(*args, **kwargs)
+
+        for attempt in range(self.SLUG_ALLOCATION_ATTEMPTS):
+            # the next free suffix is found with one query
+            self.slug = UniqueValueAllocator(Course, 'slug').allocate(self.slug_base())
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                # retry only when another save raced us to the same slug
+                slug_taken = Course.objects.filter(slug=self.slug).exists()
+                self.slug = ''
+                if not slug_taken or attempt == self.SLUG_ALLOCATION_ATTEMPTS - 1:
+                    raise
+
+    @classmethod
+    def allocate_ordinals(cls, course_id, count=1):
+        '''
+        reserve count consecutive content ordinals of a course and return them.
+        the UPDATE locks the course row until the caller's transaction ends,
+        concurrent allocations in the same course never get the same ordinal
+        '''
+        with transaction.atomic():
+            cls.objects.filter(pk=course_id).update(next_ordinal=models.F('next_ordinal') + count)
+            end = cls.objects.filter(pk=course_id).values_list('next_ordinal', flat=True).get()
+        return range(end - count, end)
+
+    def slug_base(self):
+        return slugify(self.title) or 'course'
+
+    @classmethod
+    def assign_unique_slugs(cls, courses):
+        '''
+        fill in unique slugs for unsaved courses before bulk_create,
+        using one query per distinct title instead of one per collision
+        '''
+        allocator = UniqueValueAllocator(cls, 'slug')
+        for course in courses:
+            if not course.slug:
+                course.slug = allocator.allocate(course.slug_base())
+        return courses
     
     def average_rating(self):
         '''
-        Calculates and returns the average star rating for all related CourseReview
+        Returns the average star rating from the stored review aggregates
         0 means there are not review yet 
         '''
-        reviews = self.reviews.all()
-        if reviews.exists():
-            total = sum([r.rating for r in reviews])
-            return round(total /reviews.count(), 1)
+        if self.review_count:
+            return round(self.rating_sum / self.review_count, 1)
         return 0
 
+    def rating_histogram(self):
+        '''
+        Returns the number of reviews for each star value, {1: n, ..., 5: n}
+        '''
+        return {star: getattr(self, f'rating_{star}_count') for star in range(1, 6)}
+
     def __str__(self):
         return self.title
     
@@ -87,7 +142,10 @@ class Module(models.Model):
     course = models.ForeignKey(Course,related_name='modules',on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
-    order = models.PositiveIntegerField(default=0)
+    # appended after the last module of the course when not given
+    order = OrderField(blank=True, for_fields=['course'])
+    # bumped on every bulk reorder of the contents, used to detect concurrent edits
+    order_version = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ['order']
@@ -111,13 +169,22 @@ class Content(models.Model):
     # binds the content_type and object_id together to let us access the actual object directly
     item = GenericForeignKey('content_type','object_id')
 
-    order = models.PositiveIntegerField(default=0)
+    # appended after the last content of the module when not given
+    order = OrderField(blank=True, for_fields=['module'])
+    # position of the content in the cached completion bitmaps of its course
+    # (students.progress.completion_bitmap), stable across reorders, never reused
+    ordinal = models.PositiveIntegerField(blank=True)
 
     # track who complete this content
     completed_users = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='completed_contents', blank=True)
     class Meta:
         ordering = ['order']
 
+    def save(self, *args, **kwargs):
+        if self.ordinal is None:
+            self.ordinal = Course.allocate_ordinals(self.module.course_id)[0]
+        return super().save(*args, **kwargs)
+
 class ItemBase(models.Model):
     '''
     provides common fields for all specific content types
@@ -174,3 +241,87 @@ class Image(ItemBase):
 class Video(ItemBase):
     ''' Stores links/URLs to video content '''
     url = models.URLField()
+
+class CourseImportJob(models.Model):
+    '''
+    a background import of a course archive (manifest.json plus media,
+    the format written by the course export), into a new or an existing course
+    '''
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='course_imports', on_delete=models.CASCADE)
+    # the course imported into, set on creation for an existing course or once a new one is created
+    course = models.ForeignKey(Course, related_name='imports', on_delete=models.SET_NULL, blank=True, null=True)
+    # storage name of the uploaded archive, removed once the job finished
+    archive = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    # percentage, updated while the media is stored
+    progress = models.PositiveSmallIntegerField(default=0)
+    message = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created']
+
+    def __str__(self):
+        return f"Import {self.pk} ({self.status})"
+
+class CourseDailyStats(models.Model):
+    '''
+    activity of a course on one day, rolled up from the enrollment, progress,
+    review and chat tables by courses.analytics. teacher analytics read only these
+    '''
+    course = models.ForeignKey(Course, related_name='daily_stats', on_delete=models.CASCADE)
+    date = models.DateField()
+    enrollments = models.PositiveIntegerField(default=0)
+    completions = models.PositiveIntegerField(default=0)
+    reviews = models.PositiveIntegerField(default=0)
+    # reviews of the day per star value
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+    messages = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['course', 'date']
+        ordering = ['date']
+
+    def __str__(self):
+        return f"{self.course_id} on {self.date}"
+
+class ModuleDailyStats(models.Model):
+    '''
+    completions of the contents of one module on one day, see CourseDailyStats
+    '''
+    module = models.ForeignKey(Module, related_name='daily_stats', on_delete=models.CASCADE)
+    # denormalised, the analytics of a course are read without joining the modules
+    course = models.ForeignKey(Course, related_name='module_daily_stats', on_delete=models.CASCADE)
+    date = models.DateField()
+    completions = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['module', 'date']
+        indexes = [
+            models.Index(fields=['course', 'date'], name='module_stats_course_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"module {self.module_id} on {self.date}"
+
+class RollupWatermark(models.Model):
+    '''
+    the last row of a source table already added to the daily stats
+    '''
+    source = models.CharField(max_length=50, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} at {self.position}"
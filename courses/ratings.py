@@ -0,0 +1,53 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from .models import Course, CourseReview
+
+
+def apply_review_change(course_id, old_rating=None, new_rating=None):
+    '''
+    apply one review change to the stored aggregates of a course in a single
+    UPDATE, so concurrent reviews never overwrite each other's counts.
+    old_rating is None for a new review, new_rating is None for a deleted one
+    '''
+    if old_rating == new_rating:
+        return
+    changes = {}
+    if old_rating is None:
+        changes['review_count'] = F('review_count') + 1
+    elif new_rating is None:
+        changes['review_count'] = F('review_count') - 1
+    changes['rating_sum'] = F('rating_sum') + (new_rating or 0) - (old_rating or 0)
+    if old_rating is not None:
+        changes[f'rating_{old_rating}_count'] = F(f'rating_{old_rating}_count') - 1
+    if new_rating is not None:
+        changes[f'rating_{new_rating}_count'] = F(f'rating_{new_rating}_count') + 1
+    Course.objects.filter(pk=course_id).update(**changes)
+
+
+def _review_aggregate(expression, **filters):
+    ''' correlated subquery computing one aggregate over the reviews of the outer course '''
+    reviews = CourseReview.objects.filter(course=OuterRef('pk'), **filters).order_by()
+    return Coalesce(
+        Subquery(reviews.values('course').annotate(value=expression).values('value')),
+        Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def rebuild_rating_aggregates(queryset=None):
+    '''
+    recompute the review aggregates of the given courses (all by default)
+    from the CourseReview table in one UPDATE statement.
+    returns the number of courses updated
+    '''
+    if queryset is None:
+        queryset = Course.objects.all()
+    histogram = {
+        f'rating_{star}_count': _review_aggregate(Count('id'), rating=star)
+        for star in range(1, 6)
+    }
+    return queryset.update(
+        review_count=_review_aggregate(Count('id')),
+        rating_sum=_review_aggregate(Sum('rating')),
+        **histogram,
+    )
@@ -0,0 +1,190 @@
+import time
+import hashlib
+import logging
+from collections import Counter
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'catalog:version:{}'
+STATS_KEY = 'catalog:stats:{}'
+STAT_EVENTS = ['local_hit', 'shared_hit', 'miss']
+
+# counters of this worker process, the shared ones are kept in the default cache
+process_stats = Counter()
+# counted here and added to the shared counters every STATS_FLUSH_EVERY lookups,
+# so a cached response costs no extra round trip to the shared cache
+pending_stats = Counter()
+STATS_FLUSH_EVERY = 100
+
+
+def shared_cache():
+    return caches['default']
+
+
+def local_cache():
+    return caches['local']
+
+
+def _initial_version():
+    # a missing version (never set, or evicted) restarts from the current time,
+    # which is always newer than any version that was handed out before
+    return int(time.time() * 1000)
+
+
+def get_versions(scopes):
+    '''
+    return the current version of every scope, in order.
+    returns None when the shared cache is unreachable
+    '''
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    try:
+        found = shared_cache().get_many(keys)
+        for key in keys:
+            if key not in found:
+                version = _initial_version()
+                # add() keeps a version another worker created in the meantime
+                if not shared_cache().add(key, version, timeout=None):
+                    version = shared_cache().get(key, version)
+                found[key] = version
+    except Exception as e:
+        logger.warning(f"Catalog cache unavailable, serving uncached: {e}")
+        return None
+    return [found[key] for key in keys]
+
+
+def bump_versions(scopes):
+    '''
+    invalidate every cached response depending on one of the scopes.
+    nothing is deleted, entries keyed on the old version simply stop being read
+    '''
+    scopes = set(scopes)
+    _bump(scopes)
+    # bump again once the write is committed: a request running between the first
+    # bump and the commit may have cached the old rows under the new version
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def _bump(scopes):
+    for scope in scopes:
+        key = VERSION_KEY.format(scope)
+        try:
+            try:
+                shared_cache().incr(key)
+            except ValueError:
+                shared_cache().set(key, _initial_version(), timeout=None)
+        except Exception as e:
+            logger.warning(f"Could not bump catalog cache version '{scope}': {e}")
+
+
+def course_scope(course_id):
+    return f'course:{course_id}'
+
+
+def record(event):
+    process_stats[event] += 1
+    pending_stats[event] += 1
+    if sum(pending_stats.values()) >= STATS_FLUSH_EVERY:
+        flush_stats()
+
+
+def flush_stats():
+    ''' add the lookups counted by this process since the last flush to the shared counters '''
+    pending = dict(pending_stats)
+    pending_stats.clear()
+    for event, n in pending.items():
+        key = STATS_KEY.format(event)
+        try:
+            try:
+                shared_cache().incr(key, n)
+            except ValueError:
+                if not shared_cache().add(key, n, timeout=None):
+                    shared_cache().incr(key, n)
+        except Exception:
+            # statistics are best effort, never fail a request because of them
+            pass
+
+
+def cache_stats():
+    '''
+    hit/miss counters of the catalog cache, across all workers (up to the last
+    STATS_FLUSH_EVERY lookups of each) and for this process
+    '''
+    flush_stats()
+    try:
+        shared = shared_cache().get_many([STATS_KEY.format(event) for event in STAT_EVENTS])
+    except Exception:
+        shared = {}
+    totals = {event: shared.get(STATS_KEY.format(event), 0) for event in STAT_EVENTS}
+    lookups = sum(totals.values())
+    hits = totals['local_hit'] + totals['shared_hit']
+    return {
+        **totals,
+        'hit_ratio': round(hits / lookups, 3) if lookups else 0,
+        'process': {event: process_stats[event] for event in STAT_EVENTS},
+    }
+
+
+class VersionedCacheMixin:
+    """
+    Caches successful GET responses of read-heavy public endpoints.
+    The key is built from host, path, query string and the current version of
+    every scope the response depends on. Signal handlers bump those versions on
+    every write, so a stale entry is never read again.
+    A small process-local cache sits in front of the shared (Redis) cache.
+    Views must set cache_scopes, formatted with the URL kwargs ('course:{pk}').
+    """
+    cache_scopes = None
+    cache_timeout = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if not cls.cache_scopes:
+            raise ImproperlyConfigured(f"{cls.__name__} must set cache_scopes.")
+
+    def get_cache_scopes(self):
+        return [scope.format(**self.kwargs) for scope in self.cache_scopes]
+
+    def is_cacheable(self, request):
+        return request.method == 'GET'
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return handler(request, *args, **kwargs)
+        versions = get_versions(self.get_cache_scopes())
+        if versions is None:
+            return handler(request, *args, **kwargs)
+
+        raw_key = '|'.join([request.get_host(), request.path, request.META.get('QUERY_STRING', ''), *map(str, versions)])
+        key = 'catalog:response:' + hashlib.sha1(raw_key.encode()).hexdigest()
+
+        data = local_cache().get(key)
+        if data is not None:
+            record('local_hit')
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        try:
+            data = shared_cache().get(key)
+        except Exception:
+            data = None
+        if data is not None:
+            record('shared_hit')
+            local_cache().set(key, data)
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        record('miss')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            timeout = self.cache_timeout or settings.CATALOG_CACHE_TIMEOUT
+            local_cache().set(key, response.data)
+            try:
+                shared_cache().set(key, response.data, timeout=timeout)
+            except Exception as e:
+                logger.warning(f"Could not store catalog response: {e}")
+        response['X-Cache'] = 'MISS'
+        return response
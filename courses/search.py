@@ -0,0 +1,117 @@
+import re
+import logging
+from django.db import connection, DatabaseError
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+from .models import Course
+
+logger = logging.getLogger(__name__)
+
+# SQLite FTS5 virtual table, one row per course with rowid = course id.
+# created by migration 0008 on SQLite, other backends use the icontains fallback
+FTS_TABLE = 'courses_course_fts'
+FTS_COLUMNS = ['title', 'overview', 'subject', 'modules', 'course_code']
+# bm25 column weights, in FTS_COLUMNS order: a title hit outranks an overview hit
+FTS_WEIGHTS = [10.0, 1.0, 3.0, 2.0, 5.0]
+
+
+def fts_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def index_course(course_id):
+    '''
+    (re)build the search row of one course from its title, overview,
+    subject title and module titles
+    '''
+    if not fts_enabled():
+        return
+    course = Course.objects.select_related('subject').filter(pk=course_id).first()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [course_id])
+            if course is None:
+                return
+            module_titles = ' '.join(course.modules.values_list('title', flat=True))
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(FTS_COLUMNS)}) VALUES (%s, %s, %s, %s, %s, %s)',
+                [course.pk, course.title, course.overview, course.subject.title, module_titles, course.course_code],
+            )
+    except DatabaseError as e:
+        logger.warning(f"Could not update the search index for course {course_id}: {e}")
+
+
+def remove_course(course_id):
+    ''' drop a deleted course from the search index '''
+    if not fts_enabled():
+        return
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [course_id])
+    except DatabaseError as e:
+        logger.warning(f"Could not remove course {course_id} from the search index: {e}")
+
+
+def build_match_query(text):
+    '''
+    turn free text typed in the catalog search box into an FTS5 query.
+    every word is quoted (so user input cannot inject FTS syntax) and
+    prefix matched, so results show up while the user is still typing
+    '''
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_rank(text):
+    '''
+    (matching ids, rank) expressions for the courses matching text: a subquery
+    of their ids and their BM25 score (lower is better), evaluated by the
+    database for every match so pagination sees all of them.
+    (None, None) when text has no word to match, None when full-text search
+    is not available on this database
+    '''
+    if not fts_enabled():
+        return None
+    match = build_match_query(text)
+    if not match:
+        return None, None
+    try:
+        # fail here, not while the page is rendered, when the index is unusable
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s LIMIT 1', [match])
+    except DatabaseError as e:
+        logger.warning(f"Full-text course search failed, falling back to icontains: {e}")
+        return None
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    ids = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+    # only computed for the matching courses, FTS5 seeks the rowid in the match
+    rank = RawSQL(
+        f'SELECT bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s AND rowid = {Course._meta.db_table}.id',
+        [match],
+        output_field=FloatField(),
+    )
+    return ids, rank
+
+
+class CourseSearchFilter(filters.SearchFilter):
+    """
+    ?search= backed by the FTS5 index, results ordered by relevance.
+    An explicit ?ordering= still wins because OrderingFilter runs afterwards.
+    Falls back to the regular SearchFilter (icontains on search_fields)
+    on databases without FTS5.
+    """
+    def filter_queryset(self, request, queryset, view):
+        terms = ' '.join(self.get_search_terms(request))
+        if not terms:
+            return queryset
+
+        ranked = search_rank(terms)
+        if ranked is None:
+            return super().filter_queryset(request, queryset, view)
+        ids, rank = ranked
+        if ids is None:
+            # no word to match
+            return queryset.none()
+        return queryset.filter(pk__in=ids).annotate(search_rank=rank).order_by('search_rank', 'id')
@@ -1,6 +1,9 @@
 from rest_framework import serializers
-from .models import Subject, Course, Module, Content, Text, File, Image, Video, CourseReview
+from .models import Subject, Course, Module, Content, Text, File, Image, Video, CourseReview, CourseImportJob
 from django.contrib.auth import get_user_model
+from uploads.fields import ImageVariantsField, MediaUrlField
+from students.progress import progress_summary, completion_bitmap
+from students.bitsets import test_bit
 
 User = get_user_model()
 
@@ -17,14 +20,19 @@ class TextSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'content']
 
 class FileSerializer(serializers.ModelSerializer):
+    file = MediaUrlField()
+
     class Meta:
         model = File
         fields = ['id', 'title', 'file']
 
 class ImageSerializer(serializers.ModelSerializer):
+    file = MediaUrlField()
+    file_variants = ImageVariantsField(source='file')
+
     class Meta:
         model = Image
-        fields = ['id', 'title', 'file']
+        fields = ['id', 'title', 'file', 'file_variants']
 
 class VideoSerializer(serializers.ModelSerializer):
     class Meta:
@@ -47,28 +55,52 @@ class ContentSerializer(serializers.ModelSerializer):
         """
         Dynamically serialize the generic item.
         """
-        if isinstance(obj.item, Text):
-            return {"type": "text", **TextSerializer(obj.item).data}
-        if isinstance(obj.item, Video):
-            return {"type": "video", **VideoSerializer(obj.item).data}
-        if isinstance(obj.item, File):
-            return {"type": "file", **FileSerializer(obj.item).data}
-        if isinstance(obj.item, Image):
-            return {"type": "image", **ImageSerializer(obj.item).data}
+        # read the generic item once, it may already be resolved by resolve_content_items
+        item = obj.item
+        if isinstance(item, Text):
+            return {"type": "text", **TextSerializer(item).data}
+        if isinstance(item, Video):
+            return {"type": "video", **VideoSerializer(item).data}
+        if isinstance(item, File):
+            return {"type": "file", **FileSerializer(item, context=self.context).data}
+        if isinstance(item, Image):
+            return {"type": "image", **ImageSerializer(item, context=self.context).data}
         return None
     
     def get_is_completed(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return request.user in obj.completed_users.all()
+            # the completion bitmap is read once per course (one cache read) and shared through
+            # the serializer context by every nested ContentSerializer in the request
+            bitmaps = self.context.setdefault('completion_bitmaps', {})
+            course_id = self.get_course_id(obj)
+            if course_id not in bitmaps:
+                bitmaps[course_id] = completion_bitmap(request.user.id, course_id)
+            return test_bit(bitmaps[course_id], obj.ordinal)
         return False
+
+    def get_course_id(self, obj):
+        # ModuleSerializer puts the course id in the context, contents serialized on their
+        # own look up the course once per module instead of loading the module of each row
+        if 'course_id' in self.context:
+            return self.context['course_id']
+        courses = self.context.setdefault('module_courses', {})
+        if obj.module_id not in courses:
+            courses[obj.module_id] = Module.objects.values_list('course_id', flat=True).get(pk=obj.module_id)
+        return courses[obj.module_id]
     
 class ModuleSerializer(serializers.ModelSerializer):
     contents = ContentSerializer(many=True, read_only=True)
 
     class Meta:
         model = Module
-        fields = ['id', 'title', 'description', 'order', 'contents']
+        fields = ['id', 'title', 'description', 'order', 'order_version', 'contents']
+        read_only_fields = ['order_version']
+
+    def to_representation(self, instance):
+        # hand the course id down to the nested contents so they never load their module
+        self.context['course_id'] = instance.course_id
+        return super().to_representation(instance)
 
 class CourseOwnerSerializer(serializers.ModelSerializer):
     class Meta:
@@ -79,10 +111,26 @@ class CourseListSerializer(serializers.ModelSerializer):
     owner = CourseOwnerSerializer(read_only=True)
     subject = serializers.StringRelatedField()
     total_modules = serializers.IntegerField(read_only=True)
+    average_rating = serializers.FloatField(read_only=True)
+    # course cards load a thumbnail, not the original upload
+    image_variants = ImageVariantsField(source='image')
 
     class Meta:
         model = Course
-        fields = ['id', 'subject', 'title', 'slug', 'course_code', 'overview', 'created', 'owner', 'total_modules','image']
+        fields = ['id', 'subject', 'title', 'slug', 'course_code', 'overview', 'created', 'owner', 'total_modules','image',
+                  'image_variants', 'average_rating', 'review_count']
+
+class EnrolledCourseSerializer(CourseListSerializer):
+    """
+    course card of the student dashboard, with the student's stored progress
+    """
+    progress = serializers.SerializerMethodField()
+
+    class Meta(CourseListSerializer.Meta):
+        fields = CourseListSerializer.Meta.fields + ['progress']
+
+    def get_progress(self, obj) -> dict:
+        return progress_summary(obj)
 
 class CourseReviewSerializer(serializers.ModelSerializer):
     student_name = serializers.CharField(source='student.username', read_only=True)
@@ -102,10 +150,12 @@ class CourseDetailSerializer(serializers.ModelSerializer):
     is_enrolled = serializers.SerializerMethodField()
     reviews = CourseReviewSerializer(many=True, read_only=True)
     average_rating = serializers.FloatField(read_only=True)
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
     class Meta:
         model = Course
         fields = ['id', 'subject', 'title', 'slug', 'course_code', 'overview', 
-                  'created', 'owner', 'modules', 'is_enrolled','image','reviews', 'average_rating']
+                  'created', 'owner', 'modules', 'is_enrolled','image','reviews', 'average_rating',
+                  'review_count', 'rating_histogram']
         
     def get_is_enrolled(self, obj):
         request = self.context.get('request')
@@ -119,7 +169,8 @@ class TeacherCourseSerializer(serializers.ModelSerializer):
     """
     class Meta:
         model = Course
-        fields = ['id', 'subject', 'title', 'slug', 'course_code', 'overview', 'co_instructors','image']
+        fields = ['id', 'subject', 'title', 'slug', 'course_code', 'overview', 'co_instructors','image', 'order_version']
+        read_only_fields = ['order_version']
 
 class CourseStudentSerializer(serializers.ModelSerializer):
     """
@@ -140,3 +191,19 @@ class AdminCourseSerializer(serializers.ModelSerializer):
         model = Course
         fields = ['id', 'course_code', 'title', 'subject_name', 'owner_name', 'student_count', 'created']
 
+class ReorderSerializer(serializers.Serializer):
+    """
+    Validates a bulk reorder request: the complete new ordering of ids
+    and the order_version the client based it on.
+    """
+    order = serializers.ListField(child=serializers.IntegerField())
+    version = serializers.IntegerField(min_value=0)
+
+class CourseImportJobSerializer(serializers.ModelSerializer):
+    '''
+    status of a background course import
+    '''
+    class Meta:
+        model = CourseImportJob
+        fields = ['id', 'course', 'status', 'progress', 'message', 'created', 'updated']
+        read_only_fields = fields
@@ -1,7 +1,12 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-from .models import Content
-from users.models import Notification
+from django.db import transaction
+from django.contrib.contenttypes.models import ContentType
+from .models import Content, CourseReview, Course, Module, Subject, Text, Video, Image, File
+from .ratings import apply_review_change
+from .response_cache import bump_versions, course_scope
+from . import search
+from .tasks import notify_new_content
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,37 +15,112 @@ logger = logging.getLogger(__name__)
 def content_created_notification(sender, instance, created, **kwargs):
     """
     Triggered whenever a new Content object is saved.
-    If it's newly created, sends a notification to all enrolled students.
+    If it's newly created, queues the notification of all enrolled students,
+    the fan-out runs in a Celery task once the content is committed.
     """
     if created:
-        content = instance
-        module = content.module
-        course = module.course
-        students = course.students.all()
-
-        logger.info(f"Signal triggered: New content added to Course '{course.title}' (Module: {module.title})")
-        try:
-            students = course.students.all()
-
-            if not students.exists():
-                logger.debug("No students enrolled yet. Skipping notifications.")
-                return
-            frontend_link = f"/courses/{course/id}"
-
-
-            notifications = []
-            for student in students:
-                notifications.append(
-                    Notification(
-                        recipient=student,
-                        title=f"New Content in {course.title}",
-                        message=f"New material '{content.item}' added to module '{module.title}'.",
-                        link= frontend_link
-                    )
-                )
-            if notifications:
-                Notification.objects.bulk_create(notifications)
-                logger.info(f'Sucessfully send {len(notifications)} notifications for new content.')
-        
-        except Exception as e:
-            logger.error(f"Failed to send content notifications: {e}", exc_info=True)        # 
+        logger.info(f"Signal triggered: New content {instance.pk} added to module {instance.module_id}")
+        content_id = instance.pk
+        transaction.on_commit(lambda: notify_new_content.delay(content_id))
+
+@receiver(pre_save, sender=CourseReview)
+def remember_previous_review(sender, instance, **kwargs):
+    """
+    Stores the rating and course the review had before this save,
+    so post_save can apply only the difference to the course aggregates.
+    """
+    previous = None
+    if instance.pk:
+        previous = CourseReview.objects.filter(pk=instance.pk).values('course_id', 'rating').first()
+    instance._previous_review = previous
+
+@receiver(post_save, sender=CourseReview)
+def update_rating_aggregates_on_save(sender, instance, created, **kwargs):
+    """
+    Keeps Course.review_count, rating_sum and the star histogram in sync
+    when a review is created or its rating changes.
+    """
+    previous = getattr(instance, '_previous_review', None)
+    if previous is None:
+        apply_review_change(instance.course_id, new_rating=instance.rating)
+    elif previous['course_id'] != instance.course_id:
+        # a review moved to another course counts as a delete plus a create
+        apply_review_change(previous['course_id'], old_rating=previous['rating'])
+        apply_review_change(instance.course_id, new_rating=instance.rating)
+    else:
+        apply_review_change(instance.course_id, previous['rating'], instance.rating)
+
+@receiver(post_delete, sender=CourseReview)
+def update_rating_aggregates_on_delete(sender, instance, **kwargs):
+    """
+    Removes a deleted review from the course aggregates.
+    """
+    apply_review_change(instance.course_id, old_rating=instance.rating)
+
+@receiver(post_save, sender=Course)
+def index_course_on_save(sender, instance, **kwargs):
+    """
+    Keeps the full-text search row of a course up to date.
+    """
+    search.index_course(instance.pk)
+
+@receiver(post_delete, sender=Course)
+def unindex_course_on_delete(sender, instance, **kwargs):
+    search.remove_course(instance.pk)
+
+@receiver([post_save, post_delete], sender=Module)
+def index_course_on_module_change(sender, instance, **kwargs):
+    """
+    Module titles are part of the course search row.
+    """
+    search.index_course(instance.course_id)
+
+@receiver(post_save, sender=Subject)
+def index_courses_on_subject_change(sender, instance, created, **kwargs):
+    """
+    The subject title is part of the search row of every course in it.
+    """
+    if not created:
+        for course_id in instance.courses.values_list('id', flat=True):
+            search.index_course(course_id)
+
+@receiver([post_save, post_delete], sender=Course)
+def invalidate_cache_on_course_change(sender, instance, **kwargs):
+    """
+    Bumps the cache versions of the course detail, the catalog list
+    and the subject list (course counts).
+    """
+    bump_versions([course_scope(instance.pk), 'catalog', 'subjects'])
+
+@receiver([post_save, post_delete], sender=Module)
+def invalidate_cache_on_module_change(sender, instance, **kwargs):
+    bump_versions([course_scope(instance.course_id), 'catalog'])
+
+@receiver([post_save, post_delete], sender=Content)
+def invalidate_cache_on_content_change(sender, instance, **kwargs):
+    course_id = Module.objects.filter(pk=instance.module_id).values_list('course_id', flat=True).first()
+    if course_id is not None:
+        bump_versions([course_scope(course_id)])
+
+@receiver([post_save, post_delete], sender=CourseReview)
+def invalidate_cache_on_review_change(sender, instance, **kwargs):
+    bump_versions([course_scope(instance.course_id), 'catalog'])
+
+@receiver([post_save, post_delete], sender=Subject)
+def invalidate_cache_on_subject_change(sender, instance, **kwargs):
+    bump_versions(['subjects', 'catalog'])
+
+@receiver(post_save, sender=Text)
+@receiver(post_save, sender=Video)
+@receiver(post_save, sender=Image)
+@receiver(post_save, sender=File)
+def invalidate_cache_on_item_change(sender, instance, created, **kwargs):
+    """
+    Edited item titles/urls show up on the detail page of every course using them.
+    """
+    if created:
+        return
+    course_ids = Content.objects.filter(
+        content_type=ContentType.objects.get_for_model(sender), object_id=instance.pk
+    ).values_list('module__course_id', flat=True)
+    bump_versions([course_scope(course_id) for course_id in course_ids])
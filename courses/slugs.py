@@ -0,0 +1,60 @@
+from django.db.models import Q
+
+# room kept at the end of long values for a "-<n>" suffix
+SUFFIX_RESERVE = 8
+
+
+class UniqueValueAllocator:
+    '''
+    hands out unique values for a unique CharField/SlugField in the form
+    "base", "base-1", "base-2", ... reading the values already taken for a
+    base in one query, instead of probing the table once per candidate.
+    one allocator can be reused for a whole batch (e.g. before bulk_create),
+    values handed out earlier in the batch are never handed out again
+    '''
+    def __init__(self, model, field_name):
+        self.model = model
+        self.field_name = field_name
+        self.max_length = model._meta.get_field(field_name).max_length
+        # base -> [plain base still free, next numeric suffix]
+        self._state = {}
+        self._allocated = set()
+
+    def _trim(self, base):
+        limit = self.max_length - SUFFIX_RESERVE
+        if len(base) > limit:
+            base = base[:limit].rstrip('-')
+        return base
+
+    def _load(self, base):
+        lookup = Q(**{self.field_name: base}) | Q(**{f'{self.field_name}__startswith': f'{base}-'})
+        taken = self.model._default_manager.filter(lookup).values_list(self.field_name, flat=True)
+        plain_free = True
+        last_suffix = 0
+        for value in taken:
+            if value == base:
+                plain_free = False
+                continue
+            tail = value[len(base) + 1:]
+            if tail.isdigit():
+                last_suffix = max(last_suffix, int(tail))
+        return [plain_free, last_suffix + 1]
+
+    def allocate(self, base):
+        '''
+        return the next free value for base
+        '''
+        base = self._trim(base)
+        if base not in self._state:
+            self._state[base] = self._load(base)
+        state = self._state[base]
+        while True:
+            if state[0]:
+                state[0] = False
+                candidate = base
+            else:
+                candidate = f'{base}-{state[1]}'
+                state[1] += 1
+            if candidate not in self._allocated:
+                self._allocated.add(candidate)
+                return candidate
@@ -0,0 +1,74 @@
+import logging
+from datetime import timedelta
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+from users.models import Announcement
+from .models import Content, CourseImportJob
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def notify_new_content(content_id):
+    '''
+    announce a new content item to the students of its course.
+    the announcement is stored once for the course and merged into every
+    student's notification list when read, the event key makes retries
+    and duplicate dispatches harmless
+    '''
+    content = Content.objects.select_related('module__course__owner', 'content_type').filter(pk=content_id).first()
+    if content is None:
+        logger.debug(f"Content {content_id} is gone, skipping the announcement.")
+        return None
+    course = content.module.course
+
+    announcement, created = Announcement.objects.get_or_create(
+        event_key=f'content:{content.pk}',
+        defaults={
+            'course': course,
+            'title': "New Course Material!",
+            'message': f"Teacher {course.owner.username} just added a new {content.content_type.model} to '{course.title}'.",
+            'link': f"/student/course/{course.id}",
+        },
+    )
+    if created:
+        logger.info(f"Announced new content in course '{course.title}'.")
+    return announcement.pk
+
+
+@shared_task
+def import_course(job_id):
+    '''
+    run a queued course import, see courses.imports.
+    a job that already started (a duplicate dispatch) is left alone
+    '''
+    from .imports import run_import
+    job = CourseImportJob.objects.select_related('owner', 'course').filter(pk=job_id, status='pending').first()
+    if job is None:
+        logger.debug(f"Import job {job_id} is gone or already started, skipping.")
+        return None
+    course = run_import(job)
+    return course.pk if course else None
+
+
+@shared_task
+def update_analytics():
+    ''' add the activity recorded since the last run to the analytics rollups '''
+    from .analytics import update_rollups
+    added = update_rollups()
+    logger.debug(f"Analytics rollups updated: {added}.")
+    return added
+
+
+@shared_task
+def rebuild_recent_analytics(days=None):
+    '''
+    recount the rollups of the last days, the incremental runs only add new rows
+    and miss deletes and edits
+    '''
+    from .analytics import rebuild_rollups
+    days = days or settings.ANALYTICS_REBUILD_DAYS
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rebuild_rollups(since=since)
+    return str(since)
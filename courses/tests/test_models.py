@@ -0,0 +1,51 @@
+from unittest import mock
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from courses.models import Course
+from courses.slugs import UniqueValueAllocator
+from .factories import CourseFactory, SubjectFactory
+from users.tests.factories import CustomUserFactory
+
+class CourseSlugAllocationTests(TestCase):
+
+    def setUp(self):
+        self.owner = CustomUserFactory(role='teacher')
+        self.subject = SubjectFactory()
+
+    def build_course(self, n, title='Introduction to Python'):
+        return Course(owner=self.owner, subject=self.subject, title=title,
+                      course_code=f'PY{n}', overview='Overview.')
+
+    def test_save_appends_next_free_suffix(self):
+        """Slugs continue after the highest existing suffix."""
+        CourseFactory(slug='introduction-to-python')
+        CourseFactory(slug='introduction-to-python-4')
+        CourseFactory(slug='introduction-to-python-basics')
+
+        course = self.build_course(1)
+        course.save()
+        self.assertEqual(course.slug, 'introduction-to-python-5')
+
+    def test_bulk_allocation_uses_one_query_per_title(self):
+        """Performance: a bulk import of identical titles stays linear."""
+        CourseFactory(slug='introduction-to-python')
+        courses = [self.build_course(n) for n in range(50)]
+
+        with CaptureQueriesContext(connection) as ctx:
+            Course.assign_unique_slugs(courses)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        Course.objects.bulk_create(courses)
+        slugs = [c.slug for c in courses]
+        self.assertEqual(len(set(slugs)), 50)
+        self.assertEqual(slugs[:2], ['introduction-to-python-1', 'introduction-to-python-2'])
+
+    def test_save_retries_when_slug_is_taken_concurrently(self):
+        """Concurrency: a slug taken between allocation and insert triggers a retry."""
+        CourseFactory(slug='introduction-to-python')
+        course = self.build_course(1)
+        with mock.patch.object(UniqueValueAllocator, 'allocate',
+                               side_effect=['introduction-to-python', 'introduction-to-python-1']):
+            course.save()
+        self.assertEqual(course.slug, 'introduction-to-python-1')
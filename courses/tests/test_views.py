@@ -1,8 +1,35 @@
+import io
+import json
+import shutil
+import zipfile
+import tempfile
+from datetime import timedelta
+from unittest import mock
 from django.urls import reverse
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import generics
+from courses.response_cache import VersionedCacheMixin, cache_stats
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase
 from rest_framework import status
 from users.tests.factories import CustomUserFactory
-from .factories import CourseFactory, SubjectFactory, ModuleFactory
+from courses.models import Content, File, Course, CourseImportJob, CourseReview, CourseDailyStats, RollupWatermark
+from django.test import override_settings
+from django.utils import timezone
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from students.models import UserContentProgress, Enrollment
+from students import completion
+from chat.models import Message
+from users.models import Notification, Announcement
+from courses.tasks import notify_new_content, update_analytics, rebuild_recent_analytics
+from rest_framework.test import APIRequestFactory
+from courses.loaders import resolve_content_items
+from courses.serializers import ContentSerializer
+from .factories import CourseFactory, SubjectFactory, ModuleFactory, ContentFactory, TextFactory, VideoFactory
 
 class CourseAPIIntegrationTests(APITestCase):
     
@@ -55,4 +82,598 @@ class CourseAPIIntegrationTests(APITestCase):
         
         response = self.client.post(url, payload)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-        self.assertEqual(response.data['message'], "Video content added successfully.")
\ No newline at end of file
+        self.assertEqual(response.data['message'], "Video content added successfully.")
+
+class CourseDetailQueryTests(APITestCase):
+
+    def setUp(self):
+        self.course = CourseFactory()
+        self.url = reverse('courses:api_public_course_detail', kwargs={'pk': self.course.id})
+        # cached completion bitmaps are keyed by ids, which are reused between tests
+        caches['default'].clear()
+
+    def add_module_with_contents(self, count):
+        module = ModuleFactory(course=self.course)
+        for i in range(count):
+            item = TextFactory() if i % 2 else VideoFactory()
+            ContentFactory(module=module, item=item)
+
+    def count_detail_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries), response
+
+    def test_detail_query_count_does_not_grow_with_course_size(self):
+        """Performance: generic items are loaded per content type, not per content row."""
+        self.add_module_with_contents(2)
+        small_count, _ = self.count_detail_queries()
+
+        for _ in range(3):
+            self.add_module_with_contents(6)
+        large_count, response = self.count_detail_queries()
+
+        self.assertEqual(small_count, large_count)
+        items = [c['item'] for m in response.data['modules'] for c in m['contents']]
+        self.assertEqual(len(items), 20)
+        self.assertEqual({item['type'] for item in items}, {'text', 'video'})
+
+    def test_completion_flags_use_one_query_per_request(self):
+        """Performance: is_completed reads a per-request set covering both completion stores."""
+        student = CustomUserFactory()
+        self.course.students.add(student)
+        self.client.force_authenticate(user=student)
+        self.add_module_with_contents(2)
+        small_count, _ = self.count_detail_queries()
+
+        self.add_module_with_contents(6)
+        contents = list(Content.objects.filter(module__course=self.course).order_by('id'))
+        contents[0].completed_users.add(student)
+        UserContentProgress.objects.create(student=student, content=contents[1])
+        large_count, response = self.count_detail_queries()
+
+        self.assertEqual(small_count, large_count)
+        completed = {c['id'] for m in response.data['modules'] for c in m['contents'] if c['is_completed']}
+        self.assertEqual(completed, {contents[0].id, contents[1].id})
+
+    def test_contents_do_not_load_their_module_per_row(self):
+        """Performance: contents serialized on their own look up their course once per module."""
+        student = CustomUserFactory()
+        request = APIRequestFactory().get('/')
+        request.user = student
+        module = ModuleFactory(course=self.course)
+
+        def count_queries(count):
+            caches['default'].clear()
+            for _ in range(count):
+                ContentFactory(module=module, item=TextFactory())
+            contents = list(Content.objects.filter(module=module))
+            resolve_content_items(contents)
+            with CaptureQueriesContext(connection) as ctx:
+                ContentSerializer(contents, many=True, context={'request': request}).data
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count_queries(2), count_queries(6))
+
+class BulkReorderAPITests(APITestCase):
+
+    def setUp(self):
+        self.teacher = CustomUserFactory(role='teacher')
+        self.course = CourseFactory(owner=self.teacher)
+        self.module = ModuleFactory(course=self.course)
+        self.contents = [ContentFactory(module=self.module, item=TextFactory()) for _ in range(4)]
+        self.url = reverse('courses:api_teacher_content_reorder', kwargs={'pk': self.module.id})
+        self.client.force_authenticate(user=self.teacher)
+
+    def test_appended_contents_get_increasing_order(self):
+        """OrderField appends each new content after the last one of its module."""
+        self.assertEqual([c.order for c in self.contents], [0, 1, 2, 3])
+
+    def test_reorder_applies_full_ordering_and_bumps_version(self):
+        """Reordering a module is one request and one bulk update."""
+        new_order = [c.id for c in reversed(self.contents)]
+        response = self.client.put(self.url, {'order': new_order, 'version': 0}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['version'], 1)
+        self.assertEqual(list(self.module.contents.values_list('id', flat=True)), new_order)
+
+    def test_reorder_with_stale_version_is_rejected(self):
+        """Concurrency: a reorder based on an old version returns 409 and changes nothing."""
+        ids = [c.id for c in self.contents]
+        self.client.put(self.url, {'order': ids[::-1], 'version': 0}, format='json')
+        response = self.client.put(self.url, {'order': ids, 'version': 0}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(list(self.module.contents.values_list('id', flat=True)), ids[::-1])
+
+    def test_single_module_move_invalidates_the_course_version(self):
+        """Concurrency: moving one module through PATCH makes a bulk reorder on the old version stale."""
+        other = ModuleFactory(course=self.course)
+        response = self.client.patch(reverse('courses:api_teacher_module_rud', kwargs={'pk': other.id}), {'order': 0}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.order_version, 1)
+
+        url = reverse('courses:api_teacher_module_reorder', kwargs={'pk': self.course.id})
+        response = self.client.put(url, {'order': [self.module.id, other.id], 'version': 0}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        # a title edit keeps the version
+        self.client.patch(reverse('courses:api_teacher_module_rud', kwargs={'pk': other.id}), {'title': 'Renamed'}, format='json')
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.order_version, 1)
+
+    def test_reorder_must_list_every_module(self):
+        """Validation: a partial ordering of a course's modules is rejected."""
+        ModuleFactory(course=self.course)
+        url = reverse('courses:api_teacher_module_reorder', kwargs={'pk': self.course.id})
+        response = self.client.put(url, {'order': [self.module.id], 'version': 0}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CourseSearchTests(APITestCase):
+
+    def setUp(self):
+        self.url = reverse('courses:api_public_course_list')
+        self.overview_hit = CourseFactory(title='Cooking Basics', overview='Also touches on django templates.')
+        self.title_hit = CourseFactory(title='Django for Beginners', overview='Web development.')
+        self.other = CourseFactory(title='Linear Algebra', overview='Vectors and matrices.')
+
+    def search(self, term):
+        response = self.client.get(self.url, {'search': term})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [course['id'] for course in response.data['results']]
+
+    def test_search_ranks_title_matches_first(self):
+        """Full-text search orders results by relevance, title hits before overview hits."""
+        self.assertEqual(self.search('djan'), [self.title_hit.id, self.overview_hit.id])
+
+    def test_search_pages_through_every_match(self):
+        """The paginator sees every match, not a truncated ranking."""
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        CourseFactory.create_batch(page_size, title='Django Deep Dive')
+        response = self.client.get(self.url, {'search': 'django'})
+        self.assertEqual(response.data['count'], page_size + 2)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_search_index_follows_module_and_course_changes(self):
+        """Signals keep the index in sync with module titles and course edits."""
+        ModuleFactory(course=self.other, title='Eigenvalues')
+        self.assertEqual(self.search('eigenvalues'), [self.other.id])
+
+        self.other.title = 'Numerical Methods'
+        self.other.save()
+        self.assertEqual(self.search('numerical'), [self.other.id])
+        self.other.delete()
+        self.assertEqual(self.search('numerical'), [])
+
+    def test_search_falls_back_without_full_text_index(self):
+        """Backends without FTS5 keep the icontains search."""
+        with mock.patch('courses.search.fts_enabled', return_value=False):
+            self.assertEqual(set(self.search('matrices')), {self.other.id})
+
+
+class CatalogResponseCacheTests(APITestCase):
+
+    def setUp(self):
+        self.course = CourseFactory(title='Cached Course')
+        self.list_url = reverse('courses:api_public_course_list')
+        self.detail_url = reverse('courses:api_public_course_detail', kwargs={'pk': self.course.id})
+
+    def test_repeated_anonymous_requests_are_served_from_cache(self):
+        """Performance: the second identical catalog request skips the database."""
+        self.assertEqual(self.client.get(self.detail_url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get(self.detail_url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['title'], 'Cached Course')
+
+    def test_hits_are_counted_without_a_shared_cache_write(self):
+        """Performance: hit statistics are batched per process, not written on every hit."""
+        cache_stats()
+        self.client.get(self.detail_url)
+        with mock.patch.object(type(caches['default']), 'incr') as incr:
+            self.client.get(self.detail_url)
+        incr.assert_not_called()
+        self.assertGreaterEqual(cache_stats()['process']['local_hit'], 1)
+        self.assertGreaterEqual(cache_stats()['local_hit'], 1)
+
+    def test_cached_views_must_declare_their_scopes(self):
+        with self.assertRaises(ImproperlyConfigured):
+            type('UnscopedView', (VersionedCacheMixin, generics.ListAPIView), {})
+
+    def test_writes_invalidate_cached_responses(self):
+        """Signals bump the versions, so a cached page is never served stale."""
+        self.client.get(self.list_url)
+        self.client.get(self.detail_url)
+        ModuleFactory(course=self.course, title='Fresh Module')
+
+        detail = self.client.get(self.detail_url)
+        self.assertEqual(detail['X-Cache'], 'MISS')
+        self.assertEqual([m['title'] for m in detail.data['modules']], ['Fresh Module'])
+        listing = self.client.get(self.list_url)
+        self.assertEqual(listing['X-Cache'], 'MISS')
+
+    def test_authenticated_detail_is_not_cached(self):
+        """Per-user flags (is_enrolled, is_completed) are never shared between users."""
+        self.client.force_authenticate(user=CustomUserFactory())
+        self.client.get(self.detail_url)
+        self.assertEqual(self.client.get(self.detail_url).get('X-Cache'), None)
+
+
+class TeacherStudentListPaginationTests(APITestCase):
+
+    def test_student_list_pages_by_enrollment_time(self):
+        """Keyset pagination: the roster is walked page by page without offsets."""
+        teacher = CustomUserFactory(role='teacher')
+        course = CourseFactory(owner=teacher)
+        students = [CustomUserFactory() for _ in range(12)]
+        for student in students:
+            course.students.add(student)
+        self.client.force_authenticate(user=teacher)
+
+        first = self.client.get(reverse('courses:api_teacher_student_list', kwargs={'course_pk': course.id}))
+        second = self.client.get(first.data['next'])
+
+        ids = [s['id'] for s in first.data['results'] + second.data['results']]
+        self.assertEqual(ids, [s.id for s in reversed(students)])
+        self.assertIsNone(second.data['next'])
+
+
+class ContentNotificationFanOutTests(APITestCase):
+
+    def setUp(self):
+        self.teacher = CustomUserFactory(role='teacher')
+        self.course = CourseFactory(owner=self.teacher)
+        self.module = ModuleFactory(course=self.course)
+        self.students = [CustomUserFactory() for _ in range(3)]
+        for student in self.students:
+            self.course.students.add(student)
+
+    def test_new_content_is_announced_once(self):
+        """The (eager) Celery task runs after commit and stores one announcement, not one row per student."""
+        self.client.force_authenticate(user=self.teacher)
+        url = reverse('courses:api_teacher_content_create', kwargs={'module_id': self.module.id, 'model_name': 'text'})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'title': 'Notes', 'content': 'Read me.'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(Announcement.objects.filter(course=self.course, title='New Course Material!').count(), 1)
+        self.assertFalse(Notification.objects.filter(title='New Course Material!').exists())
+
+    def test_repeated_announcement_is_deduplicated(self):
+        """A retried task does not announce the content twice."""
+        with self.captureOnCommitCallbacks(execute=True):
+            content = ContentFactory(module=self.module, item=TextFactory())
+        notify_new_content(content.id)
+        self.assertEqual(Announcement.objects.filter(event_key=f'content:{content.id}').count(), 1)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class CourseExportTests(APITestCase):
+
+    def setUp(self):
+        self.teacher = CustomUserFactory(role='teacher')
+        self.course = CourseFactory(owner=self.teacher)
+        intro = ModuleFactory(course=self.course, title='Intro', order=0)
+        advanced = ModuleFactory(course=self.course, title='Advanced', order=1)
+        ContentFactory(module=intro, item=TextFactory(title='Welcome'))
+        ContentFactory(module=intro, item=VideoFactory(title='Lecture'))
+        self.pdf = b'%PDF-1.4 ' + b'x' * 5000
+        pdf = File.objects.create(owner=self.teacher, title='Notes', file=default_storage.save('files/notes.pdf', ContentFile(self.pdf)))
+        ContentFactory(module=advanced, item=pdf)
+        self.url = reverse('courses:api_teacher_course_export', kwargs={'pk': self.course.pk})
+
+    def tearDown(self):
+        shutil.rmtree(default_storage.location, ignore_errors=True)
+
+    def test_export_streams_a_zip_with_manifest_and_media(self):
+        self.client.force_authenticate(user=self.teacher)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+        manifest = json.loads(archive.read('manifest.json'))
+        self.assertEqual(manifest['course']['title'], self.course.title)
+        self.assertEqual([m['title'] for m in manifest['modules']], ['Intro', 'Advanced'])
+        self.assertEqual([c['type'] for c in manifest['modules'][0]['contents']], ['text', 'video'])
+        notes = manifest['modules'][1]['contents'][0]
+        self.assertEqual(archive.read(notes['file']), self.pdf)
+
+    def test_only_the_owner_can_export(self):
+        self.client.force_authenticate(user=CustomUserFactory(role='teacher'))
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class CourseImportTests(APITestCase):
+
+    def setUp(self):
+        self.teacher = CustomUserFactory(role='teacher')
+        self.source = CourseFactory(owner=self.teacher, course_code='SRC101')
+        intro = ModuleFactory(course=self.source, title='Intro', order=0)
+        advanced = ModuleFactory(course=self.source, title='Advanced', order=1)
+        ContentFactory(module=intro, item=TextFactory(title='Welcome'))
+        ContentFactory(module=intro, item=VideoFactory(title='Lecture'))
+        self.pdf = File.objects.create(owner=self.teacher, title='Notes', file=default_storage.save('files/notes.pdf', ContentFile(b'%PDF-1.4 notes')))
+        ContentFactory(module=advanced, item=self.pdf)
+        self.client.force_authenticate(user=self.teacher)
+        response = self.client.get(reverse('courses:api_teacher_course_export', kwargs={'pk': self.source.pk}))
+        self.archive = b''.join(response.streaming_content)
+        self.url = reverse('courses:api_teacher_course_import')
+
+    def tearDown(self):
+        shutil.rmtree(default_storage.location, ignore_errors=True)
+
+    def post_archive(self, data, archive=None):
+        data['archive'] = ContentFile(archive or self.archive, name='course.zip')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        return CourseImportJob.objects.get(pk=response.data['id'])
+
+    def test_import_creates_the_course_in_order(self):
+        job = self.post_archive({})
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.progress, 100)
+        course = job.course
+        self.assertNotEqual(course.course_code, 'SRC101')
+        self.assertEqual(list(course.modules.order_by('order').values_list('title', 'order')), [('Intro', 0), ('Advanced', 1)])
+        intro = course.modules.get(title='Intro')
+        self.assertEqual([c.item.title for c in intro.contents.order_by('order')], ['Welcome', 'Lecture'])
+        notes = Content.objects.get(module__course=course, module__title='Advanced').item
+        self.assertEqual(notes.file.read(), b'%PDF-1.4 notes')
+        # one summary notification, no per-content announcements
+        self.assertEqual(Notification.objects.filter(recipient=self.teacher, title='Course import finished').count(), 1)
+        self.assertFalse(Announcement.objects.filter(course=course).exists())
+
+        status_url = reverse('courses:api_teacher_course_import_status', kwargs={'pk': job.pk})
+        self.assertEqual(self.client.get(status_url).data['status'], 'done')
+
+    def test_import_into_an_existing_course_appends_and_announces_once(self):
+        course = CourseFactory(owner=self.teacher)
+        ModuleFactory(course=course, title='Existing', order=0)
+        course.students.add(CustomUserFactory(role='student'))
+
+        job = self.post_archive({'course': course.pk})
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(list(course.modules.order_by('order').values_list('title', flat=True)), ['Existing', 'Intro', 'Advanced'])
+        self.assertEqual(Announcement.objects.filter(course=course).count(), 1)
+
+    def test_items_with_missing_media_are_left_out_of_the_round_trip(self):
+        default_storage.delete(self.pdf.file.name)
+        with self.assertLogs('courses.exports', 'WARNING'):
+            response = self.client.get(reverse('courses:api_teacher_course_export', kwargs={'pk': self.source.pk}))
+            archive = b''.join(response.streaming_content)
+
+        job = self.post_archive({}, archive)
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(list(job.course.modules.order_by('order').values_list('title', flat=True)), ['Intro', 'Advanced'])
+        self.assertEqual(
+            list(Content.objects.filter(module__course=job.course).order_by('module__order', 'order').values_list('module__title', flat=True)),
+            ['Intro', 'Intro'],
+        )
+
+    def test_invalid_archive_fails_without_creating_anything(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr('manifest.json', json.dumps({'format': 'something-else'}))
+        courses = Course.objects.count()
+        job = self.post_archive({}, archive=buffer.getvalue())
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('not a course export', job.message)
+        self.assertEqual(Course.objects.count(), courses)
+
+    def test_malformed_manifest_fails_the_job(self):
+        manifest = json.loads(zipfile.ZipFile(io.BytesIO(self.archive)).read('manifest.json'))
+        for modules in (['x'], {'title': 'Intro'}, [{'title': 'Intro', 'contents': [{'type': 'text', 'title': 'A', 'order': 'first'}]}]):
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, 'w') as archive:
+                archive.writestr('manifest.json', json.dumps({**manifest, 'modules': modules}))
+            job = self.post_archive({}, archive=buffer.getvalue())
+            self.assertEqual(job.status, 'failed')
+
+    def test_unexpected_error_fails_the_job(self):
+        with mock.patch('courses.imports.build_course', side_effect=OSError('disk full')):
+            job = self.post_archive({})
+        self.assertEqual(job.status, 'failed')
+        self.assertFalse(default_storage.exists(job.archive))
+
+    def test_status_is_private_to_the_owner(self):
+        job = self.post_archive({})
+        self.client.force_authenticate(user=CustomUserFactory(role='teacher'))
+        status_url = reverse('courses:api_teacher_course_import_status', kwargs={'pk': job.pk})
+        self.assertEqual(self.client.get(status_url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CourseDuplicateTests(APITestCase):
+
+    def setUp(self):
+        self.teacher = CustomUserFactory(role='teacher')
+        self.course = CourseFactory(owner=self.teacher, course_code='WEB101')
+        self.course.students.add(CustomUserFactory(role='student'))
+        self.url = reverse('courses:api_teacher_course_duplicate', kwargs={'pk': self.course.pk})
+
+    def add_module(self, order, contents=2):
+        module = ModuleFactory(course=self.course, order=order)
+        for _ in range(contents):
+            ContentFactory(module=module, item=TextFactory())
+            ContentFactory(module=module, item=VideoFactory())
+        return module
+
+    def duplicate(self):
+        self.client.force_authenticate(user=self.teacher)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {'title': 'Web Development 2027'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Course.objects.get(pk=response.data['id']), len(queries)
+
+    def test_copies_modules_and_contents_in_order(self):
+        first = self.add_module(0)
+        self.add_module(1)
+        pdf = File.objects.create(owner=self.teacher, title='Notes', file='files/ab/notes.pdf')
+        ContentFactory(module=first, item=pdf)
+
+        clone, _ = self.duplicate()
+        self.assertEqual(clone.title, 'Web Development 2027')
+        self.assertNotEqual(clone.slug, self.course.slug)
+        self.assertEqual(clone.course_code, 'WEB101-1')
+        self.assertFalse(clone.students.exists())
+
+        original = [(c.module.order, c.order, c.item.title) for c in Content.objects.filter(module__course=self.course).order_by('module__order', 'order')]
+        copied = Content.objects.filter(module__course=clone).order_by('module__order', 'order')
+        self.assertEqual([(c.module.order, c.order, c.item.title) for c in copied], original)
+        # items are copies, their media is shared
+        copied_pdf = copied.get(content_type__model='file').item
+        self.assertNotEqual(copied_pdf.pk, pdf.pk)
+        self.assertEqual(copied_pdf.file.name, pdf.file.name)
+
+    def test_query_count_does_not_grow_with_the_course(self):
+        self.add_module(0)
+        _, small = self.duplicate()
+        for order in range(1, 6):
+            self.add_module(order, contents=5)
+        _, large = self.duplicate()
+        self.assertEqual(small, large)
+
+    def test_only_the_owner_can_duplicate(self):
+        self.client.force_authenticate(user=CustomUserFactory(role='teacher'))
+        self.assertEqual(self.client.post(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(ANALYTICS_ROLLUP_LAG=0)
+class CourseAnalyticsTests(APITestCase):
+
+    def setUp(self):
+        self.teacher = CustomUserFactory(role='teacher')
+        self.course = CourseFactory(owner=self.teacher)
+        self.first = ModuleFactory(course=self.course, order=0)
+        self.second = ModuleFactory(course=self.course, order=1)
+        self.contents = [ContentFactory(module=module, item=TextFactory()) for module in (self.first, self.first, self.second)]
+        self.url = reverse('courses:api_teacher_course_analytics', kwargs={'pk': self.course.pk})
+
+    def add_student(self, rating=None, completed=(), messages=0):
+        student = CustomUserFactory(role='student')
+        Enrollment.objects.create(user=student, course=self.course)
+        for index in completed:
+            completion.mark(student, self.contents[index])
+        if rating:
+            CourseReview.objects.create(course=self.course, student=student, rating=rating)
+        for _ in range(messages):
+            Message.objects.create(course=self.course, sender=student, content='hello')
+        return student
+
+    def analytics(self, **params):
+        self.client.force_authenticate(user=self.teacher)
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_reads_the_rollups_only(self):
+        self.add_student(rating=5, completed=[0, 1, 2], messages=2)
+        self.add_student(rating=3, completed=[0], messages=1)
+        update_analytics()
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.analytics(days=7)
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        for table in ('students_enrollment', 'students_usercontentprogress', 'courses_coursereview', 'chat_message'):
+            self.assertNotIn(table, sql)
+
+        self.assertEqual(data['totals'], {'enrollments': 2, 'completions': 4, 'reviews': 2, 'messages': 3})
+        self.assertEqual(data['review_distribution'], {'1': 0, '2': 0, '3': 1, '4': 0, '5': 1})
+        self.assertEqual([(m['module_id'], m['completions']) for m in data['modules']], [(self.first.pk, 3), (self.second.pk, 1)])
+        self.assertEqual(len(data['daily']), 7)
+        self.assertEqual(data['daily'][-1]['enrollments'], 2)
+        self.assertEqual(data['daily'][0]['enrollments'], 0)
+
+    def test_incremental_runs_count_each_row_once(self):
+        self.add_student(completed=[0])
+        update_analytics()
+        update_analytics()
+        self.add_student(completed=[1], messages=1)
+        added = update_analytics()
+        self.assertEqual(added['enrollments'], 1)
+
+        data = self.analytics()
+        self.assertEqual(data['totals'], {'enrollments': 2, 'completions': 2, 'reviews': 0, 'messages': 1})
+        self.assertEqual(CourseDailyStats.objects.filter(course=self.course).count(), 1)
+        self.assertEqual(
+            RollupWatermark.objects.get(source='enrollments').position,
+            Enrollment.objects.order_by('-id').values_list('id', flat=True).first(),
+        )
+
+    @override_settings(ANALYTICS_ROLLUP_LAG=60)
+    def test_recent_rows_wait_for_the_next_run(self):
+        self.add_student(messages=1)
+        self.assertEqual(update_analytics()['messages'], 0)
+        self.assertEqual(self.analytics()['totals']['messages'], 0)
+
+    @override_settings(ANALYTICS_ROLLUP_LAG=60)
+    def test_a_recent_row_holds_back_the_watermark(self):
+        """Concurrency: older rows behind a recent lower id are not counted past it."""
+        self.add_student(messages=2)
+        first, second = Message.objects.order_by('id')
+        Message.objects.filter(pk=second.pk).update(timestamp=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(update_analytics()['messages'], 0)
+        self.assertEqual(RollupWatermark.objects.get(source='messages').position, 0)
+
+        Message.objects.filter(pk=first.pk).update(timestamp=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(update_analytics()['messages'], 2)
+        self.assertEqual(self.analytics()['totals']['messages'], 2)
+
+    def test_rebuild_recounts_the_ratings_of_older_reviews(self):
+        student = self.add_student(rating=2)
+        CourseReview.objects.filter(student=student).update(created=timezone.now() - timedelta(days=20))
+        update_analytics()
+        CourseReview.objects.filter(student=student).update(rating=5)
+
+        rebuild_recent_analytics(days=3)
+        data = self.analytics()
+        self.assertEqual(data['review_distribution'], {'1': 0, '2': 0, '3': 0, '4': 0, '5': 1})
+        self.assertEqual(data['totals']['reviews'], 1)
+
+    def test_rebuild_catches_deletes_and_edits(self):
+        student = self.add_student(rating=2, completed=[0, 2], messages=2)
+        update_analytics()
+        Message.objects.filter(sender=student).first().delete()
+        completion.unmark(student, self.contents[2])
+        CourseReview.objects.filter(student=student).update(rating=4)
+
+        rebuild_recent_analytics()
+        data = self.analytics()
+        self.assertEqual(data['totals'], {'enrollments': 1, 'completions': 1, 'reviews': 1, 'messages': 1})
+        self.assertEqual(data['review_distribution']['4'], 1)
+        self.assertEqual([m['completions'] for m in data['modules']], [1, 0])
+        # the next incremental run does not count the rebuilt rows again
+        update_analytics()
+        self.assertEqual(self.analytics()['totals']['messages'], 1)
+
+    def test_synced_unmark_and_remark_move_the_completion(self):
+        student = self.add_student(completed=[0])
+        UserContentProgress.objects.filter(student=student).update(changed_at=timezone.now() - timedelta(days=3))
+        update_analytics()
+        self.assertEqual(self.analytics()['daily'][-4]['completions'], 1)
+        sync_url = reverse('students:api_progress_sync')
+
+        def sync(completed, timestamp):
+            self.client.force_authenticate(user=student)
+            operation = {'content_id': self.contents[0].pk, 'completed': completed, 'client_timestamp': timestamp.isoformat()}
+            self.client.post(sync_url, {'operations': [operation]}, format='json')
+            update_analytics()
+            return self.analytics()
+
+        data = sync(False, timezone.now() - timedelta(minutes=5))
+        self.assertEqual(data['totals']['completions'], 0)
+        self.assertEqual([m['completions'] for m in data['modules']], [0, 0])
+        # the tombstone row is revived in place, same id and creation date
+        data = sync(True, timezone.now())
+        self.assertEqual(data['totals']['completions'], 1)
+        self.assertEqual(data['daily'][-1]['completions'], 1)
+        self.assertEqual([m['completions'] for m in data['modules']], [1, 0])
+        self.assertEqual(UserContentProgress.objects.filter(student=student).count(), 1)
+
+    def test_only_the_owner_reads_the_analytics(self):
+        self.client.force_authenticate(user=CustomUserFactory(role='teacher'))
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
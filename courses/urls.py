@@ -15,9 +15,21 @@ urlpatterns = [
     # course CRUD
     path('teacher/mine/', views.TeacherCourseListCreateAPIView.as_view(), name='api_teacher_course_list_create'),
     path('teacher/<int:pk>/', views.TeacherCourseRetrieveUpdateDestroyAPIView.as_view(), name='api_teacher_course_rud'),
+    # streamed ZIP export of a course
+    path('teacher/<int:pk>/export/', views.TeacherCourseExportAPIView.as_view(), name='api_teacher_course_export'),
+    # copy of a course for a new term
+    path('teacher/<int:pk>/duplicate/', views.TeacherCourseDuplicateAPIView.as_view(), name='api_teacher_course_duplicate'),
+    # daily activity rollups of a course
+    path('teacher/<int:pk>/analytics/', views.TeacherCourseAnalyticsAPIView.as_view(), name='api_teacher_course_analytics'),
+    # background import of an exported course archive
+    path('teacher/import/', views.TeacherCourseImportAPIView.as_view(), name='api_teacher_course_import'),
+    path('teacher/import/<int:pk>/', views.TeacherCourseImportStatusAPIView.as_view(), name='api_teacher_course_import_status'),
     # module CRUD
     path('teacher/<int:course_pk>/modules/', views.TeacherModuleListCreateAPIView.as_view(), name='api_teacher_module_list_create'),
     path('teacher/modules/<int:pk>/', views.TeacherModuleRetrieveUpdateDestroyAPIView.as_view(), name='api_teacher_module_rud'),
+    # bulk reorder of modules and contents
+    path('teacher/<int:pk>/modules/reorder/', views.TeacherModuleReorderAPIView.as_view(), name='api_teacher_module_reorder'),
+    path('teacher/modules/<int:pk>/contents/reorder/', views.TeacherContentReorderAPIView.as_view(), name='api_teacher_content_reorder'),
     # create and delete course content
     path('teacher/modules/<int:module_id>/content/<str:model_name>/', views.TeacherContentCreateAPIView.as_view(), name='api_teacher_content_create'),
     path('teacher/content/<int:id>/', views.TeacherContentDeleteAPIView.as_view(), name='api_teacher_content_delete'),
@@ -30,6 +42,7 @@ urlpatterns = [
     path('content/<int:content_id>/mark-complete/', views.MarkContentCompleteAPIView.as_view(), name='api_mark_content_complete'),
     # admin urls
     path('admin/all/', views.AdminCourseListAPIView.as_view(), name='api_admin_course_list'),
+    path('admin/cache-stats/', views.AdminCatalogCacheStatsAPIView.as_view(), name='api_admin_cache_stats'),
     path('admin/<int:course_id>/', views.AdminCourseDeleteAPIView.as_view(), name='api_admin_course_delete'),
     path('enrolled/', views.StudentEnrolledCoursesAPIView.as_view(), name='api_student_enrolled_courses'),
 
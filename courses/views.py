@@ -1,19 +1,39 @@
+import uuid
+from datetime import timedelta
 from rest_framework import generics, status, permissions, viewsets, filters
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from django.db.models import Count
+from django.http import StreamingHttpResponse
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import Count, Prefetch, Case, When, Value, F, FloatField
+from django.db.models.functions import Cast
 from django.apps import apps
 from django.contrib.auth import get_user_model
 from users.api_permissions import IsSiteAdminAPI
-from .models import Course, Module, Content, Subject, CourseReview
-from .serializers import SubjectSerializer, CourseListSerializer, CourseDetailSerializer, TeacherCourseSerializer, ModuleSerializer, CourseStudentSerializer, AdminCourseSerializer
+from .models import Course, Module, Content, Subject, CourseReview, CourseImportJob
+from .loaders import resolve_content_items
+from .search import CourseSearchFilter
+from .exports import stream_course_export
+from .imports import IMPORT_FOLDER
+from .cloning import clone_course
+from .analytics import course_analytics
+from .tasks import import_course
+from .response_cache import VersionedCacheMixin, bump_versions, course_scope, cache_stats
+from .serializers import SubjectSerializer, CourseListSerializer, CourseDetailSerializer, TeacherCourseSerializer, ModuleSerializer, CourseStudentSerializer, AdminCourseSerializer, ReorderSerializer, CourseImportJobSerializer, EnrolledCourseSerializer
 from django_filters.rest_framework import DjangoFilterBackend
 from users.models import Notification
+from config.pagination import KeysetPagination
+from uploads.models import UploadSession
+from uploads.blobs import store_blob
+from students.progress import with_progress, ensure
+from students import completion
 
 User = get_user_model()
 
-class SubjectViewSet(viewsets.ModelViewSet):
+class SubjectViewSet(VersionedCacheMixin, viewsets.ModelViewSet):
     """
     GET /api/courses/subjects/
     API endpoint that allows subjects (categories) to be viewed.
@@ -22,39 +42,75 @@ class SubjectViewSet(viewsets.ModelViewSet):
     queryset = Subject.objects.annotate(total_courses=Count('courses'))
     serializer_class = SubjectSerializer
     permission_classes = [permissions.AllowAny]
+    cache_scopes = ['subjects']
 
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
             return [permissions.AllowAny()]
         return [IsSiteAdminAPI()] 
 
-class PublicCourseListAPIView(generics.ListAPIView):
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+class PublicCourseListAPIView(VersionedCacheMixin, generics.ListAPIView):
     """
     GET /api/courses/
     List all available courses. Supports filtering by subject via query param (?subject=slug).
+    ?search= uses the full-text index and returns the best matches first.
     """
     serializer_class = CourseListSerializer
     permission_classes = [permissions.AllowAny]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, CourseSearchFilter, filters.OrderingFilter]
     filterset_fields = ['subject', 'owner']
     search_fields = ['title', 'overview', 'course_code']
-    ordering_fields = ['created', 'title']
+    ordering_fields = ['created', 'title', 'avg_rating', 'review_count']
+    cache_scopes = ['catalog']
 
     def get_queryset(self):
-        queryset = Course.objects.annotate(total_modules=Count('modules')).order_by('-created')
+        # avg_rating is computed from the stored aggregates so ?ordering=-avg_rating needs no join
+        avg_rating = Case(
+            When(review_count=0, then=Value(0.0)),
+            default=Cast('rating_sum', FloatField()) / F('review_count'),
+            output_field=FloatField(),
+        )
+        queryset = Course.objects.annotate(total_modules=Count('modules'), avg_rating=avg_rating).order_by('-created')
         subject_slug = self.request.query_params.get('subject')
         if subject_slug:
             queryset = queryset.filter(subject__slug=subject_slug)
         return queryset
 
-class PublicCourseDetailAPIView(generics.RetrieveAPIView):
+    def get(self, request, *args, **kwargs):
+        return self.cached_response(request, super().get, *args, **kwargs)
+
+class PublicCourseDetailAPIView(VersionedCacheMixin, generics.RetrieveAPIView):
     """
     GET /api/courses/<pk>/
     Public overview of a course (before enrollment).
     """
-    queryset = Course.objects.all()
     serializer_class = CourseDetailSerializer
     permission_classes = [permissions.AllowAny]
+    cache_scopes = [course_scope('{pk}'), 'subjects']
+
+    def get_queryset(self):
+        # load the whole course tree up front so the page costs a fixed number of queries
+        return Course.objects.select_related('owner', 'subject').prefetch_related(
+            'modules__contents',
+            Prefetch('reviews', queryset=CourseReview.objects.select_related('student')),
+        )
+
+    def get_object(self):
+        course = super().get_object()
+        resolve_content_items(
+            content for module in course.modules.all() for content in module.contents.all()
+        )
+        return course
+
+    def is_cacheable(self, request):
+        # is_enrolled and is_completed are per user, only anonymous pages are shared
+        return super().is_cacheable(request) and not request.user.is_authenticated
+
+    def get(self, request, *args, **kwargs):
+        return self.cached_response(request, super().get, *args, **kwargs)
 
 class TeacherCourseListCreateAPIView(generics.ListCreateAPIView):
     """
@@ -83,6 +139,106 @@ class TeacherCourseRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAP
         # just can edit your own course
         return Course.objects.filter(owner=self.request.user)
 
+class TeacherCourseExportAPIView(APIView):
+    """
+    GET /api/courses/teacher/<pk>/export/
+    Downloads the course (modules, ordered contents and their media) as a ZIP
+    archive with a manifest.json. The archive is streamed while it is written.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        course = get_object_or_404(Course.objects.select_related('subject'), pk=pk, owner=request.user)
+        response = StreamingHttpResponse(stream_course_export(course), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{course.slug or course.pk}.zip"'
+        return response
+
+class TeacherCourseDuplicateAPIView(APIView):
+    """
+    POST /api/courses/teacher/<pk>/duplicate/
+    Copies the course with its modules and contents for a new run, under a new
+    slug and course code. Media is shared with the original, students,
+    reviews and chat history are not copied. Accepts an optional `title`.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk):
+        course = get_object_or_404(Course, pk=pk, owner=request.user)
+        clone = clone_course(course, owner=request.user, title=request.data.get('title'))
+        return Response(TeacherCourseSerializer(clone, context={'request': request}).data, status=status.HTTP_201_CREATED)
+
+class TeacherCourseAnalyticsAPIView(APIView):
+    """
+    GET /api/courses/teacher/<pk>/analytics/
+    Enrollments, content completions, reviews and chat messages per day over
+    the last `days` days (30 by default), the review distribution and the
+    completions per module. Read from the daily rollups only, which trail the
+    activity by a few minutes (`updated`).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    default_days = 30
+    max_days = 365
+
+    def get(self, request, pk):
+        course = get_object_or_404(Course, pk=pk, owner=request.user)
+        try:
+            days = max(1, min(int(request.query_params['days']), self.max_days))
+        except (KeyError, ValueError):
+            days = self.default_days
+        end = timezone.localdate()
+        return Response(course_analytics(course, end - timedelta(days=days - 1), end))
+
+class TeacherCourseImportAPIView(APIView):
+    """
+    POST /api/courses/teacher/import/
+    Imports a course export archive (manifest.json plus media) in the background,
+    as a new course or appended to one of the teacher's courses (`course`).
+    The archive is sent as the `archive` file or as the `upload_id` of a finished
+    chunked upload. Returns the job, its progress is read from the status endpoint.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        course = None
+        if request.data.get('course'):
+            course = get_object_or_404(Course, pk=request.data['course'], owner=request.user)
+
+        with transaction.atomic():
+            if request.FILES.get('archive'):
+                archive = default_storage.save(f'{IMPORT_FOLDER}/{uuid.uuid4().hex}.zip', request.FILES['archive'])
+            elif request.data.get('upload_id'):
+                try:
+                    upload_id = uuid.UUID(str(request.data['upload_id']))
+                except ValueError:
+                    return Response({"error": "Invalid upload_id."}, status=status.HTTP_400_BAD_REQUEST)
+                session = UploadSession.objects.select_for_update().filter(
+                    pk=upload_id, owner=request.user, purpose='file', status='complete'
+                ).first()
+                if session is None:
+                    return Response({"error": "Unknown or unfinished upload."}, status=status.HTTP_400_BAD_REQUEST)
+                archive = session.stored_name
+                session.status = 'used'
+                session.save(update_fields=['status', 'updated'])
+            else:
+                return Response({"error": "Send the archive or an upload_id."}, status=status.HTTP_400_BAD_REQUEST)
+
+            job = CourseImportJob.objects.create(owner=request.user, course=course, archive=archive)
+            job_id = job.pk
+            transaction.on_commit(lambda: import_course.delay(job_id))
+
+        return Response(CourseImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+class TeacherCourseImportStatusAPIView(generics.RetrieveAPIView):
+    """
+    GET /api/courses/teacher/import/<pk>/
+    Status and progress of one of the teacher's course imports.
+    """
+    serializer_class = CourseImportJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return CourseImportJob.objects.filter(owner=self.request.user)
+
 class TeacherModuleListCreateAPIView(generics.ListCreateAPIView):
     """
     GET, POST /api/courses/teacher/<course_pk>/modules/
@@ -96,7 +252,9 @@ class TeacherModuleListCreateAPIView(generics.ListCreateAPIView):
 
     def perform_create(self, serializer):
         course = get_object_or_404(Course, id=self.kwargs['course_pk'], owner=self.request.user)
-        serializer.save(course=course)
+        # atomic so OrderField can lock the course while appending
+        with transaction.atomic():
+            serializer.save(course=course)
 
 class TeacherContentCreateAPIView(APIView):
     """
@@ -119,26 +277,31 @@ class TeacherContentCreateAPIView(APIView):
             item_data['content'] = request.data.get('content')
         elif model_name == 'video':
             item_data['url'] = request.data.get('url')
-        elif model_name in ['image', 'file']:
-            item_data['file'] = request.FILES.get('file')
-            
-        item_instance = model_class.objects.create(**item_data)
-        Content.objects.create(module=module, item=item_instance)
-
-        course = module.course
-        students = course.students.all()
-        if students.exists():
-            notifications = [
-                Notification(
-                    recipient=student,
-                    title="New Course Material!",
-                    message=f"Teacher {request.user.username} just added a new {model_name} to '{course.title}'.",
-                    link=f"/student/course/{course.id}"
-                )
-                for student in students
-            ]
-            Notification.objects.bulk_create(notifications)
-        
+        elif model_name in ['image', 'file'] and request.FILES.get('file'):
+            uploaded = request.FILES['file']
+            # identical bytes uploaded to several courses are stored once
+            item_data['file'] = store_blob(uploaded, 'files' if model_name == 'file' else 'images', uploaded.name, owner=request.user)
+
+        # atomic so OrderField can lock the module while appending
+        with transaction.atomic():
+            if model_name in ['image', 'file'] and request.data.get('upload_id'):
+                # a file sent through the chunked upload protocol, already in storage
+                try:
+                    upload_id = uuid.UUID(str(request.data['upload_id']))
+                except ValueError:
+                    return Response({"error": "Invalid upload_id."}, status=status.HTTP_400_BAD_REQUEST)
+                session = UploadSession.objects.select_for_update().filter(
+                    pk=upload_id, owner=request.user, purpose=model_name, status='complete'
+                ).first()
+                if session is None:
+                    return Response({"error": "Unknown or unfinished upload."}, status=status.HTTP_400_BAD_REQUEST)
+                item_data['file'] = session.stored_name
+                session.status = 'used'
+                session.save(update_fields=['status', 'updated'])
+            item_instance = model_class.objects.create(**item_data)
+            # enrolled students are notified by courses.signals in a background task
+            Content.objects.create(module=module, item=item_instance)
+
         return Response({"message": f"{model_name.capitalize()} content added successfully."}, status=status.HTTP_201_CREATED)
 
 class TeacherContentDeleteAPIView(APIView):
@@ -158,10 +321,97 @@ class TeacherContentDeleteAPIView(APIView):
         content = get_object_or_404(Content, id=id, module__course__owner=request.user)
         if 'order' in request.data:
             content.order = request.data['order']
-            content.save()
+            with transaction.atomic():
+                content.save(update_fields=['order'])
+                # a single move also invalidates the version held by bulk reorder clients
+                Module.objects.filter(pk=content.module_id).update(order_version=F('order_version') + 1)
             return Response({"message": "Order updated."}, status=status.HTTP_200_OK)
         return Response({"error": "Order field required."}, status=status.HTTP_400_BAD_REQUEST)
 
+class BaseReorderAPIView(APIView):
+    """
+    Applies a complete new ordering of a parent's children in one transaction.
+    Expects {'order': [child ids in their new order], 'version': <order_version>}.
+    The version must match the parent's current order_version, otherwise the
+    ordering was changed by someone else in the meantime and 409 is returned.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    # subclasses set the models, the child field pointing to the parent, the lookup from
+    # the parent to the course owner and the parent attribute holding the course id
+    parent_model = None
+    child_model = None
+    parent_field = None
+    owner_field = None
+    course_id_field = None
+    # cached scopes invalidated on top of the course's own
+    extra_cache_scopes = []
+
+    def get_parent_queryset(self, request):
+        return self.parent_model.objects.filter(**{self.owner_field: request.user})
+
+    def get_children(self, parent):
+        return self.child_model.objects.filter(**{self.parent_field: parent})
+
+    def get_cache_scopes(self, parent):
+        return [course_scope(getattr(parent, self.course_id_field)), *self.extra_cache_scopes]
+
+    def put(self, request, pk):
+        serializer = ReorderSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ordered_ids = serializer.validated_data['order']
+        version = serializer.validated_data['version']
+
+        with transaction.atomic():
+            # lock the parent, concurrent OrderField appends wait for the reorder
+            parent = get_object_or_404(self.get_parent_queryset(request).select_for_update(), pk=pk)
+            children = list(self.get_children(parent))
+
+            if len(ordered_ids) != len(set(ordered_ids)) or set(ordered_ids) != {child.id for child in children}:
+                return Response({"error": "'order' must list every item exactly once."}, status=status.HTTP_400_BAD_REQUEST)
+
+            # compare-and-swap on the version, so two reorders based on the same version cannot both win
+            claimed = self.parent_model.objects.filter(pk=parent.pk, order_version=version).update(order_version=version + 1)
+            if not claimed:
+                return Response(
+                    {"error": "The ordering was changed by someone else.", "version": parent.order_version},
+                    status=status.HTTP_409_CONFLICT
+                )
+
+            position = {child_id: index for index, child_id in enumerate(ordered_ids)}
+            changed = []
+            for child in children:
+                if child.order != position[child.id]:
+                    child.order = position[child.id]
+                    changed.append(child)
+            self.child_model.objects.bulk_update(changed, ['order'])
+
+        # bulk_update sends no signals, invalidate the cached course pages here
+        bump_versions(self.get_cache_scopes(parent))
+        return Response({"message": "Order updated.", "version": version + 1}, status=status.HTTP_200_OK)
+
+class TeacherModuleReorderAPIView(BaseReorderAPIView):
+    """
+    PUT /api/courses/teacher/<pk>/modules/reorder/
+    Reorders all modules of a course in one request.
+    """
+    parent_model = Course
+    child_model = Module
+    parent_field = 'course'
+    owner_field = 'owner'
+    course_id_field = 'pk'
+    extra_cache_scopes = ['catalog']
+
+class TeacherContentReorderAPIView(BaseReorderAPIView):
+    """
+    PUT /api/courses/teacher/modules/<pk>/contents/reorder/
+    Reorders all contents of a module in one request.
+    """
+    parent_model = Module
+    child_model = Content
+    parent_field = 'module'
+    owner_field = 'course__owner'
+    course_id_field = 'course_id'
+
 class TeacherStudentListAPIView(generics.ListAPIView):
     """
     GET /api/courses/teacher/<course_pk>/students/?filter=blocked
@@ -169,16 +419,20 @@ class TeacherStudentListAPIView(generics.ListAPIView):
     """
     serializer_class = CourseStudentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    # enrollment time for students, account creation for the blocklist
+    cursor_timestamp_field = 'listed_at'
 
     def get_queryset(self):
         course = get_object_or_404(Course, id=self.kwargs['course_pk'], owner=self.request.user)
         filter_type = self.request.query_params.get('filter')
         
         if filter_type == 'blocked':
-            return course.blocked_students.all()
-        elif filter_type == 'teacher':
-            return course.students.filter(role='teacher')  # 使用我们修改后的 role 字段
-        return course.students.all()
+            return course.blocked_students.annotate(listed_at=F('date_joined'))
+        students = User.objects.filter(enrollments__course=course).annotate(listed_at=F('enrollments__date_joined'))
+        if filter_type == 'teacher':
+            return students.filter(role='teacher')  # 使用我们修改后的 role 字段
+        return students
 
 class TeacherStudentKickBlockAPIView(APIView):
     """
@@ -220,6 +474,16 @@ class AdminCourseListAPIView(generics.ListAPIView):
     def get_queryset(self):
         return Course.objects.select_related('owner', 'subject').annotate(student_count=Count('students')).order_by('-created')
 
+class AdminCatalogCacheStatsAPIView(APIView):
+    """
+    GET /api/courses/admin/cache-stats/
+    Hit/miss counters of the public catalog response cache.
+    """
+    permission_classes = [IsSiteAdminAPI]
+
+    def get(self, request):
+        return Response(cache_stats(), status=status.HTTP_200_OK)
+
 class AdminCourseDeleteAPIView(APIView):
     """
     DELETE /api/courses/admin/<course_id>/delete/
@@ -281,7 +545,7 @@ class MarkContentCompleteAPIView(APIView):
 
     def post(self, request, content_id):
         content = get_object_or_404(Content, id=content_id)
-        content.completed_users.add(request.user)
+        completion.mark(request.user, content)
         return Response({"message": "Content marked as completed."}, status=status.HTTP_200_OK)
 
 class CourseReviewCreateAPIView(APIView):
@@ -325,13 +589,24 @@ class TeacherModuleRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAP
     def get_queryset(self):
         return Module.objects.filter(course__owner=self.request.user)
 
+    def perform_update(self, serializer):
+        moved = 'order' in serializer.validated_data and serializer.validated_data['order'] != serializer.instance.order
+        with transaction.atomic():
+            module = serializer.save()
+            if moved:
+                # a single move also invalidates the version held by bulk reorder clients
+                Course.objects.filter(pk=module.course_id).update(order_version=F('order_version') + 1)
+
 class StudentEnrolledCoursesAPIView(generics.ListAPIView):
     """
     GET /api/courses/enrolled/
     Retrieves all courses the current student has enrolled in.
     """
-    serializer_class = CourseListSerializer
+    serializer_class = EnrolledCourseSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Course.objects.filter(students=self.request.user).distinct().order_by('-created')
\ No newline at end of file
+        courses = Course.objects.filter(students=self.request.user).distinct().order_by('-created')
+        # rows are only missing for enrollments older than the progress table
+        ensure(self.request.user.id, courses.values_list('id', flat=True))
+        return with_progress(courses, self.request.user)
\ No newline at end of file
@@ -22,12 +22,18 @@ export default function Navbar() {
   const [showLogoutModal, setShowLogoutModal] = useState(false);
   const [isMobileMenuOpen, setIsMobileMenuOpen] = useState(false);
 
+  // token the user and notifications were loaded for, later pages reuse them
+  const loadedToken = useRef(null);
+  // notification socket, new notifications are pushed instead of refetched
+  const notifSocket = useRef(null);
+
   useEffect(() => {
     // check token exists in local storage 
     const token = localStorage.getItem('access_token');
     setIsLoggedIn(!!token); 
     
-    if (token) {
+    if (token && token !== loadedToken.current) {
+      loadedToken.current = token;
       api.get('users/me/')
         .then(res => {
           setCurrentUser(res.data);
@@ -37,23 +43,75 @@ export default function Navbar() {
         })
         .catch(err => {
           console.error(err);
+          loadedToken.current = null;
           localStorage.removeItem('access_token');
           setIsLoggedIn(false);
         });
-    } else {
+    } else if (!token) {
+      loadedToken.current = null;
       setCurrentUser(null);
+      setNotifications([]);
     }
     
     // Close mobile menu automatically when navigating to a new page
     setIsMobileMenuOpen(false);
   }, [location.pathname]);
 
-  const handleDeleteNotification = async(e, notifId) => {
+  useEffect(() => {
+    if (!currentUser || currentUser.role === 'admin') return;
+    const isLocal = window.location.hostname === 'localhost' || window.location.hostname === '127.0.0.1';
+    const WS_BASE = isLocal ? 'ws://localhost:8000' : `ws://${window.location.hostname}:8000`;
+    let closed = false;
+    let retry = null;
+
+    const connect = (refetch) => {
+      // read on every attempt, the access token may have been refreshed meanwhile
+      const token = localStorage.getItem('access_token');
+      if (!token) return;
+      notifSocket.current = new WebSocket(`${WS_BASE}/ws/notifications/?token=${token}`);
+      // anything pushed while the socket was down is only in the list
+      notifSocket.current.onopen = () => { if (refetch) fetchNotifications(); };
+      notifSocket.current.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        const pushed = (data.notifications || []).map(n => ({ ...n, is_read: false }));
+        if (data.count > pushed.length) {
+          // a bigger batch only sends its newest items
+          fetchNotifications();
+          return;
+        }
+        setNotifications(prev => {
+          const known = new Set(prev.map(notifKey));
+          return [...pushed.filter(n => !known.has(notifKey(n))).reverse(), ...prev];
+        });
+      };
+      notifSocket.current.onclose = () => {
+        if (!closed) retry = setTimeout(() => connect(true), 5000);
+      };
+    };
+    connect(false);
+
+    return () => {
+      closed = true;
+      clearTimeout(retry);
+      if (notifSocket.current) notifSocket.current.close();
+    };
+  }, [currentUser?.id]);
+
+  // personal notifications and course announcements have separate id spaces
+  const isBroadcast = (notif) => notif.kind === 'broadcast';
+  const notifKey = (notif) => `${notif.kind}-${notif.id}`;
+
+  const handleDeleteNotification = async(e, notif) => {
     e.preventDefault();
     e.stopPropagation();
     try{
-      await api.delete(`users/notifications/${notifId}/`);
-      setNotifications(prev => prev.filter(n => n.id !== notifId));
+      if (isBroadcast(notif)) {
+        // announcements are shared by the course, they are only dismissed for this user
+        await api.post(`users/notifications/announcements/${notif.id}/dismiss/`);
+      } else {
+        await api.delete(`users/notifications/${notif.id}/`);
+      }
+      setNotifications(prev => prev.filter(n => notifKey(n) !== notifKey(notif)));
     }catch(error){
       console.error("Failed to delete notification", error);
     }
@@ -69,10 +127,15 @@ export default function Navbar() {
     }
   };
   
-  const handleMarkAsRead = async (notifId, link) => {
+  const handleMarkAsRead = async (notif) => {
+    const link = notif.link;
     try {
-      await api.post(`users/notifications/${notifId}/mark_read/`);
-      fetchNotifications();
+      if (isBroadcast(notif)) {
+        await api.post(`users/notifications/announcements/${notif.id}/mark_read/`);
+      } else {
+        await api.post(`users/notifications/${notif.id}/mark_read/`);
+      }
+      setNotifications(prev => prev.map(n => notifKey(n) === notifKey(notif) ? { ...n, is_read: true } : n));
       setShowDropdown(false);
       if (link) navigate(link);
     } catch (err) {
@@ -83,7 +146,7 @@ export default function Navbar() {
   const handleMarkAllRead = async () => {
     try {
       await api.post('users/notifications/mark_all_read/');
-      fetchNotifications();
+      setNotifications(prev => prev.map(n => ({ ...n, is_read: true })));
     } catch (err) {
       console.error(err);
     }
@@ -104,8 +167,10 @@ export default function Navbar() {
   const handleLogout = () => {
     localStorage.removeItem('access_token');
     localStorage.removeItem('refresh_token');
+    loadedToken.current = null;
     setIsLoggedIn(false);
     setCurrentUser(null);
+    setNotifications([]);
     setShowLogoutModal(false);
     navigate('/login');
   };
@@ -138,8 +203,8 @@ export default function Navbar() {
               <ul className="divide-y divide-slate-50">
                 {notifications.map((notif) => (
                   <li 
-                    key={notif.id} 
-                    onClick={() => handleMarkAsRead(notif.id, notif.link)} 
+                    key={notifKey(notif)} 
+                    onClick={() => handleMarkAsRead(notif)} 
                     className={`group relative p-4 hover:bg-slate-50 cursor-pointer transition-colors ${!notif.is_read ? 'bg-indigo-50/30' : ''}`}
                   >
                     <div className="flex justify-between items-start mb-1 pr-8">
@@ -149,7 +214,7 @@ export default function Navbar() {
                     <p className="text-xs text-slate-500 line-clamp-2">{notif.message}</p>
                     <span className="text-[10px] text-slate-400 mt-2 block">{new Date(notif.created_at).toLocaleString()}</span>
                     <button
-                      onClick={(e) => handleDeleteNotification(e, notif.id)}
+                      onClick={(e) => handleDeleteNotification(e, notif)}
                       className="absolute top-3 right-3 p-1.5 text-slate-400 hover:text-red-500 hover:bg-red-50 rounded-md transition-all cursor-pointer"
                       title="Delete notification"
                     >
@@ -3,8 +3,7 @@ export const getMediaUrl = (path) => {
     const BASE_URL = import.meta.env.VITE_BASE_URL || 'http://localhost:8000';
 
     if (!path) return '';
-    // if its already full URL 
-    if (path.startsWith('http')) return path;
-    // else, prefix it with backend address
-    return `${BASE_URL}${path}`;
-};
\ No newline at end of file
+    // course files and chat attachments come from the API already signed with a
+    // short-lived token for that one file, public images need none
+    return path.startsWith('http') ? path : `${BASE_URL}${path}`;
+};
@@ -0,0 +1,45 @@
+'''
+completion bitmaps: bit n of a bitmap is set when the content with ordinal n
+is completed. byte n // 8, least significant bit first. bitmaps only grow as far
+as their highest set bit, a missing byte reads as zeros
+'''
+
+
+def as_bytes(bitmap):
+    # BinaryField values come back as memoryview on some backends
+    return bytes(bitmap or b'')
+
+
+def test_bit(bitmap, index):
+    bitmap = as_bytes(bitmap)
+    byte = index >> 3
+    return byte < len(bitmap) and bool(bitmap[byte] & (1 << (index & 7)))
+
+
+def set_bit(bitmap, index):
+    bitmap = bytearray(as_bytes(bitmap))
+    byte = index >> 3
+    if byte >= len(bitmap):
+        bitmap.extend(bytes(byte + 1 - len(bitmap)))
+    bitmap[byte] |= 1 << (index & 7)
+    return bytes(bitmap)
+
+
+def clear_bit(bitmap, index):
+    bitmap = bytearray(as_bytes(bitmap))
+    byte = index >> 3
+    if byte < len(bitmap):
+        bitmap[byte] &= ~(1 << (index & 7)) & 0xFF
+    # trailing zero bytes carry nothing
+    return bytes(bitmap).rstrip(b'\0')
+
+
+def popcount(bitmap):
+    return int.from_bytes(as_bytes(bitmap), 'little').bit_count()
+
+
+def from_indexes(indexes):
+    value = 0
+    for index in indexes:
+        value |= 1 << index
+    return value.to_bytes((value.bit_length() + 7) // 8, 'little')
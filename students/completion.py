@@ -0,0 +1,129 @@
+import time
+import logging
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from courses.models import Content
+from config.batching import chunked
+from users import counters
+from .models import UserContentProgress, BackfillCheckpoint
+
+logger = logging.getLogger(__name__)
+
+# UserContentProgress is the canonical record of completed contents.
+# Content.completed_users holds the completions made before it was, until
+# backfill_completions copied them and COMPLETION_SOURCE is switched to 'canonical'
+BACKFILL_NAME = 'completions'
+
+
+def legacy_in_use():
+    ''' True while Content.completed_users must still be read and written '''
+    return settings.COMPLETION_SOURCE != 'canonical'
+
+
+def legacy_marks():
+    ''' the Content.completed_users rows, empty once the cutover is done '''
+    marks = Content.completed_users.through.objects.all()
+    return marks if legacy_in_use() else marks.none()
+
+
+def record(user, content, completed, changed_at=None):
+    '''
+    set the completion state of a content, last writer wins like students.sync:
+    a change older than the one recorded is ignored, and an unmark leaves a
+    completed=False tombstone so an older mark replayed by a sync cannot
+    revive the content. written without the model signals, the counters and
+    progress rows follow the change here. returns True when the state changed
+    '''
+    from . import progress  # progress reads legacy_marks from this module
+    changed_at = changed_at or timezone.now()
+    Marked = Content.completed_users.through
+    with transaction.atomic():
+        row = UserContentProgress.objects.select_for_update().filter(student=user, content=content).first()
+        if row is not None and row.changed_at >= changed_at:
+            return False
+        was_completed = (row is not None and row.completed) or legacy_marks().filter(customuser=user, content=content).exists()
+        # rolled_up is reset to False, see courses.analytics
+        UserContentProgress.objects.bulk_create(
+            [UserContentProgress(student=user, content=content, completed=completed, changed_at=changed_at)],
+            update_conflicts=True, unique_fields=['student', 'content'], update_fields=['completed', 'changed_at', 'rolled_up'],
+        )
+        if legacy_in_use():
+            # dual write until the cutover
+            if completed:
+                Marked.objects.bulk_create([Marked(customuser=user, content=content)], ignore_conflicts=True)
+            else:
+                Marked.objects.filter(customuser=user, content=content).delete()
+        if was_completed == completed:
+            return False
+        counters.add([user.id], 'completed_contents', 1 if completed else -1)
+        progress.completion_changed(user.id, content.id, completed)
+    return True
+
+
+def mark(user, content):
+    '''
+    record a content as completed. returns False when it already was
+    '''
+    return record(user, content, True)
+
+
+def unmark(user, content):
+    '''
+    record a content as not completed. returns False when it was not completed
+    '''
+    return record(user, content, False)
+
+
+def toggle(user, content):
+    '''
+    tick the content, or untick it when it was completed, as one change.
+    returns the new state
+    '''
+    with transaction.atomic():
+        row = UserContentProgress.objects.select_for_update().filter(student=user, content=content).first()
+        completed = (row is not None and row.completed) or legacy_marks().filter(customuser=user, content=content).exists()
+        record(user, content, not completed)
+    return not completed
+
+
+def backfill(chunk_size=1000, pause=0.0, max_chunks=None, restart=False, log=None):
+    '''
+    copy Content.completed_users rows into UserContentProgress, in id order.
+    every chunk is its own short transaction that also moves the checkpoint,
+    so the copy can run on a live database, be stopped at any time and resumed.
+    pause sleeps between chunks to leave room for the regular traffic.
+    rows already in UserContentProgress (including synced unmarks) are kept.
+    returns the checkpoint
+    '''
+    checkpoint, _ = BackfillCheckpoint.objects.get_or_create(name=BACKFILL_NAME)
+    if restart:
+        checkpoint.position, checkpoint.processed, checkpoint.finished = 0, 0, False
+        checkpoint.save()
+
+    marks = Content.completed_users.through.objects.filter(id__gt=checkpoint.position).order_by('id')
+    rows = marks.values_list('id', 'customuser_id', 'content_id').iterator(chunk_size=chunk_size)
+    chunks = 0
+    for chunk in chunked(rows, chunk_size):
+        now = timezone.now()
+        with transaction.atomic():
+            # bulk_create skips the signals, the counters already count these completions
+            UserContentProgress.objects.bulk_create(
+                [UserContentProgress(student_id=user_id, content_id=content_id, changed_at=now) for _, user_id, content_id in chunk],
+                ignore_conflicts=True,
+            )
+            checkpoint.position = chunk[-1][0]
+            checkpoint.processed += len(chunk)
+            checkpoint.save(update_fields=['position', 'processed', 'updated'])
+        chunks += 1
+        if log:
+            log(f"Copied up to row {checkpoint.position}.")
+        if max_chunks and chunks >= max_chunks:
+            return checkpoint
+        if pause:
+            time.sleep(pause)
+
+    checkpoint.finished = True
+    checkpoint.save(update_fields=['finished', 'updated'])
+    logger.info(f"Completion backfill finished at row {checkpoint.position}.")
+    return checkpoint
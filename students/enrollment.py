@@ -0,0 +1,122 @@
+import csv
+import io
+import logging
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef
+from users.models import Notification
+from config.batching import chunked
+from users import counters
+from .models import Enrollment
+from . import progress
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# users looked up and enrolled per round trip
+ENROLLMENT_BATCH_SIZE = 1000
+
+
+def parse_identifiers(text):
+    '''
+    read user ids, usernames or emails from CSV text, the first column of every
+    row. a header row (id, user, username, email) is skipped
+    '''
+    identifiers = []
+    for row in csv.reader(io.StringIO(text)):
+        value = row[0].strip() if row else ''
+        if value and value.lower() not in ('id', 'user', 'user_id', 'username', 'email'):
+            identifiers.append(value)
+    return identifiers
+
+
+def resolve_user_ids(identifiers):
+    '''
+    map ids, usernames and emails to user ids with one query per batch and kind.
+    returns (user ids in input order without duplicates, identifiers matching nobody)
+    '''
+    found = {}
+    for batch in chunked(identifiers, ENROLLMENT_BATCH_SIZE):
+        ids = [int(value) for value in batch if str(value).isdigit()]
+        emails = [value for value in batch if '@' in str(value)]
+        usernames = [value for value in batch if not str(value).isdigit() and '@' not in str(value)]
+        for pk in User.objects.filter(pk__in=ids).values_list('pk', flat=True):
+            found[str(pk)] = pk
+        for pk, email in User.objects.filter(email__in=emails).values_list('pk', 'email'):
+            found[email] = pk
+        for pk, username in User.objects.filter(username__in=usernames).values_list('pk', 'username'):
+            found[username] = pk
+
+    user_ids, unknown = [], []
+    for value in identifiers:
+        pk = found.get(str(value))
+        if pk is None:
+            unknown.append(str(value))
+        elif pk not in user_ids:
+            user_ids.append(pk)
+    return user_ids, unknown
+
+
+def insert_enrollments(course, user_ids):
+    '''
+    insert the enrollments of users found not enrolled, with one bulk_create.
+    when some of them enrolled concurrently in the meantime, the insert fails on
+    the unique constraint and is retried without them, so the counters are only
+    moved for rows actually inserted. returns the ids of the enrolled users
+    '''
+    while user_ids:
+        try:
+            with transaction.atomic():
+                Enrollment.objects.bulk_create([Enrollment(course=course, user_id=pk) for pk in user_ids])
+            return user_ids
+        except IntegrityError:
+            taken = set(Enrollment.objects.filter(course=course, user_id__in=user_ids).values_list('user_id', flat=True))
+            if not taken:
+                raise
+            user_ids = [pk for pk in user_ids if pk not in taken]
+    return user_ids
+
+
+def bulk_enroll(course, user_ids):
+    '''
+    enroll many users in a course at once. per batch, one query sorts the users
+    into already enrolled, blocked and new, and the new ones are inserted with one
+    bulk_create. bulk_create skips the enrollment signals: the course owner gets a
+    single summary notification for the whole import instead of one per student.
+    returns the number of users enrolled, already enrolled and blocked
+    '''
+    enrolled = Enrollment.objects.filter(course=course, user=OuterRef('pk'))
+    blocked = course.blocked_students.through.objects.filter(course=course, customuser=OuterRef('pk'))
+    result = {'enrolled': 0, 'already_enrolled': 0, 'blocked': 0}
+
+    with transaction.atomic():
+        for batch in chunked(user_ids, ENROLLMENT_BATCH_SIZE):
+            new_ids = []
+            rows = User.objects.filter(pk__in=batch).annotate(
+                is_enrolled=Exists(enrolled), is_blocked=Exists(blocked),
+            ).values_list('pk', 'is_enrolled', 'is_blocked')
+            for pk, is_enrolled, is_blocked in rows:
+                if is_blocked:
+                    result['blocked'] += 1
+                elif is_enrolled:
+                    result['already_enrolled'] += 1
+                else:
+                    new_ids.append(pk)
+
+            inserted = insert_enrollments(course, new_ids)
+            # enrolled concurrently since the check
+            result['already_enrolled'] += len(new_ids) - len(inserted)
+            counters.add(inserted, 'enrolled_courses')
+            progress.refresh(course.pk, inserted)
+            result['enrolled'] += len(inserted)
+
+        if result['enrolled']:
+            Notification.objects.create(
+                recipient=course.owner,
+                title=f"New Enrollments: {course.title}",
+                message=f"{result['enrolled']} students have been enrolled in your course.",
+                link=f"/courses/{course.id}/students",
+            )
+    logger.info(f"Bulk enrolled {result['enrolled']} users in course {course.pk}.")
+    return result
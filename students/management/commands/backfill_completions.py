@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from students.completion import backfill
+
+
+class Command(BaseCommand):
+    help = ('Copy the completions recorded in Content.completed_users into UserContentProgress, '
+            'in small resumable chunks that are safe to run on a live database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='rows copied per transaction')
+        parser.add_argument('--pause', type=float, default=0.1, help='seconds to sleep between chunks')
+        parser.add_argument('--max-chunks', type=int, help='stop after this many chunks, the next run resumes')
+        parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and start over')
+
+    def handle(self, *args, **options):
+        checkpoint = backfill(
+            chunk_size=options['chunk_size'],
+            pause=options['pause'],
+            max_chunks=options['max_chunks'],
+            restart=options['restart'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        if not checkpoint.finished:
+            self.stdout.write(f'Stopped at row {checkpoint.position} ({checkpoint.processed} rows so far), run again to continue.')
+            return
+        self.stdout.write(self.style.SUCCESS(f'Backfill finished, {checkpoint.processed} rows processed.'))
+        if settings.COMPLETION_SOURCE != 'canonical':
+            self.stdout.write("Set COMPLETION_SOURCE=canonical to read and write UserContentProgress only.")
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from courses.models import Course
+from students.enrollment import parse_identifiers, resolve_user_ids, bulk_enroll
+
+
+class Command(BaseCommand):
+    help = 'Enroll many users in a course from a CSV file and/or a list of user ids, usernames or emails'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_id', type=int)
+        parser.add_argument('users', nargs='*', help='user ids, usernames or emails')
+        parser.add_argument('--csv', help='CSV file, the first column holds the users')
+
+    def handle(self, *args, **options):
+        course = Course.objects.filter(pk=options['course_id']).first()
+        if course is None:
+            raise CommandError(f"Course {options['course_id']} does not exist.")
+        identifiers = list(options['users'])
+        if options['csv']:
+            with open(options['csv'], encoding='utf-8-sig') as f:
+                identifiers += parse_identifiers(f.read())
+        if not identifiers:
+            raise CommandError('Give users or a --csv file.')
+
+        user_ids, unknown = resolve_user_ids(identifiers)
+        result = bulk_enroll(course, user_ids)
+        for value in unknown:
+            self.stderr.write(f'Unknown user: {value}')
+        self.stdout.write(self.style.SUCCESS(
+            f"Enrolled {result['enrolled']} user(s), {result['already_enrolled']} already enrolled, "
+            f"{result['blocked']} blocked, {len(unknown)} unknown."
+        ))
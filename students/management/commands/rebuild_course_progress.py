@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from courses.models import Course
+from students.progress import refresh
+
+
+class Command(BaseCommand):
+    help = 'Recount the stored per-student course progress from the completion tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='*', type=int, help='only rebuild these courses (default: all)')
+
+    def handle(self, *args, **options):
+        course_ids = options['course_ids'] or Course.objects.values_list('pk', flat=True)
+        rebuilt = 0
+        for course_id in course_ids:
+            refresh(course_id)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the progress of {rebuilt} course(s).'))
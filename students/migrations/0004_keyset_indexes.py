@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0003_remove_enrollment_is_blocked'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['course', '-date_joined'], name='enrollment_course_joined_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-17 21:05
+
+from collections import defaultdict
+from django.db import migrations, models
+
+
+def build_bitmaps(apps, schema_editor):
+    '''
+    set the bits of every existing progress row from the two completion tables
+    (courses.Content.completed_users and UserContentProgress), course by course
+    '''
+    Content = apps.get_model('courses', 'Content')
+    CourseProgress = apps.get_model('students', 'CourseProgress')
+    UserContentProgress = apps.get_model('students', 'UserContentProgress')
+    Marked = Content.completed_users.through
+
+    course_ids = CourseProgress.objects.values_list('course_id', flat=True).distinct()
+    for course_id in list(course_ids):
+        ordinals = dict(Content.objects.filter(module__course_id=course_id).values_list('id', 'ordinal'))
+        bits = defaultdict(int)
+        pairs = list(Marked.objects.filter(content__module__course_id=course_id).values_list('customuser_id', 'content_id'))
+        pairs += UserContentProgress.objects.filter(content__module__course_id=course_id).values_list('student_id', 'content_id')
+        for student_id, content_id in pairs:
+            bits[student_id] |= 1 << ordinals[content_id]
+
+        rows = list(CourseProgress.objects.filter(course_id=course_id))
+        for row in rows:
+            value = bits[row.student_id]
+            row.bitmap = value.to_bytes((value.bit_length() + 7) // 8, 'little')
+            row.completed = value.bit_count()
+            row.total = len(ordinals)
+        CourseProgress.objects.bulk_update(rows, ['bitmap', 'completed', 'total'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_content_ordinals'),
+        ('students', '0005_course_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='courseprogress',
+            name='bitmap',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.RunPython(build_bitmaps, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-17 20:49
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def changed_when_created(apps, schema_editor):
+    UserContentProgress = apps.get_model('students', 'UserContentProgress')
+    UserContentProgress.objects.update(changed_at=F('created'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0006_completion_bitmaps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercontentprogress',
+            name='changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='usercontentprogress',
+            name='completed',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.RunPython(changed_when_created, migrations.RunPython.noop),
+    ]
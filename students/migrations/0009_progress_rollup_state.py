@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-17 21:22
+
+from django.db import migrations, models
+
+
+def reset_completion_rollups(apps, schema_editor):
+    '''
+    completions were rolled up by creation date past an id watermark, every
+    row is now flagged for the rollup, which recounts them by changed_at
+    '''
+    apps.get_model('courses', 'CourseDailyStats').objects.update(completions=0)
+    apps.get_model('courses', 'ModuleDailyStats').objects.all().delete()
+    apps.get_model('courses', 'RollupWatermark').objects.filter(source='completions').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_analytics_rollups'),
+        ('students', '0008_backfill_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercontentprogress',
+            name='counted_on',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='usercontentprogress',
+            name='rolled_up',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='usercontentprogress',
+            index=models.Index(condition=models.Q(('rolled_up', False)), fields=['id'], name='progress_not_rolled_up_idx'),
+        ),
+        migrations.RunPython(reset_completion_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 22:31
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0009_progress_rollup_state'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='courseprogress',
+            name='bitmap',
+        ),
+    ]
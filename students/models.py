@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from courses.models import Content # used for track progress
 
 # Create your models here.
@@ -18,6 +19,10 @@ class Enrollment(models.Model):
 
     class Meta:
         unique_together = ('user', 'course') # ensure user only enroll a course once
+        indexes = [
+            # keyset pagination of a course's students by enrollment time
+            models.Index(fields=['course', '-date_joined'], name='enrollment_course_joined_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} -> {self.course.title}"
@@ -32,10 +37,58 @@ class UserContentProgress(models.Model):
     content = models.ForeignKey(Content,related_name='student_progress',on_delete=models.CASCADE)
     # time of completed this content
     created = models.DateTimeField(auto_now_add=True)
+    # False for a content unmarked through the progress sync, kept (instead of deleted)
+    # so an older offline mark cannot bring it back
+    completed = models.BooleanField(default=True)
+    # when the student last marked/unmarked it, by the client clock for synced changes.
+    # the newest change wins (see students.sync)
+    changed_at = models.DateTimeField(default=timezone.now)
+    # teacher analytics (courses.analytics): every write clears rolled_up, the rollup
+    # moves the completion to the day of changed_at and records it in counted_on
+    rolled_up = models.BooleanField(default=False)
+    counted_on = models.DateField(null=True, blank=True)
 
     class Meta:
         unique_together = ['student', 'content']
         ordering = ['-created']
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(rolled_up=False), name='progress_not_rolled_up_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.student.username} completed {self.content.id}"
\ No newline at end of file
+        return f"{self.student.username} completed {self.content.id}"
+class CourseProgress(models.Model):
+    '''
+    running completion totals of one student in one course, kept up to date by
+    students.signals on every mark/unmark and content create/delete, so progress
+    bars never count completions on read
+    '''
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='course_progress', on_delete=models.CASCADE)
+    course = models.ForeignKey('courses.Course', related_name='student_progress', on_delete=models.CASCADE)
+    # distinct contents of the course the student completed
+    completed = models.PositiveIntegerField(default=0)
+    # contents in the course
+    total = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['student', 'course']
+
+    def __str__(self):
+        return f"{self.student.username}: {self.completed}/{self.total} in {self.course.title}"
+
+class BackfillCheckpoint(models.Model):
+    '''
+    progress of a resumable data backfill (e.g. backfill_completions):
+    the last source row copied, so an interrupted run continues where it stopped
+    '''
+    name = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0)
+    # source rows handled so far
+    processed = models.BigIntegerField(default=0)
+    finished = models.BooleanField(default=False)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at {self.position}{' (finished)' if self.finished else ''}"
+
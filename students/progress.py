@@ -0,0 +1,161 @@
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from courses.models import Content
+from .models import CourseProgress, Enrollment, UserContentProgress
+from .completion import legacy_marks
+from . import bitsets
+
+
+def completed_pairs(course_id, student_ids=None):
+    '''
+    {student id: set of completed content ids} in a course, from
+    UserContentProgress and, until the cutover, Content.completed_users
+    '''
+    marked = legacy_marks().filter(content__module__course_id=course_id)
+    progressed = UserContentProgress.objects.filter(content__module__course_id=course_id, completed=True)
+    if student_ids is not None:
+        marked = marked.filter(customuser_id__in=student_ids)
+        progressed = progressed.filter(student_id__in=student_ids)
+    done = defaultdict(set)
+    for student_id, content_id in marked.values_list('customuser_id', 'content_id'):
+        done[student_id].add(content_id)
+    for student_id, content_id in progressed.values_list('student_id', 'content_id'):
+        done[student_id].add(content_id)
+    return done
+
+
+def build_bitmaps(course_id, student_ids):
+    '''
+    completion bitmaps of some students in a course rebuilt from the completion
+    tables, and the number of contents in the course
+    '''
+    ordinals = dict(Content.objects.filter(module__course_id=course_id).values_list('id', 'ordinal'))
+    done = completed_pairs(course_id, student_ids)
+    bitmaps = {
+        student_id: bitsets.from_indexes(ordinals[content_id] for content_id in done[student_id] if content_id in ordinals)
+        for student_id in student_ids
+    }
+    return bitmaps, len(ordinals)
+
+
+def bitmap_key(student_id, course_id):
+    return f'progress:bitmap:{course_id}:{student_id}'
+
+
+def forget_bitmaps(course_id, student_ids):
+    '''
+    drop cached bitmaps now and again once the current transaction commits,
+    a read in between may have cached the rows from before the change
+    '''
+    keys = [bitmap_key(student_id, course_id) for student_id in student_ids]
+    if keys:
+        caches['default'].delete_many(keys)
+        transaction.on_commit(lambda: caches['default'].delete_many(keys))
+
+
+def refresh(course_id, student_ids=None):
+    '''
+    recount the progress rows of a course (or some of its students) from the
+    completion tables, creating the missing ones
+    '''
+    if student_ids is None:
+        student_ids = set(Enrollment.objects.filter(course_id=course_id).values_list('user_id', flat=True))
+        student_ids |= set(CourseProgress.objects.filter(course_id=course_id).values_list('student_id', flat=True))
+    student_ids = list(student_ids)
+    if not student_ids:
+        return
+    bitmaps, total = build_bitmaps(course_id, student_ids)
+    rows = [
+        CourseProgress(student_id=student_id, course_id=course_id, completed=bitsets.popcount(bitmap), total=total)
+        for student_id, bitmap in bitmaps.items()
+    ]
+    CourseProgress.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['student', 'course'], update_fields=['completed', 'total', 'updated'],
+    )
+    forget_bitmaps(course_id, student_ids)
+
+
+def ensure(student_id, course_ids):
+    ''' create the missing progress rows of a student, one course at a time '''
+    existing = set(CourseProgress.objects.filter(student_id=student_id, course_id__in=course_ids).values_list('course_id', flat=True))
+    for course_id in set(course_ids) - existing:
+        refresh(course_id, [student_id])
+
+
+def completion_changed(student_id, content_id, completed):
+    ''' a content became completed or not completed for a student '''
+    course_id = Content.objects.filter(pk=content_id).values_list('module__course_id', flat=True).first()
+    if course_id is None:
+        return
+    CourseProgress.objects.filter(student_id=student_id, course_id=course_id).update(
+        completed=F('completed') + (1 if completed else -1)
+    )
+    forget_bitmaps(course_id, [student_id])
+
+
+def content_added(course_id, count=1):
+    # one UPDATE for every student of the course, a new ordinal has no bit set yet
+    CourseProgress.objects.filter(course_id=course_id).update(total=F('total') + count)
+
+
+def content_removed(content):
+    '''
+    a content is about to be deleted: it leaves the total of every student of
+    its course and the completed count of those who completed it
+    '''
+    course_id = content.module.course_id
+    completers = set(legacy_marks().filter(content=content).values_list('customuser_id', flat=True))
+    completers |= set(UserContentProgress.objects.filter(content=content, completed=True).values_list('student_id', flat=True))
+    rows = CourseProgress.objects.filter(course_id=course_id)
+    rows.filter(student_id__in=completers).update(completed=F('completed') - 1)
+    rows.update(total=F('total') - 1)
+    # the ordinal is never reused, a stale bit is never read again
+    forget_bitmaps(course_id, completers)
+
+
+def completion_bitmap(student_id, course_id):
+    '''
+    the completion bitmap of a student in a course, a read cache of the
+    completion rows: one cache read, rebuilt from the rows when missing.
+    the rows stay the only store, the bitmap adds nothing to the database
+    '''
+    cache = caches['default']
+    key = bitmap_key(student_id, course_id)
+    bitmap = cache.get(key)
+    if bitmap is None:
+        bitmaps, _ = build_bitmaps(course_id, [student_id])
+        bitmap = bitsets.as_bytes(bitmaps[student_id])
+        cache.set(key, bitmap, settings.PROGRESS_BITMAP_CACHE_TIMEOUT)
+    return bitmap
+
+
+def completed_among(student_id, course_id, contents):
+    ''' ids of the given contents (of one course) the student completed '''
+    bitmap = completion_bitmap(student_id, course_id)
+    return {content.pk for content in contents if bitsets.test_bit(bitmap, content.ordinal)}
+
+
+def with_progress(queryset, user):
+    '''
+    annotate courses with the stored progress of user (progress_completed and
+    progress_total), a join on the progress rows rather than a count
+    '''
+    rows = CourseProgress.objects.filter(student=user, course=OuterRef('pk'))
+    return queryset.annotate(
+        progress_completed=Subquery(rows.values('completed')[:1]),
+        progress_total=Subquery(rows.values('total')[:1]),
+    )
+
+
+def progress_summary(course):
+    ''' serialized progress of a course annotated by with_progress '''
+    completed = getattr(course, 'progress_completed', None) or 0
+    total = getattr(course, 'progress_total', None) or 0
+    return {
+        'completed': completed,
+        'total': total,
+        'percent': round(100 * completed / total) if total else 0,
+    }
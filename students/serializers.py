@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from courses.models import Course, CourseReview, Module, Content
 from .models import Enrollment, UserContentProgress
+from .progress import progress_summary
+from .sync import MAX_SYNC_OPERATIONS
 
 class CourseReviewSerializer(serializers.ModelSerializer):
     """
@@ -19,10 +21,15 @@ class StudentCourseListSerializer(serializers.ModelSerializer):
     """
     owner_name = serializers.ReadOnlyField(source='owner.username')
     subject_title = serializers.ReadOnlyField(source='subject.title')
+    # stored totals annotated by students.progress.with_progress
+    progress = serializers.SerializerMethodField()
 
     class Meta:
         model = Course
-        fields = ['id', 'title', 'slug', 'course_code', 'subject_title', 'owner_name', 'overview']
+        fields = ['id', 'title', 'slug', 'course_code', 'subject_title', 'owner_name', 'overview', 'progress']
+
+    def get_progress(self, obj) -> dict:
+        return progress_summary(obj)
 
 class ModuleInlineSerializer(serializers.ModelSerializer):
     """
@@ -49,3 +56,17 @@ class StudentCourseDetailSerializer(serializers.ModelSerializer):
             'id', 'title', 'slug', 'course_code', 'subject_title', 
             'owner_name', 'overview', 'created', 'modules', 'reviews'
         ]
+
+class ProgressOperationSerializer(serializers.Serializer):
+    """
+    one queued mark/unmark of the progress sync
+    """
+    content_id = serializers.IntegerField(min_value=1)
+    completed = serializers.BooleanField()
+    client_timestamp = serializers.DateTimeField()
+
+class ProgressSyncSerializer(serializers.Serializer):
+    """
+    a batch of progress changes made offline or in quick succession
+    """
+    operations = ProgressOperationSerializer(many=True, allow_empty=False, max_length=MAX_SYNC_OPERATIONS)
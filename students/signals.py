@@ -1,7 +1,12 @@
-from django.db.models.signals import m2m_changed
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from courses.models import Course
+from courses.models import Course, Module, Content
 from users.models import Notification
+from users.signals import completed_elsewhere
+from users import counters, push
+from .models import UserContentProgress
+from . import progress
 import logging
 
 # set a logger to current file
@@ -37,8 +42,62 @@ def student_enrollment_notification(sender, instance, action, model, pk_set, **k
                 )
             # use bulk_create to enhance database scalability
             if notifications_to_create:
-                Notification.objects.bulk_create(notifications_to_create)
+                created = Notification.objects.bulk_create(notifications_to_create)
+                push.push_to_users(created)
+                counters.add([course.owner_id], 'unread_notifications', len(notifications_to_create))
                 logger.info(f'Successfully bulk created {len(notifications_to_create)} notifications ')
 
         except Exception as e:
-            logger.error(f"Error in student_enrollment_notification signal: {e}", exc_info=True)
\ No newline at end of file
+            logger.error(f"Error in student_enrollment_notification signal: {e}", exc_info=True)
+
+
+@receiver(m2m_changed, sender=Course.students.through)
+def create_course_progress(sender, instance, action, reverse, pk_set, **kwargs):
+    '''
+    Starts the progress row of newly enrolled students
+    '''
+    if action != 'post_add' or not pk_set:
+        return
+    if reverse:
+        progress.ensure(instance.pk, pk_set)
+    else:
+        progress.refresh(instance.pk, pk_set)
+
+
+@receiver(post_save, sender=UserContentProgress)
+def progress_marked(sender, instance, created, **kwargs):
+    if created and instance.completed and not completed_elsewhere(UserContentProgress, instance.student_id, instance.content_id):
+        progress.completion_changed(instance.student_id, instance.content_id, True)
+
+
+@receiver(post_delete, sender=UserContentProgress)
+def progress_unmarked(sender, instance, origin=None, **kwargs):
+    # rows deleted along with their content are handled by content_deleted
+    deleted_directly = isinstance(origin, UserContentProgress) or (
+        isinstance(origin, QuerySet) and origin.model is UserContentProgress
+    )
+    if deleted_directly and instance.completed and not completed_elsewhere(UserContentProgress, instance.student_id, instance.content_id):
+        progress.completion_changed(instance.student_id, instance.content_id, False)
+
+
+@receiver(m2m_changed, sender=Content.completed_users.through)
+def progress_completed_users(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+    completed = action == 'post_add'
+    for pk in pk_set:
+        user_id, content_id = (instance.pk, pk) if reverse else (pk, instance.pk)
+        # a content counts once, whichever table marks or still marks it
+        if not completed_elsewhere(Content, user_id, content_id):
+            progress.completion_changed(user_id, content_id, completed)
+
+
+@receiver(post_save, sender=Content)
+def progress_content_created(sender, instance, created, **kwargs):
+    if created:
+        progress.content_added(Module.objects.filter(pk=instance.module_id).values_list('course_id', flat=True).first())
+
+
+@receiver(pre_delete, sender=Content)
+def progress_content_deleted(sender, instance, **kwargs):
+    progress.content_removed(instance)
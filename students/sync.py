@@ -0,0 +1,90 @@
+from django.db import transaction
+from django.utils import timezone
+from courses.models import Content
+from users import counters
+from .models import UserContentProgress
+from .completion import legacy_in_use, legacy_marks
+from . import progress
+
+# operations accepted in one sync request
+MAX_SYNC_OPERATIONS = 500
+
+
+def latest_operations(operations):
+    '''
+    keep the newest operation of every content, a later entry wins a tie.
+    client clocks ahead of the server are clamped, a wrong clock cannot
+    make a change win against every future one
+    '''
+    now = timezone.now()
+    latest = {}
+    for operation in operations:
+        operation = {**operation, 'client_timestamp': min(operation['client_timestamp'], now)}
+        current = latest.get(operation['content_id'])
+        if current is None or operation['client_timestamp'] >= current['client_timestamp']:
+            latest[operation['content_id']] = operation
+    return latest
+
+
+def sync_progress(user, operations):
+    '''
+    apply a batch of (content_id, completed, client_timestamp) changes queued by
+    a client, in one transaction. a change only applies when it is newer than
+    the last one recorded for the content (last writer wins), so replaying a
+    batch is harmless. marks and unmarks are written with one bulk upsert
+    (and mirrored into Content.completed_users until the cutover).
+    returns (state, rejected): the resulting completion state of every content
+    in the batch, and the ids of contents outside the user's courses
+    '''
+    latest = latest_operations(operations)
+    allowed = dict(Content.objects.filter(
+        pk__in=latest, module__course__enrollments__user=user,
+    ).values_list('id', 'module__course_id'))
+    rejected = sorted(set(latest) - set(allowed))
+
+    with transaction.atomic():
+        current = {
+            row.content_id: row
+            for row in UserContentProgress.objects.select_for_update().filter(student=user, content_id__in=allowed)
+        }
+        winners = [
+            operation for content_id, operation in latest.items()
+            if content_id in allowed and (
+                content_id not in current or operation['client_timestamp'] > current[content_id].changed_at
+            )
+        ]
+        if winners:
+            # bulk_create skips the signals, the counters and progress rows are rebuilt below
+            # rolled_up is False on the new objects, the analytics rollup sees the change
+            UserContentProgress.objects.bulk_create(
+                [
+                    UserContentProgress(student=user, content_id=operation['content_id'],
+                                        completed=operation['completed'], changed_at=operation['client_timestamp'])
+                    for operation in winners
+                ],
+                update_conflicts=True, unique_fields=['student', 'content'], update_fields=['completed', 'changed_at', 'rolled_up'],
+            )
+            if legacy_in_use():
+                # dual write until the cutover, see students.completion
+                Marked = Content.completed_users.through
+                unmarked = [operation['content_id'] for operation in winners if not operation['completed']]
+                Marked.objects.filter(customuser=user, content_id__in=unmarked).delete()
+                Marked.objects.bulk_create(
+                    [Marked(customuser=user, content_id=operation['content_id']) for operation in winners if operation['completed']],
+                    ignore_conflicts=True,
+                )
+
+            counters.refresh([user.id], ['completed_contents'])
+            for course_id in {allowed[operation['content_id']] for operation in winners}:
+                progress.refresh(course_id, [user.id])
+
+        rows = UserContentProgress.objects.filter(student=user, content_id__in=allowed).values_list('content_id', 'completed', 'changed_at')
+        recorded = {content_id: (completed, changed_at) for content_id, completed, changed_at in rows}
+        marked = set(legacy_marks().filter(customuser=user, content_id__in=allowed).values_list('content_id', flat=True))
+
+    state = []
+    for content_id in sorted(allowed):
+        # a content without a UserContentProgress row may be a mark not backfilled yet
+        completed, changed_at = recorded.get(content_id, (content_id in marked, None))
+        state.append({'content_id': content_id, 'completed': completed, 'changed_at': changed_at})
+    return state, rejected
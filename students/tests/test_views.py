@@ -1,9 +1,26 @@
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
-from .factories import CourseFactory
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from .factories import CourseFactory, CourseReviewFactory
 from users.tests.factories import CustomUserFactory
-from courses.models import CourseReview
+from courses.models import Course, CourseReview
+from django.core.files.uploadedfile import SimpleUploadedFile
+from users.models import Notification
+from users.counters import get_counters
+from students.models import CourseProgress, UserContentProgress, BackfillCheckpoint
+from students.enrollment import insert_enrollments
+from courses.models import Content
+from django.test import override_settings
+from users.counters import compute_counters
+from students.progress import completed_among, completion_bitmap
+from students import bitsets, completion
+from django.core.cache import caches
+from datetime import timedelta
+from django.utils import timezone
+from courses.tests.factories import ModuleFactory, ContentFactory, TextFactory
 
 class StudentAPIIntegrationTests(APITestCase):
     
@@ -59,4 +76,330 @@ class StudentAPIIntegrationTests(APITestCase):
         
         # Expect rejection and ensure only 1 review exists in DB
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
-        self.assertEqual(CourseReview.objects.filter(student=self.student, course=self.course).count(), 1)
\ No newline at end of file
+        self.assertEqual(CourseReview.objects.filter(student=self.student, course=self.course).count(), 1)
+
+class CourseRatingAggregateTests(APITestCase):
+
+    def setUp(self):
+        self.student = CustomUserFactory(role='student')
+        self.course = CourseFactory()
+        self.course.students.add(self.student)
+        self.client.force_authenticate(user=self.student)
+
+    def test_review_create_update_delete_keep_aggregates_in_sync(self):
+        """Business Logic: stored rating aggregates follow review create, edit and delete."""
+        CourseReviewFactory(course=self.course, rating=2)
+        self.client.post(reverse('students:api_student_course_review', kwargs={'pk': self.course.id}),
+                         {'rating': 4, 'comment': 'Good'})
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.review_count, 2)
+        self.assertEqual(self.course.average_rating(), 3.0)
+
+        self.client.patch(reverse('students:api_student_course_review_edit', kwargs={'pk': self.course.id}),
+                          {'rating': 5})
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.rating_histogram(), {1: 0, 2: 1, 3: 0, 4: 0, 5: 1})
+        self.assertEqual(self.course.average_rating(), 3.5)
+
+        CourseReview.objects.filter(course=self.course, student=self.student).delete()
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.review_count, self.course.rating_sum), (1, 2))
+
+    def test_rebuild_command_recomputes_aggregates(self):
+        """Maintenance: rebuild_course_ratings restores aggregates that drifted."""
+        CourseReviewFactory(course=self.course, rating=3)
+        CourseReviewFactory(course=self.course, rating=5)
+        Course.objects.filter(pk=self.course.pk).update(review_count=0, rating_sum=0, rating_5_count=9)
+
+        call_command('rebuild_course_ratings', stdout=StringIO())
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.review_count, self.course.rating_sum), (2, 8))
+        self.assertEqual(self.course.rating_histogram(), {1: 0, 2: 0, 3: 1, 4: 0, 5: 1})
+
+
+class BulkEnrollmentTests(APITestCase):
+
+    def setUp(self):
+        self.teacher = CustomUserFactory(role='teacher')
+        self.course = CourseFactory(owner=self.teacher)
+        self.students = [CustomUserFactory(role='student') for _ in range(4)]
+        self.url = reverse('students:api_bulk_enroll', kwargs={'pk': self.course.pk})
+
+    def test_enrolls_new_users_and_skips_enrolled_and_blocked(self):
+        enrolled, blocked, *new = self.students
+        self.course.students.add(enrolled)
+        self.course.blocked_students.add(blocked)
+        owner_notifications = Notification.objects.filter(recipient=self.teacher).count()
+
+        self.client.force_authenticate(user=self.teacher)
+        users = [s.pk for s in self.students] + [new[0].username, 'nobody']
+        response = self.client.post(self.url, {'users': users}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'enrolled': 2, 'already_enrolled': 1, 'blocked': 1, 'unknown': ['nobody']})
+        self.assertEqual(set(self.course.students.all()), {enrolled, *new})
+        # one summary notification for the whole cohort
+        self.assertEqual(Notification.objects.filter(recipient=self.teacher).count(), owner_notifications + 1)
+        self.assertEqual(get_counters(new[0])['enrolled_courses'], 1)
+
+    def test_concurrent_enrollments_are_not_counted_twice(self):
+        raced, *others = self.students
+        for student in self.students:
+            get_counters(student)
+
+        def enroll_first(course, user_ids):
+            # the student enrolls on their own between the check and the insert
+            course.students.add(raced)
+            return insert_enrollments(course, user_ids)
+
+        self.client.force_authenticate(user=self.teacher)
+        with mock.patch('students.enrollment.insert_enrollments', side_effect=enroll_first):
+            response = self.client.post(self.url, {'users': [s.pk for s in self.students]}, format='json')
+        self.assertEqual((response.data['enrolled'], response.data['already_enrolled']), (3, 1))
+        self.assertEqual(get_counters(raced)['enrolled_courses'], 1)
+        self.assertEqual(get_counters(others[0])['enrolled_courses'], 1)
+
+    def test_enrolls_from_csv(self):
+        self.client.force_authenticate(user=self.teacher)
+        rows = 'email\n' + '\n'.join(s.email for s in self.students)
+        response = self.client.post(self.url, {'file': SimpleUploadedFile('cohort.csv', rows.encode())}, format='multipart')
+        self.assertEqual(response.data['enrolled'], 4)
+        self.assertEqual(self.course.students.count(), 4)
+
+    def test_only_the_owner_or_an_admin_can_bulk_enroll(self):
+        self.client.force_authenticate(user=CustomUserFactory(role='teacher'))
+        response = self.client.post(self.url, {'users': [self.students[0].pk]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(user=CustomUserFactory(role='admin'))
+        response = self.client.post(self.url, {'users': [self.students[0].pk]}, format='json')
+        self.assertEqual(response.data['enrolled'], 1)
+
+    def test_management_command(self):
+        out = StringIO()
+        call_command('bulk_enroll', self.course.pk, *[str(s.pk) for s in self.students], stdout=out)
+        self.assertIn('Enrolled 4 user(s)', out.getvalue())
+        self.assertEqual(self.course.students.count(), 4)
+
+
+class CourseProgressTests(APITestCase):
+
+    def setUp(self):
+        self.student = CustomUserFactory(role='student')
+        self.course = CourseFactory(owner=CustomUserFactory(role='teacher'))
+        self.module = ModuleFactory(course=self.course)
+        self.contents = [ContentFactory(module=self.module, item=TextFactory()) for _ in range(4)]
+        self.course.students.add(self.student)
+        self.client.force_authenticate(user=self.student)
+
+    def stored(self):
+        row = CourseProgress.objects.get(student=self.student, course=self.course)
+        return row.completed, row.total
+
+    def toggle(self, content):
+        return self.client.post(reverse('students:api_toggle_content_complete'), {'content_id': content.pk})
+
+    def test_enrollment_starts_the_row(self):
+        self.assertEqual(self.stored(), (0, 4))
+
+    def test_mark_and_unmark_in_both_tables_count_once(self):
+        self.toggle(self.contents[0])
+        self.client.post(reverse('courses:api_mark_content_complete', kwargs={'content_id': self.contents[1].pk}))
+        self.client.post(reverse('courses:api_mark_content_complete', kwargs={'content_id': self.contents[0].pk}))
+        self.assertEqual(self.stored(), (2, 4))
+        self.toggle(self.contents[1])
+        self.assertEqual(self.stored(), (1, 4))
+        self.toggle(self.contents[1])
+        self.assertEqual(self.stored(), (2, 4))
+        # a completion only recorded in the legacy table (not backfilled yet)
+        self.contents[2].completed_users.add(self.student)
+        self.assertEqual(self.stored(), (3, 4))
+        # it reads as completed, toggling it unticks it
+        self.toggle(self.contents[2])
+        self.assertEqual(self.stored(), (2, 4))
+        self.toggle(self.contents[0])
+        self.assertEqual(self.stored(), (1, 4))
+
+    def test_content_create_and_delete_update_the_totals(self):
+        self.toggle(self.contents[0])
+        ContentFactory(module=self.module, item=TextFactory())
+        self.assertEqual(self.stored(), (1, 5))
+        self.contents[0].delete()
+        self.assertEqual(self.stored(), (0, 4))
+
+    def test_course_lists_read_the_stored_progress(self):
+        self.toggle(self.contents[0])
+        response = self.client.get(reverse('students:api_student_course_list'))
+        self.assertEqual(response.data['results'][0]['progress'], {'completed': 1, 'total': 4, 'percent': 25})
+        response = self.client.get(reverse('courses:api_student_enrolled_courses'))
+        self.assertEqual(response.data['results'][0]['progress']['percent'], 25)
+
+    def test_rebuild_command_fixes_drift(self):
+        self.toggle(self.contents[0])
+        CourseProgress.objects.update(completed=3, total=9)
+        call_command('rebuild_course_progress', stdout=StringIO())
+        self.assertEqual(self.stored(), (1, 4))
+
+
+class CompletionBitmapTests(APITestCase):
+
+    def setUp(self):
+        self.student = CustomUserFactory(role='student')
+        self.course = CourseFactory(owner=CustomUserFactory(role='teacher'))
+        self.module = ModuleFactory(course=self.course)
+        self.contents = [ContentFactory(module=self.module, item=TextFactory()) for _ in range(10)]
+        self.course.students.add(self.student)
+        # ids are reused between tests, so are the cache keys
+        caches['default'].clear()
+
+    def test_bit_operations(self):
+        bitmap = bitsets.set_bit(b'', 9)
+        self.assertEqual(bitmap, b'\x00\x02')
+        self.assertTrue(bitsets.test_bit(bitmap, 9))
+        self.assertFalse(bitsets.test_bit(bitmap, 8))
+        self.assertFalse(bitsets.test_bit(bitmap, 500))
+        self.assertEqual(bitsets.popcount(bitsets.set_bit(bitmap, 0)), 2)
+        self.assertEqual(bitsets.clear_bit(bitmap, 9), b'')
+        self.assertEqual(bitsets.from_indexes([0, 9]), bitsets.set_bit(bitsets.set_bit(b'', 0), 9))
+
+    def test_ordinals_are_stable_and_never_reused(self):
+        self.assertEqual([c.ordinal for c in self.contents], list(range(10)))
+        self.contents[-1].delete()
+        self.assertEqual(ContentFactory(module=self.module, item=TextFactory()).ordinal, 10)
+
+    def test_cached_bitmap_follows_the_completion_rows(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for content in (self.contents[1], self.contents[9]):
+                UserContentProgress.objects.create(student=self.student, content=content)
+        self.assertEqual(CourseProgress.objects.get(student=self.student, course=self.course).completed, 2)
+        self.assertEqual(completion_bitmap(self.student.id, self.course.id), b'\x02\x02')
+        self.assertEqual(completed_among(self.student.id, self.course.id, self.contents), {self.contents[1].id, self.contents[9].id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            completion.unmark(self.student, self.contents[9])
+        self.assertEqual(completed_among(self.student.id, self.course.id, self.contents), {self.contents[1].id})
+        self.assertEqual(CourseProgress.objects.get(student=self.student, course=self.course).completed, 1)
+
+    def test_course_detail_reads_one_progress_row(self):
+        self.contents[3].completed_users.add(self.student)
+        self.client.force_authenticate(user=self.student)
+        response = self.client.get(reverse('courses:api_public_course_detail', kwargs={'pk': self.course.pk}))
+        contents = response.data['modules'][0]['contents']
+        self.assertEqual([c['id'] for c in contents if c['is_completed']], [self.contents[3].id])
+
+
+class ProgressSyncTests(APITestCase):
+
+    def setUp(self):
+        self.student = CustomUserFactory(role='student')
+        self.course = CourseFactory(owner=CustomUserFactory(role='teacher'))
+        module = ModuleFactory(course=self.course)
+        self.contents = [ContentFactory(module=module, item=TextFactory()) for _ in range(3)]
+        self.course.students.add(self.student)
+        self.client.force_authenticate(user=self.student)
+        self.url = reverse('students:api_progress_sync')
+
+    def sync(self, *operations):
+        payload = [
+            {'content_id': content.pk, 'completed': completed, 'client_timestamp': timestamp.isoformat()}
+            for content, completed, timestamp in operations
+        ]
+        response = self.client.post(self.url, {'operations': payload}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return {row['content_id']: row['completed'] for row in response.data['results']}
+
+    def test_batch_applies_the_newest_change_per_content(self):
+        now = timezone.now()
+        first, second, third = self.contents
+        state = self.sync(
+            (first, True, now - timedelta(minutes=3)),
+            (second, True, now - timedelta(minutes=3)),
+            (second, False, now - timedelta(minutes=1)),
+            (third, True, now - timedelta(minutes=2)),
+        )
+        self.assertEqual(state, {first.pk: True, second.pk: False, third.pk: True})
+        row = CourseProgress.objects.get(student=self.student, course=self.course)
+        self.assertEqual((row.completed, row.total), (2, 3))
+        self.assertEqual(get_counters(self.student)['completed_contents'], 2)
+
+    def test_older_changes_lose_and_replays_are_harmless(self):
+        now = timezone.now()
+        content = self.contents[0]
+        self.sync((content, False, now - timedelta(minutes=1)))
+        # a mark queued offline before the unmark arrives late
+        self.assertEqual(self.sync((content, True, now - timedelta(minutes=5))), {content.pk: False})
+        self.assertEqual(self.sync((content, False, now - timedelta(minutes=1))), {content.pk: False})
+        self.assertEqual(self.sync((content, True, now)), {content.pk: True})
+        self.assertEqual(UserContentProgress.objects.filter(student=self.student).count(), 1)
+
+    def test_toggled_unmark_beats_an_older_offline_mark(self):
+        content = self.contents[0]
+        toggle_url = reverse('students:api_toggle_content_complete')
+        queued = timezone.now()
+        self.assertEqual(self.client.post(toggle_url, {'content_id': content.pk}).data['status'], 'marked')
+        self.assertEqual(self.client.post(toggle_url, {'content_id': content.pk}).data['status'], 'unmarked')
+        # the unmark is kept as a tombstone, the mark queued before it loses
+        self.assertEqual(self.sync((content, True, queued)), {content.pk: False})
+        self.assertEqual(CourseProgress.objects.get(student=self.student, course=self.course).completed, 0)
+        self.assertEqual(get_counters(self.student)['completed_contents'], 0)
+        self.assertEqual(self.client.post(toggle_url, {'content_id': content.pk}).data['status'], 'marked')
+        self.assertEqual(get_counters(self.student)['completed_contents'], 1)
+
+    def test_unmark_clears_the_legacy_completion_too(self):
+        content = self.contents[0]
+        content.completed_users.add(self.student)
+        self.assertEqual(self.sync((content, False, timezone.now())), {content.pk: False})
+        self.assertFalse(content.completed_users.filter(pk=self.student.pk).exists())
+        self.assertEqual(CourseProgress.objects.get(student=self.student, course=self.course).completed, 0)
+
+    def test_contents_of_other_courses_are_rejected(self):
+        other = ContentFactory(item=TextFactory())
+        response = self.client.post(self.url, {'operations': [
+            {'content_id': other.pk, 'completed': True, 'client_timestamp': timezone.now().isoformat()},
+        ]}, format='json')
+        self.assertEqual(response.data, {'results': [], 'rejected': [other.pk]})
+        self.assertFalse(UserContentProgress.objects.filter(content=other).exists())
+
+
+class CompletionBackfillTests(APITestCase):
+
+    def setUp(self):
+        self.student = CustomUserFactory(role='student')
+        module = ModuleFactory()
+        self.contents = [ContentFactory(module=module, item=TextFactory()) for _ in range(3)]
+        Marked = Content.completed_users.through
+        Marked.objects.bulk_create([Marked(customuser=self.student, content=content) for content in self.contents])
+
+    def backfill(self, *args):
+        out = StringIO()
+        call_command('backfill_completions', '--pause', '0', *args, stdout=out)
+        return out.getvalue()
+
+    def test_backfill_resumes_from_its_checkpoint(self):
+        output = self.backfill('--chunk-size', '1', '--max-chunks', '2')
+        self.assertIn('run again to continue', output)
+        self.assertEqual(UserContentProgress.objects.filter(student=self.student).count(), 2)
+        self.assertIn('Backfill finished, 3 rows processed', self.backfill('--chunk-size', '1'))
+        self.assertEqual(UserContentProgress.objects.filter(student=self.student, completed=True).count(), 3)
+        self.assertTrue(BackfillCheckpoint.objects.get(name='completions').finished)
+        # finished runs copy nothing again
+        self.backfill()
+        self.assertEqual(UserContentProgress.objects.filter(student=self.student).count(), 3)
+
+    def test_backfill_keeps_synced_unmarks(self):
+        UserContentProgress.objects.create(student=self.student, content=self.contents[0], completed=False)
+        self.backfill()
+        self.assertFalse(UserContentProgress.objects.get(student=self.student, content=self.contents[0]).completed)
+
+    def test_api_writes_both_tables_until_the_cutover(self):
+        content = ContentFactory(item=TextFactory())
+        self.client.force_authenticate(user=self.student)
+        url = reverse('courses:api_mark_content_complete', kwargs={'content_id': content.pk})
+        self.client.post(url)
+        self.assertTrue(content.completed_users.filter(pk=self.student.pk).exists())
+        self.assertTrue(UserContentProgress.objects.filter(student=self.student, content=content).exists())
+
+        with override_settings(COMPLETION_SOURCE='canonical'):
+            other = ContentFactory(item=TextFactory())
+            self.client.post(reverse('courses:api_mark_content_complete', kwargs={'content_id': other.pk}))
+            self.assertFalse(other.completed_users.exists())
+            # legacy rows of self.contents are not read any more
+            self.assertEqual(compute_counters(self.student)['completed_contents'], 2)
@@ -6,6 +6,8 @@ app_name = 'students'
 urlpatterns = [
     # enroll a course
     path('enroll/', views.EnrollCourseAPIView.as_view(), name='api_student_enroll'),
+    # enroll a cohort from CSV or a list, for teachers and admins
+    path('course/<int:pk>/bulk-enroll/', views.BulkEnrollAPIView.as_view(), name='api_bulk_enroll'),
     # course user enrolled in      
     path('my-courses/', views.StudentCourseListAPIView.as_view(), name='api_student_course_list'),         
     # course detail 
@@ -16,5 +18,7 @@ urlpatterns = [
     path('course/<int:pk>/review/edit/',views.CourseReviewUpdateAPIView.as_view(), name='api_student_course_review_edit'),
     # toggle of complete the course
     path('content/toggle-complete/', views.ToggleContentCompleteAPIView.as_view(), name='api_toggle_content_complete'),
+    # batched, idempotent progress changes queued by the client
+    path('progress/sync/', views.ProgressSyncAPIView.as_view(), name='api_progress_sync'),
 
 ]  
\ No newline at end of file
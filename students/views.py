@@ -4,8 +4,11 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied
 from courses.models import Course, Content, CourseReview
-from .models import UserContentProgress
-from .serializers import StudentCourseListSerializer, StudentCourseDetailSerializer, CourseReviewSerializer
+from .progress import with_progress, ensure
+from .enrollment import parse_identifiers, resolve_user_ids, bulk_enroll
+from .sync import sync_progress
+from . import completion
+from .serializers import StudentCourseListSerializer, StudentCourseDetailSerializer, CourseReviewSerializer, ProgressSyncSerializer
 # Create your views here.
 class EnrollCourseAPIView(APIView):
     """
@@ -35,6 +38,37 @@ class EnrollCourseAPIView(APIView):
             status=status.HTTP_200_OK
         )
 
+class BulkEnrollAPIView(APIView):
+    """
+    POST /api/students/course/<pk>/bulk-enroll/
+    Enrolls a cohort in one request, for the course owner or a site admin.
+    Expects a CSV `file` (user ids, usernames or emails in the first column)
+    or a `users` list. Blocked and already enrolled users are skipped.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk):
+        course = get_object_or_404(Course, pk=pk)
+        if course.owner_id != request.user.id and not request.user.is_admin:
+            raise PermissionDenied("Only the course owner can enroll students.")
+
+        if request.FILES.get('file'):
+            try:
+                identifiers = parse_identifiers(request.FILES['file'].read().decode('utf-8-sig'))
+            except UnicodeDecodeError:
+                return Response({"error": "The file must be UTF-8 encoded CSV."}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            identifiers = request.data.get('users') or []
+            if not isinstance(identifiers, list):
+                return Response({"error": "users must be a list."}, status=status.HTTP_400_BAD_REQUEST)
+            identifiers = [str(value).strip() for value in identifiers if str(value).strip()]
+        if not identifiers:
+            return Response({"error": "Send a CSV file or a users list."}, status=status.HTTP_400_BAD_REQUEST)
+
+        user_ids, unknown = resolve_user_ids(identifiers)
+        result = bulk_enroll(course, user_ids)
+        return Response({**result, 'unknown': unknown}, status=status.HTTP_200_OK)
+
 class StudentCourseListAPIView(generics.ListAPIView):
     """
     GET /api/students/my-courses/
@@ -44,7 +78,10 @@ class StudentCourseListAPIView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Course.objects.filter(students__in=[self.request.user]).prefetch_related('modules')
+        courses = Course.objects.filter(students__in=[self.request.user])
+        # rows are only missing for enrollments older than the progress table
+        ensure(self.request.user.id, courses.values_list('id', flat=True))
+        return with_progress(courses, self.request.user).prefetch_related('modules')
 
 class StudentCourseDetailAPIView(generics.RetrieveAPIView):
     """
@@ -117,15 +154,22 @@ class ToggleContentCompleteAPIView(APIView):
         
         content = get_object_or_404(Content, id=content_id)
 
-        # use get_or_create to handle tick/untick 
-        progress, created = UserContentProgress.objects.get_or_create(
-            student=request.user,
-            content=content
-        )
-
-        if not created:
-            # if exist untick
-            progress.delete()
+        if not completion.toggle(request.user, content):
             return Response({'status': 'unmarked', 'content_id': content_id}, status=status.HTTP_200_OK)
         else:
-            return Response({'status': 'marked', 'content_id': content_id}, status=status.HTTP_201_CREATED)
\ No newline at end of file
+            return Response({'status': 'marked', 'content_id': content_id}, status=status.HTTP_201_CREATED)
+
+class ProgressSyncAPIView(APIView):
+    """
+    POST /api/students/progress/sync/
+    Applies a batch of {content_id, completed, client_timestamp} operations
+    queued by the client, newest change per content wins. Safe to retry.
+    Returns the resulting completion state of every content in the batch.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = ProgressSyncSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        state, rejected = sync_progress(request.user, serializer.validated_data['operations'])
+        return Response({'results': state, 'rejected': rejected}, status=status.HTTP_200_OK)
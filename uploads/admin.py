@@ -0,0 +1,20 @@
+from django.contrib import admin
+from .models import ImageVariant, UploadSession, Blob
+
+@admin.register(ImageVariant)
+class ImageVariantAdmin(admin.ModelAdmin):
+    list_display = ['source', 'width', 'format', 'actual_width', 'actual_height', 'created']
+    list_filter = ['format', 'width']
+    search_fields = ['source']
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ['filename', 'owner', 'purpose', 'size', 'status', 'updated']
+    list_filter = ['purpose', 'status']
+    search_fields = ['filename', 'owner__username']
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'size', 'ref_count', 'updated']
+    search_fields = ['name', 'sha256']
+    readonly_fields = ['name', 'sha256', 'size', 'ref_count', 'created', 'updated']
@@ -0,0 +1,108 @@
+import os
+import re
+import hashlib
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Blob, ImageVariant
+
+logger = logging.getLogger(__name__)
+
+# <folder>/<first two hex digits>/<sha256><ext>, the name changes whenever the bytes do
+BLOB_RE = re.compile(r'^(?:files|images|chat_files)/[0-9a-f]{2}/(?P<sha256>[0-9a-f]{64})(?:\.[a-z0-9]{1,10})?$')
+
+
+def hash_file(file):
+    ''' sha256 of a django File, read chunk by chunk '''
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def blob_name(folder, sha256, filename):
+    extension = os.path.splitext(filename)[1].lower()
+    if not re.fullmatch(r'\.[a-z0-9]{1,10}', extension):
+        extension = ''
+    return f'{folder}/{sha256[:2]}/{sha256}{extension}'
+
+
+def store_blob(file, folder, filename, sha256=None, owner=None):
+    '''
+    store the bytes of file once under their content hash and return the storage
+    name. the hash comes from the upload handlers (file.sha256) or the chunked
+    upload assembly; uploading bytes already stored writes nothing.
+    the caller references the name from a model field, which counts the reference.
+    owner is recorded as an uploader of the bytes, see delivery.can_access
+    '''
+    sha256 = sha256 or getattr(file, 'sha256', None) or hash_file(file)
+    name = blob_name(folder, sha256, filename)
+    # the bytes are copied before the row is locked, a long copy holds no database lock.
+    # identical new bytes uploaded at the same time may be copied twice, the extra copy is dropped
+    if not default_storage.exists(name):
+        saved = default_storage.save(name, file)
+        if saved != name:
+            default_storage.delete(saved)
+    with transaction.atomic():
+        blob, created = Blob.objects.select_for_update().get_or_create(
+            name=name, defaults={'sha256': sha256, 'size': file.size}
+        )
+        # the garbage collection may have removed an unreferenced copy meanwhile
+        if not default_storage.exists(name):
+            file.seek(0)
+            default_storage.save(name, file)
+        if not created:
+            # refresh updated, keeps the blob out of the garbage collection grace window
+            blob.save(update_fields=['updated'])
+        if owner is not None:
+            blob.uploaders.add(owner)
+    return name
+
+
+def change_refs(name, delta):
+    ''' count or uncount a model row pointing at a blob, other names are ignored '''
+    if name and BLOB_RE.match(name):
+        Blob.objects.filter(name=name).update(ref_count=F('ref_count') + delta, updated=timezone.now())
+
+
+def change_refs_many(deltas):
+    '''
+    apply {name: delta} for rows created or deleted in bulk (bulk_create skips
+    the signals), with one UPDATE per distinct delta instead of one per blob
+    '''
+    names_by_delta = defaultdict(list)
+    for name, delta in deltas.items():
+        if name and delta and BLOB_RE.match(name):
+            names_by_delta[delta].append(name)
+    for delta, names in names_by_delta.items():
+        Blob.objects.filter(name__in=names).update(ref_count=F('ref_count') + delta, updated=timezone.now())
+
+
+def collect_garbage(grace_hours=None):
+    '''
+    delete blobs nobody references that were not touched in the grace period.
+    returns the number of blobs removed
+    '''
+    grace_hours = grace_hours or settings.BLOB_GRACE_HOURS
+    cutoff = timezone.now() - timedelta(hours=grace_hours)
+    removed = 0
+    for blob in Blob.objects.filter(ref_count__lte=0, updated__lt=cutoff).iterator():
+        with transaction.atomic():
+            # re-checked under the lock, an upload may have reused it meanwhile
+            locked = Blob.objects.select_for_update().filter(pk=blob.pk, ref_count__lte=0, updated__lt=cutoff).first()
+            if locked is None:
+                continue
+            default_storage.delete(locked.name)
+            for variant in ImageVariant.objects.filter(source=locked.name):
+                default_storage.delete(variant.file)
+                variant.delete()
+            locked.delete()
+            removed += 1
+    logger.info(f"Collected {removed} unreferenced blob(s).")
+    return removed
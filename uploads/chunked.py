@@ -0,0 +1,178 @@
+import os
+import uuid
+import shutil
+import hashlib
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from .models import UploadSession, UploadChunk
+from .blobs import store_blob
+
+logger = logging.getLogger(__name__)
+
+# bytes read from the request or a chunk file at a time, bounds the memory of one upload
+STREAM_BLOCK_SIZE = 64 * 1024
+# storage folder and accepted extensions per purpose (None: anything)
+PURPOSE_FOLDERS = {
+    'file': ('files', {'.pdf', '.zip'}),
+    'image': ('images', {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp'}),
+    'chat': ('chat_files', None),
+}
+
+
+class UploadError(Exception):
+    ''' the upload request cannot be accepted, the message is shown to the client '''
+
+
+def session_dir(session):
+    return os.path.join(settings.UPLOAD_TEMP_DIR, str(session.pk))
+
+
+def chunk_path(session, index):
+    return os.path.join(session_dir(session), f'{index}.part')
+
+
+def check_allowed(purpose, filename):
+    folder, extensions = PURPOSE_FOLDERS[purpose]
+    if extensions is not None and os.path.splitext(filename)[1].lower() not in extensions:
+        raise UploadError(f"Only {', '.join(sorted(extensions))} files can be uploaded as {purpose}.")
+
+
+def write_chunk(session, index, stream, checksum=None):
+    '''
+    stream one chunk from the request body to its own temporary file,
+    hashing it on the way. a chunk sent again (retry after a disconnect)
+    replaces the previous copy. returns the recorded UploadChunk
+    '''
+    if session.status != 'pending':
+        raise UploadError("This upload is already complete.")
+    if not 0 <= index < session.total_chunks:
+        raise UploadError(f"Chunk index must be between 0 and {session.total_chunks - 1}.")
+    expected = session.expected_chunk_size(index)
+
+    os.makedirs(session_dir(session), exist_ok=True)
+    final_path = chunk_path(session, index)
+    # written under a temporary name, a broken connection never leaves half a chunk
+    # unique per request, two requests writing the same chunk at once never share it
+    partial_path = f'{final_path}.{uuid.uuid4().hex}.tmp'
+    digest = hashlib.sha256()
+    received = 0
+    try:
+        with open(partial_path, 'wb') as out:
+            while True:
+                block = stream.read(min(STREAM_BLOCK_SIZE, expected - received + 1))
+                if not block:
+                    break
+                received += len(block)
+                if received > expected:
+                    raise UploadError(f"Chunk {index} is larger than {expected} bytes.")
+                digest.update(block)
+                out.write(block)
+        if received != expected:
+            raise UploadError(f"Chunk {index} has {received} bytes, expected {expected}.")
+        if checksum and checksum.lower() != digest.hexdigest():
+            raise UploadError(f"Checksum mismatch for chunk {index}.")
+        os.replace(partial_path, final_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+    chunk, _ = UploadChunk.objects.update_or_create(
+        session=session, index=index, defaults={'size': received, 'sha256': digest.hexdigest()}
+    )
+    # touch the session so purge_upload_sessions sees it is still in use
+    session.save(update_fields=['updated'])
+    return chunk
+
+
+def missing_chunks(session):
+    received = set(session.chunks.values_list('index', flat=True))
+    return [index for index in range(session.total_chunks) if index not in received]
+
+
+def complete_session(session_id, owner):
+    '''
+    assemble the chunks in order into one temporary file, verify the
+    whole-file checksum and stream it into default_storage as a blob
+    (stored once for identical bytes).
+    memory use is one STREAM_BLOCK_SIZE block whatever the file size.
+    the copy runs outside any transaction (on SQLite one would hold the
+    database write lock for the whole file): the session is claimed
+    ('assembling') and finished in two short ones
+    '''
+    with transaction.atomic():
+        # completing twice at the same time assembles only once
+        session = UploadSession.objects.select_for_update().get(pk=session_id, owner=owner)
+        if session.status == 'assembling':
+            raise UploadError("This upload is already being completed.")
+        if session.status != 'pending':
+            return session
+        missing = missing_chunks(session)
+        if missing:
+            raise UploadError(f"Missing chunks: {missing[:20]}")
+        session.status = 'assembling'
+        session.save(update_fields=['status', 'updated'])
+
+    try:
+        stored_name, sha256 = assemble(session)
+    except BaseException:
+        # back to pending, the client can complete it again
+        UploadSession.objects.filter(pk=session.pk, status='assembling').update(status='pending', updated=timezone.now())
+        raise
+
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        session.stored_name = stored_name
+        session.sha256 = sha256
+        session.status = 'complete'
+        session.save(update_fields=['stored_name', 'sha256', 'status', 'updated'])
+
+    discard_chunks(session)
+    return session
+
+
+def assemble(session):
+    ''' (storage name, sha256) of the chunks of a claimed session copied into storage '''
+    assembled_path = os.path.join(session_dir(session), f'assembled.{uuid.uuid4().hex}')
+    digest = hashlib.sha256()
+    try:
+        with open(assembled_path, 'wb') as out:
+            for index in range(session.total_chunks):
+                with open(chunk_path(session, index), 'rb') as part:
+                    while block := part.read(STREAM_BLOCK_SIZE):
+                        digest.update(block)
+                        out.write(block)
+        if session.sha256 and session.sha256.lower() != digest.hexdigest():
+            raise UploadError("Checksum mismatch for the assembled file, upload the chunks again.")
+
+        folder, _ = PURPOSE_FOLDERS[session.purpose]
+        with open(assembled_path, 'rb') as f:
+            # Storage.save() copies File objects chunk by chunk
+            stored_name = store_blob(File(f), folder, session.filename, sha256=digest.hexdigest(), owner=session.owner)
+    finally:
+        if os.path.exists(assembled_path):
+            os.remove(assembled_path)
+    return stored_name, digest.hexdigest()
+
+
+def discard_chunks(session):
+    shutil.rmtree(session_dir(session), ignore_errors=True)
+
+
+def purge_stale_sessions(max_age_hours=None):
+    '''
+    delete unfinished sessions (and their chunks) not touched for max_age_hours.
+    returns the number of sessions removed
+    '''
+    max_age_hours = max_age_hours or settings.UPLOAD_SESSION_TTL_HOURS
+    # an assembling session that old was abandoned by a crashed worker
+    stale = UploadSession.objects.filter(status__in=['pending', 'assembling'], updated__lt=timezone.now() - timedelta(hours=max_age_hours))
+    removed = 0
+    for session in stale.iterator():
+        discard_chunks(session)
+        session.delete()
+        removed += 1
+    return removed
@@ -0,0 +1,262 @@
+import os
+import re
+import time
+import hashlib
+import mimetypes
+from urllib.parse import quote
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.core.signing import Signer
+from django.utils.crypto import constant_time_compare
+from django.db.models import Q
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date
+from .blobs import BLOB_RE
+from .models import Blob, UploadSession
+
+# readable by anyone: course cards and avatars
+PUBLIC_FOLDERS = ('course_images/', 'profile_photos/')
+# images/variants/cat.png.480w.webp is a variant of images/cat.png
+VARIANT_RE = re.compile(r'^(?P<folder>.+)/variants/(?P<filename>.+)\.\d+w\.\w+$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+STREAM_BLOCK_SIZE = 64 * 1024
+# uploaded names are never reused for other bytes, browsers may keep them
+PUBLIC_CACHE_CONTROL = 'public, max-age=31536000'
+PRIVATE_CACHE_CONTROL = 'private, max-age=31536000'
+# content-addressed blobs can never change under their name
+IMMUTABLE = ', immutable'
+MEDIA_TOKEN_SALT = 'uploads.media'
+
+
+def source_of(name):
+    match = VARIANT_RE.match(name)
+    return f"{match['folder']}/{match['filename']}" if match else name
+
+
+def is_public(name):
+    return source_of(name).startswith(PUBLIC_FOLDERS)
+
+
+def media_token(user, name, now=None):
+    '''
+    token letting the browser of user fetch one protected file by URL, since
+    <img>, <a> and <iframe> cannot send the Authorization header. it expires at
+    the end of the next MEDIA_TOKEN_LIFETIME window: the URL, and so the browser
+    cache entry, stays the same within a window
+    '''
+    lifetime = settings.MEDIA_TOKEN_LIFETIME
+    expires = (int(now or time.time()) // lifetime + 2) * lifetime
+    signature = Signer(salt=MEDIA_TOKEN_SALT).signature(f'{user.pk}:{expires}:{name}')
+    return f'{user.pk}.{expires}.{signature}'
+
+
+def token_user_id(token, name, now=None):
+    ''' id of the user a media token was issued to for name, None when invalid or expired '''
+    try:
+        user_id, expires, signature = token.split('.', 2)
+        expires = int(expires)
+    except ValueError:
+        return None
+    if expires < (now or time.time()):
+        return None
+    expected = Signer(salt=MEDIA_TOKEN_SALT).signature(f'{user_id}:{expires}:{name}')
+    return user_id if constant_time_compare(signature, expected) else None
+
+
+def token_user(token, name):
+    ''' the active user a media token for name was issued to, None otherwise '''
+    from django.contrib.auth import get_user_model
+    user_id = token_user_id(token, name)
+    return get_user_model().objects.filter(pk=user_id, is_active=True).first() if user_id else None
+
+
+def signed_url(user, name, request=None):
+    '''
+    url of a stored file for user: public files as they are, protected ones
+    with a media token when user is logged in
+    '''
+    url = default_storage.url(name)
+    if not is_public(name) and user is not None and user.is_authenticated:
+        url = f'{url}?token={media_token(user, name)}'
+    return request.build_absolute_uri(url) if request else url
+
+
+def is_own_upload(user, name):
+    ''' whether user uploaded the stored file name (sent or not yet), the bytes may be shared with other uploaders '''
+    return (
+        Blob.objects.filter(name=name, uploaders=user).exists()
+        or UploadSession.objects.filter(owner=user, stored_name=name).exists()
+    )
+
+
+def can_access(user, name):
+    '''
+    whether user may download a protected media file:
+    course files and images for the course owner and enrolled students,
+    chat files for the people in the conversation or course room
+    '''
+    if not user.is_authenticated:
+        return False
+    if user.is_staff or getattr(user, 'role', None) == 'admin':
+        return True
+    # imported here because these apps import uploads
+    from django.contrib.contenttypes.models import ContentType
+    from courses.models import Content, File, Image
+    from chat.models import Message, PrivateMessage
+
+    name = source_of(name)
+    if name.startswith(('files/', 'images/')):
+        model = File if name.startswith('files/') else Image
+        enrolled_items = Content.objects.filter(
+            content_type=ContentType.objects.get_for_model(model),
+            module__course__enrollments__user=user,
+        ).values('object_id')
+        return model.objects.filter(file=name).filter(Q(owner=user) | Q(pk__in=enrolled_items)).exists()
+    if name.startswith('chat_files/'):
+        if is_own_upload(user, name):
+            return True
+        return (
+            PrivateMessage.objects.filter(file=name).filter(Q(sender=user) | Q(recipient=user)).exists()
+            or Message.objects.filter(file=name).filter(Q(course__owner=user) | Q(course__enrollments__user=user)).exists()
+        )
+    return False
+
+
+def check_access(user, name):
+    '''
+    can_access(), with granted decisions reused for MEDIA_ACCESS_CACHE_TIMEOUT
+    so the enrollment is checked once per download, not once per range request
+    '''
+    if is_public(name):
+        return True
+    key = 'media:access:{}:{}'.format(user.pk, hashlib.sha1(name.encode()).hexdigest())
+    cache = caches['local']
+    if cache.get(key):
+        return True
+    allowed = can_access(user, name)
+    if allowed:
+        cache.set(key, True, settings.MEDIA_ACCESS_CACHE_TIMEOUT)
+    return allowed
+
+
+def file_stat(name):
+    ''' (absolute path, os.stat) of a stored file, None when missing or outside MEDIA_ROOT '''
+    try:
+        path = default_storage.path(name)
+    except (SuspiciousFileOperation, NotImplementedError):
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (path, stat) if os.path.isfile(path) else None
+
+
+def strong_etag(name, stat):
+    blob = BLOB_RE.match(name)
+    if blob:
+        return f'"{blob["sha256"]}"'
+    return '"{:x}-{:x}"'.format(stat.st_size, stat.st_mtime_ns)
+
+
+def cache_control(name):
+    value = PUBLIC_CACHE_CONTROL if is_public(name) else PRIVATE_CACHE_CONTROL
+    return value + IMMUTABLE if BLOB_RE.match(name) else value
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    '''
+    (start, end) of a single "bytes=" range, inclusive, or None to send the whole file.
+    multiple ranges are answered with the whole file, which RFC 9110 allows
+    '''
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range: the last n bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            block = f.read(min(STREAM_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+def serve(request, name, path, stat):
+    '''
+    response for a stored file the user may read: 304 on a matching ETag, an
+    X-Accel-Redirect / X-Sendfile hand-off when configured, otherwise the file
+    (or the requested byte range) streamed in blocks
+    '''
+    etag = strong_etag(name, stat)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': cache_control(name),
+        'Accept-Ranges': 'bytes',
+    }
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    if settings.MEDIA_ACCEL == 'x-accel':
+        # nginx sends the bytes and answers range requests itself
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(name)
+    elif settings.MEDIA_ACCEL == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+    else:
+        response = stream(request, path, stat.st_size, etag, content_type)
+    for header, value in headers.items():
+        response[header] = value
+    return response
+
+
+def stream(request, path, size, etag, content_type):
+    byte_range = None
+    # a range is only valid against the version of the file the client has
+    if_range = request.headers.get('If-Range')
+    if not if_range or if_range == etag:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if byte_range is None:
+        # FileResponse uses the server's wsgi.file_wrapper (sendfile) when available
+        return FileResponse(open(path, 'rb'), content_type=content_type)
+    start, end = byte_range
+    response = StreamingHttpResponse(read_range(path, start, end - start + 1), status=206, content_type=content_type)
+    response['Content-Length'] = str(end - start + 1)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
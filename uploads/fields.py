@@ -0,0 +1,56 @@
+from django.urls import reverse
+from rest_framework import serializers
+from .images import VARIANT_WIDTHS, VARIANT_FORMATS, is_image_source
+from .delivery import signed_url, media_token, is_public
+
+
+def variant_urls(source, request=None):
+    '''
+    {width: {format: url}} for an uploaded image. the urls point at the variant
+    endpoint, which redirects to the stored file and renders it first if missing.
+    variants of protected images carry a media token for the original
+    '''
+    if not is_image_source(source):
+        return None
+    user = getattr(request, 'user', None)
+    query = ''
+    if not is_public(source) and user is not None and user.is_authenticated:
+        query = f'?token={media_token(user, source)}'
+    urls = {}
+    for width in VARIANT_WIDTHS:
+        urls[str(width)] = {}
+        for fmt in VARIANT_FORMATS:
+            url = reverse('uploads:image_variant', kwargs={'width': width, 'fmt': fmt, 'source': source}) + query
+            urls[str(width)][fmt] = request.build_absolute_uri(url) if request else url
+    return urls
+
+
+class ImageVariantsField(serializers.Field):
+    """
+    Read-only field listing the resized variants of an image field,
+    e.g. image_variants = ImageVariantsField(source='image').
+    """
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        return variant_urls(value.name, self.context.get('request'))
+
+
+class MediaUrlField(serializers.Field):
+    """
+    Read-only url of a file field for the requesting user, protected files
+    carry a media token (see uploads.delivery.signed_url).
+    """
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        request = self.context.get('request')
+        return signed_url(getattr(request, 'user', None), value.name, request)
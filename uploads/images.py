@@ -0,0 +1,119 @@
+import io
+import os
+import logging
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image as PILImage, ImageOps, UnidentifiedImageError
+from .models import ImageVariant
+
+logger = logging.getLogger(__name__)
+
+# widths served to clients: card thumbnails and avatars, list views, detail views
+VARIANT_WIDTHS = [160, 480, 960]
+VARIANT_FORMATS = ['webp', 'fallback']
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp'}
+# upload folders that may hold images, nothing else is ever resized
+IMAGE_FOLDERS = ('course_images/', 'profile_photos/', 'images/', 'chat_files/')
+
+
+class VariantError(Exception):
+    ''' the source is not an image that can be resized '''
+
+
+def is_image_source(name):
+    '''
+    true for storage names of uploaded images that variants may be made of.
+    also rejects anything that could escape the media folder
+    '''
+    if not name or '..' in name.split('/') or name.startswith('/'):
+        return False
+    return name.startswith(IMAGE_FOLDERS) and os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def variant_name(source, width, extension):
+    ''' variants/ next to the original: images/cat.png -> images/variants/cat.png.480w.webp '''
+    folder, filename = os.path.split(source)
+    return os.path.join(folder, 'variants', f'{filename}.{width}w.{extension}')
+
+
+def open_source(source):
+    if not is_image_source(source):
+        raise VariantError(f"'{source}' is not an uploaded image")
+    try:
+        with default_storage.open(source, 'rb') as f:
+            image = PILImage.open(f)
+            image.load()
+    except (FileNotFoundError, UnidentifiedImageError, OSError) as e:
+        raise VariantError(f"Cannot read image '{source}': {e}")
+    # honour the camera orientation, the EXIF data is dropped from the variants
+    return ImageOps.exif_transpose(image)
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+
+
+def encode(image, fmt):
+    '''
+    return (bytes, extension) of the image in a variant format
+    '''
+    buffer = io.BytesIO()
+    if fmt == 'webp':
+        image = image.convert('RGBA' if has_alpha(image) else 'RGB')
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+        return buffer.getvalue(), 'webp'
+    if has_alpha(image):
+        image.convert('RGBA').save(buffer, 'PNG', optimize=True)
+        return buffer.getvalue(), 'png'
+    image.convert('RGB').save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue(), 'jpg'
+
+
+def render_variant(source, image, width, fmt):
+    '''
+    resize an opened original to one width and format, store it and record it.
+    an original narrower than the width is re-encoded, never upscaled
+    '''
+    resized = image.copy()
+    if resized.width > width:
+        height = max(1, round(resized.height * width / resized.width))
+        resized = resized.resize((width, height), PILImage.LANCZOS)
+    data, extension = encode(resized, fmt)
+
+    name = variant_name(source, width, extension)
+    # replace, storage.save() would otherwise pick another name
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    name = default_storage.save(name, ContentFile(data))
+    variant, _ = ImageVariant.objects.update_or_create(
+        source=source, width=width, format=fmt,
+        defaults={'file': name, 'actual_width': resized.width, 'actual_height': resized.height},
+    )
+    return variant
+
+
+def generate_variants(source):
+    '''
+    (re)build every width and format of an uploaded image, decoding it once.
+    returns the recorded variants
+    '''
+    image = open_source(source)
+    return [render_variant(source, image, width, fmt) for width in VARIANT_WIDTHS for fmt in VARIANT_FORMATS]
+
+
+def recorded_variant(source, width, fmt):
+    return ImageVariant.objects.filter(source=source, width=width, format=fmt).first()
+
+
+def get_or_render_variant(source, width, fmt):
+    '''
+    return the recorded variant, rendering only this one when it is missing
+    (upload before the pipeline existed, or the background task has not run yet)
+    '''
+    variant = recorded_variant(source, width, fmt)
+    if variant is not None:
+        return variant
+    logger.info(f"Rendering missing variant {width}w/{fmt} of '{source}' on request")
+    return render_variant(source, open_source(source), width, fmt)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from uploads.blobs import collect_garbage
+
+
+class Command(BaseCommand):
+    help = 'Delete deduplicated upload blobs that no course file, image or chat message references any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, help='keep blobs touched more recently (default: BLOB_GRACE_HOURS)')
+
+    def handle(self, *args, **options):
+        removed = collect_garbage(options['hours'])
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} unreferenced blob(s).'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from uploads.chunked import purge_stale_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete unfinished chunked uploads (and their temporary chunks) that were abandoned'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, help='age of the last chunk (default: UPLOAD_SESSION_TTL_HOURS)')
+
+    def handle(self, *args, **options):
+        removed = purge_stale_sessions(options['hours'])
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} abandoned upload session(s).'))
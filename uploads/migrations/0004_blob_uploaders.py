@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-17 21:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('uploads', '0003_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='uploaders',
+            field=models.ManyToManyField(blank=True, related_name='uploaded_blobs', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,113 @@
+import uuid
+from django.db import models
+from django.conf import settings
+
+class ImageVariant(models.Model):
+    '''
+    a resized copy of an uploaded image (course image, profile photo,
+    image content, chat image), stored next to the original.
+    the original is referenced by its storage name so every image field
+    and plain chat upload can share the same table
+    '''
+    FORMAT_CHOICES = (
+        ('webp', 'WebP'),
+        # JPEG, or PNG for images with transparency
+        ('fallback', 'Fallback'),
+    )
+    source = models.CharField(max_length=255)
+    width = models.PositiveIntegerField()
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    # storage name of the resized file
+    file = models.CharField(max_length=255)
+    # actual size of the stored file, never wider than the original
+    actual_width = models.PositiveIntegerField()
+    actual_height = models.PositiveIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['source', 'width', 'format']
+
+    def __str__(self):
+        return f"{self.source} @{self.width}w ({self.format})"
+
+class UploadSession(models.Model):
+    '''
+    a chunked, resumable upload: the client announces the file, PUTs numbered
+    chunks (in any order, again after a disconnect) and completes the session,
+    which assembles the chunks into default_storage
+    '''
+    PURPOSE_CHOICES = (
+        ('file', 'Course file'),
+        ('image', 'Course image'),
+        ('chat', 'Chat attachment'),
+    )
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        # chunks being assembled into storage, no chunk is accepted meanwhile
+        ('assembling', 'Assembling'),
+        ('complete', 'Complete'),
+        # attached to the content it was uploaded for, cannot be reused
+        ('used', 'Used'),
+    )
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    purpose = models.CharField(max_length=10, choices=PURPOSE_CHOICES)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    # hex sha256 of the whole file, verified on completion when given
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    # storage name of the assembled file
+    stored_name = models.CharField(max_length=255, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created']
+
+    def __str__(self):
+        return f"{self.filename} ({self.status})"
+
+    @property
+    def total_chunks(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    def expected_chunk_size(self, index):
+        if index == self.total_chunks - 1:
+            return self.size - self.chunk_size * index
+        return self.chunk_size
+
+class UploadChunk(models.Model):
+    ''' a chunk of an upload session that was received and verified '''
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+
+    class Meta:
+        ordering = ['index']
+        unique_together = ['session', 'index']
+
+    def __str__(self):
+        return f"{self.session_id} #{self.index}"
+
+class Blob(models.Model):
+    '''
+    an uploaded file stored once under its content hash
+    (files/ab/ab12...ef.pdf), shared by every row that uploaded the same bytes.
+    ref_count is the number of model rows pointing at it, blobs nobody
+    references any more are removed by the collect_blobs command
+    '''
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.IntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    # last upload or reference change, collect_blobs keeps recently touched blobs
+    updated = models.DateTimeField(auto_now=True)
+    # users who uploaded these bytes, they may read them before any message or content links them
+    uploaders = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='uploaded_blobs', blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
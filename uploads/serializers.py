@@ -0,0 +1,45 @@
+import re
+from django.conf import settings
+from rest_framework import serializers
+from .models import UploadSession
+from .chunked import check_allowed, missing_chunks, UploadError
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    '''
+    starts a chunked upload and reports its progress, the client
+    resumes by sending the chunks listed in missing_chunks
+    '''
+    chunk_size = serializers.IntegerField(required=False, min_value=64 * 1024)
+    total_chunks = serializers.IntegerField(read_only=True)
+    missing_chunks = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'purpose', 'filename', 'size', 'chunk_size', 'sha256', 'status',
+                  'total_chunks', 'missing_chunks', 'stored_name', 'created']
+        read_only_fields = ['id', 'status', 'stored_name', 'created']
+
+    def get_missing_chunks(self, obj) -> list:
+        return missing_chunks(obj) if obj.status == 'pending' else []
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"Size must be between 1 and {settings.UPLOAD_MAX_SIZE} bytes.")
+        return value
+
+    def validate_chunk_size(self, value):
+        return min(value, settings.UPLOAD_MAX_CHUNK_SIZE)
+
+    def validate_sha256(self, value):
+        if value and not re.fullmatch(r'[0-9a-fA-F]{64}', value):
+            raise serializers.ValidationError("Expected a hex SHA-256 digest.")
+        return value.lower()
+
+    def validate(self, attrs):
+        try:
+            check_allowed(attrs['purpose'], attrs['filename'])
+        except UploadError as e:
+            raise serializers.ValidationError({'filename': str(e)})
+        attrs.setdefault('chunk_size', settings.UPLOAD_CHUNK_SIZE)
+        return attrs
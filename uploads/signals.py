@@ -0,0 +1,64 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.contrib.auth import get_user_model
+from courses.models import Course, Image, File
+from chat.models import Message, PrivateMessage
+from .tasks import queue_image_variants
+from .blobs import change_refs
+
+# image fields whose uploads get resized variants
+IMAGE_FIELDS = {
+    Course: 'image',
+    get_user_model(): 'photo',
+    Image: 'file',
+}
+
+
+@receiver(post_save)
+def image_uploaded(sender, instance, update_fields=None, **kwargs):
+    field_name = IMAGE_FIELDS.get(sender)
+    if field_name is None:
+        return
+    # e.g. the last_login update of every sign-in, the photo did not change
+    if update_fields is not None and field_name not in update_fields:
+        return
+    field_file = getattr(instance, field_name)
+    if field_file:
+        queue_image_variants(field_file.name)
+
+
+# file fields that may point at deduplicated blobs, see uploads.blobs
+BLOB_FIELDS = {
+    File: 'file',
+    Image: 'file',
+    Message: 'file',
+    PrivateMessage: 'file',
+}
+
+
+@receiver(pre_save)
+def remember_blob(sender, instance, **kwargs):
+    field_name = BLOB_FIELDS.get(sender)
+    if field_name is None or instance.pk is None:
+        return
+    instance._previous_blob = sender.objects.filter(pk=instance.pk).values_list(field_name, flat=True).first()
+
+
+@receiver(post_save)
+def count_blob_reference(sender, instance, created, **kwargs):
+    field_name = BLOB_FIELDS.get(sender)
+    if field_name is None:
+        return
+    name = getattr(instance, field_name).name
+    previous = None if created else getattr(instance, '_previous_blob', None)
+    if name != previous:
+        change_refs(previous, -1)
+        change_refs(name, 1)
+    instance._previous_blob = name
+
+
+@receiver(post_delete)
+def uncount_blob_reference(sender, instance, **kwargs):
+    field_name = BLOB_FIELDS.get(sender)
+    if field_name is not None:
+        change_refs(getattr(instance, field_name).name, -1)
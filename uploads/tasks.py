@@ -0,0 +1,31 @@
+import logging
+from celery import shared_task
+from django.db import transaction
+from .images import generate_variants, is_image_source, VariantError
+from .models import ImageVariant
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def generate_image_variants(source):
+    '''
+    build the resized WebP and fallback copies of a freshly uploaded image
+    '''
+    try:
+        variants = generate_variants(source)
+    except VariantError as e:
+        logger.warning(f"Skipping image variants: {e}")
+        return 0
+    logger.info(f"Generated {len(variants)} variants of '{source}'.")
+    return len(variants)
+
+
+def queue_image_variants(source):
+    '''
+    schedule the variants of an uploaded image once the upload is committed.
+    images that already have variants (an unrelated save of the owner row) are skipped
+    '''
+    if not is_image_source(source) or ImageVariant.objects.filter(source=source).exists():
+        return
+    transaction.on_commit(lambda: generate_image_variants.delay(source))
@@ -0,0 +1,376 @@
+import io
+import os
+import shutil
+import time
+import hashlib
+import tempfile
+from unittest import mock
+from datetime import timedelta
+from django.urls import reverse
+from django.conf import settings
+from django.test import override_settings
+from django.core.cache import caches
+from rest_framework_simplejwt.tokens import AccessToken
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils import timezone
+from django.core.files.storage import default_storage
+from rest_framework.test import APITestCase
+from rest_framework import status
+from PIL import Image as PILImage
+from users.tests.factories import CustomUserFactory
+from courses.tests.factories import CourseFactory, ModuleFactory, ContentFactory
+from courses.models import Content, File, Image
+from uploads.models import ImageVariant, UploadSession, Blob
+from uploads.blobs import collect_garbage
+from uploads.delivery import media_token, signed_url, token_user_id
+from uploads.images import generate_variants, VARIANT_WIDTHS
+
+TEMP_MEDIA = tempfile.mkdtemp()
+TEMP_CHUNKS = tempfile.mkdtemp()
+
+
+def png_bytes(width, height, mode='RGB'):
+    buffer = io.BytesIO()
+    PILImage.new(mode, (width, height), 'red').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA)
+class ImageVariantTests(APITestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA, ignore_errors=True)
+
+    def setUp(self):
+        self.source = default_storage.save('course_images/cover.png', ContentFile(png_bytes(1200, 600)))
+        caches['default'].clear()
+        caches['local'].clear()
+
+    def protected_image(self):
+        teacher = CustomUserFactory(role='teacher')
+        name = default_storage.save('images/diagram.png', ContentFile(png_bytes(800, 400)))
+        Image.objects.create(owner=teacher, title='Diagram', file=name)
+        return teacher, name
+
+    def test_generates_every_width_and_format(self):
+        variants = generate_variants(self.source)
+        self.assertEqual(len(variants), len(VARIANT_WIDTHS) * 2)
+        thumb = ImageVariant.objects.get(source=self.source, width=160, format='webp')
+        self.assertEqual((thumb.actual_width, thumb.actual_height), (160, 80))
+        self.assertTrue(thumb.file.startswith('course_images/variants/'))
+        # no transparency, the fallback is a JPEG
+        self.assertTrue(ImageVariant.objects.get(source=self.source, width=160, format='fallback').file.endswith('.jpg'))
+
+    def test_upload_queues_variants(self):
+        """Saving a course with an image renders its variants in the (eager) task after commit."""
+        with self.captureOnCommitCallbacks(execute=True):
+            CourseFactory(image=self.source)
+        self.assertEqual(ImageVariant.objects.filter(source=self.source).count(), len(VARIANT_WIDTHS) * 2)
+
+    def test_missing_variant_is_rendered_on_request(self):
+        url = reverse('uploads:image_variant', kwargs={'width': 480, 'fmt': 'webp', 'source': self.source})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        variant = ImageVariant.objects.get(source=self.source, width=480, format='webp')
+        self.assertTrue(response['Location'].endswith(variant.file))
+        self.assertEqual(ImageVariant.objects.count(), 1)
+
+    def test_rejects_unknown_sizes_and_paths(self):
+        for width, source in [(123, self.source), (160, '../config/settings.py'), (160, 'files/cover.png')]:
+            url = reverse('uploads:image_variant', kwargs={'width': width, 'fmt': 'webp', 'source': source})
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_protected_variants_need_access_to_the_original(self):
+        teacher, name = self.protected_image()
+        url = reverse('uploads:image_variant', kwargs={'width': 480, 'fmt': 'webp', 'source': name})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(user=CustomUserFactory())
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(ImageVariant.objects.exists())
+
+        self.client.force_authenticate(user=None)
+        response = self.client.get(url, {'token': media_token(teacher, name)})
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertIn('token=', response['Location'])
+        self.assertTrue(response['Cache-Control'].startswith('private'))
+
+    @override_settings(IMAGE_VARIANT_RENDER_RATE='1/min')
+    def test_cold_renders_are_throttled(self):
+        first = reverse('uploads:image_variant', kwargs={'width': 160, 'fmt': 'webp', 'source': self.source})
+        second = reverse('uploads:image_variant', kwargs={'width': 480, 'fmt': 'webp', 'source': self.source})
+        self.assertEqual(self.client.get(first).status_code, status.HTTP_302_FOUND)
+        self.assertEqual(self.client.get(second).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(ImageVariant.objects.count(), 1)
+        # recorded variants are still served
+        self.assertEqual(self.client.get(first).status_code, status.HTTP_302_FOUND)
+
+    def test_course_list_exposes_variant_urls(self):
+        CourseFactory(image=self.source)
+        response = self.client.get(reverse('courses:api_public_course_list'))
+        variants = response.data['results'][0]['image_variants']
+        self.assertIn('/api/uploads/variants/160/webp/course_images/', variants['160']['webp'])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA, UPLOAD_TEMP_DIR=TEMP_CHUNKS)
+class ChunkedUploadTests(APITestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA, ignore_errors=True)
+        shutil.rmtree(TEMP_CHUNKS, ignore_errors=True)
+
+    def setUp(self):
+        self.teacher = CustomUserFactory(role='teacher')
+        self.client.force_authenticate(user=self.teacher)
+        self.data = os.urandom(150 * 1024)
+        self.chunk_size = 64 * 1024
+
+    def start(self, **overrides):
+        payload = {'purpose': 'file', 'filename': 'syllabus.pdf', 'size': len(self.data),
+                   'chunk_size': self.chunk_size, 'sha256': hashlib.sha256(self.data).hexdigest(), **overrides}
+        response = self.client.post(reverse('uploads:api_upload_session_create'), payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        return response.data['id']
+
+    def put_chunk(self, session_id, index, body=None, **headers):
+        body = body if body is not None else self.data[index * self.chunk_size:(index + 1) * self.chunk_size]
+        url = reverse('uploads:api_upload_chunk', kwargs={'pk': session_id, 'index': index})
+        return self.client.put(url, body, content_type='application/octet-stream', **headers)
+
+    def test_resumed_upload_is_assembled_into_storage(self):
+        session_id = self.start()
+        self.assertEqual(self.put_chunk(session_id, 2).status_code, status.HTTP_200_OK)
+        # the client reconnects and asks what is missing
+        response = self.client.get(reverse('uploads:api_upload_session_detail', kwargs={'pk': session_id}))
+        self.assertEqual(response.data['missing_chunks'], [0, 1])
+        for index in response.data['missing_chunks']:
+            self.put_chunk(session_id, index)
+
+        response = self.client.post(reverse('uploads:api_upload_complete', kwargs={'pk': session_id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        with default_storage.open(response.data['stored_name'], 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(os.path.exists(os.path.join(TEMP_CHUNKS, session_id)))
+
+    def test_corrupted_chunk_is_rejected(self):
+        session_id = self.start()
+        digest = hashlib.sha256(b'something else').hexdigest()
+        response = self.put_chunk(session_id, 0, HTTP_X_CHUNK_SHA256=digest)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.put_chunk(session_id, 1, body=b'short').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(UploadSession.objects.get(pk=session_id).chunks.exists())
+
+    def test_incomplete_or_mismatching_upload_cannot_complete(self):
+        session_id = self.start(sha256=hashlib.sha256(b'other file').hexdigest())
+        complete_url = reverse('uploads:api_upload_complete', kwargs={'pk': session_id})
+        self.put_chunk(session_id, 0)
+        self.assertEqual(self.client.post(complete_url).status_code, status.HTTP_400_BAD_REQUEST)
+        self.put_chunk(session_id, 1)
+        self.put_chunk(session_id, 2)
+        response = self.client.post(complete_url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Checksum', response.data['error'])
+
+    def test_assembly_runs_outside_the_session_lock(self):
+        session_id = self.start()
+        for index in range(3):
+            self.put_chunk(session_id, index)
+        complete_url = reverse('uploads:api_upload_complete', kwargs={'pk': session_id})
+        seen = []
+
+        def copy(*args, **kwargs):
+            # the claim is committed, chunks and second completions are refused meanwhile
+            seen.append(UploadSession.objects.get(pk=session_id).status)
+            seen.append(self.put_chunk(session_id, 0).status_code)
+            seen.append(self.client.post(complete_url).status_code)
+            raise OSError('storage unavailable')
+
+        with mock.patch('uploads.chunked.store_blob', side_effect=copy), self.assertRaises(OSError):
+            self.client.post(complete_url)
+        self.assertEqual(seen, ['assembling', status.HTTP_400_BAD_REQUEST, status.HTTP_400_BAD_REQUEST])
+        # a failed copy leaves the session pending, it can be completed again
+        self.assertEqual(UploadSession.objects.get(pk=session_id).status, 'pending')
+        self.assertEqual(self.client.post(complete_url).status_code, status.HTTP_200_OK)
+
+    def test_completed_upload_becomes_file_content(self):
+        module = ModuleFactory(course=CourseFactory(owner=self.teacher))
+        session_id = self.start()
+        for index in range(3):
+            self.put_chunk(session_id, index)
+        self.client.post(reverse('uploads:api_upload_complete', kwargs={'pk': session_id}))
+
+        url = reverse('courses:api_teacher_content_create', kwargs={'module_id': module.id, 'model_name': 'file'})
+        response = self.client.post(url, {'title': 'Syllabus', 'upload_id': session_id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        sha256 = hashlib.sha256(self.data).hexdigest()
+        self.assertEqual(File.objects.get(title='Syllabus').file.name, f'files/{sha256[:2]}/{sha256}.pdf')
+        self.assertEqual(Content.objects.filter(module=module).count(), 1)
+        # an upload is attached once
+        response = self.client.post(url, {'title': 'Again', 'upload_id': session_id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_disallowed_extension_is_refused_upfront(self):
+        response = self.client.post(reverse('uploads:api_upload_session_create'),
+                                    {'purpose': 'file', 'filename': 'run.exe', 'size': 10})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA, MEDIA_ACCEL='')
+class ProtectedMediaTests(APITestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA, ignore_errors=True)
+
+    def setUp(self):
+        caches['local'].clear()
+        self.teacher = CustomUserFactory(role='teacher')
+        self.student = CustomUserFactory(role='student')
+        self.outsider = CustomUserFactory(role='student')
+        course = CourseFactory(owner=self.teacher)
+        course.students.add(self.student)
+        self.data = bytes(range(256)) * 40
+        self.name = default_storage.save('files/handout.pdf', ContentFile(self.data))
+        pdf = File.objects.create(owner=self.teacher, title='Handout', file=self.name)
+        ContentFactory(module=ModuleFactory(course=course), item=pdf)
+        self.url = '/media/' + self.name
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_enrolled_student_downloads_with_validators(self):
+        self.client.force_login(self.student)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.body(response), self.data)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('private', response['Cache-Control'])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_byte_ranges(self):
+        self.client.force_login(self.student)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.data)}')
+        self.assertEqual(self.body(response), self.data[100:200])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(self.body(response), self.data[-10:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.data)}-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+        # the file changed since the client's copy, the whole file is sent
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_access_is_limited_to_the_course(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_login(self.outsider)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+        self.client.logout()
+        # the JWT is not accepted in links, they carry a token for one file
+        response = self.client.get(self.url, {'token': str(AccessToken.for_user(self.student))})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(signed_url(self.student, self.name))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_media_tokens_are_scoped_and_short_lived(self):
+        other = default_storage.save('files/other.pdf', ContentFile(b'other'))
+        File.objects.create(owner=self.teacher, title='Other', file=other)
+        token = media_token(self.teacher, self.name)
+        self.assertEqual(self.client.get(self.url, {'token': token}).status_code, status.HTTP_200_OK)
+        # stable within a window, so browsers keep their cached copy
+        self.assertEqual(media_token(self.teacher, self.name), token)
+        self.assertEqual(self.client.get('/media/' + other, {'token': token}).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIsNone(token_user_id(token, self.name, now=time.time() + 3 * settings.MEDIA_TOKEN_LIFETIME))
+        self.assertEqual(token_user_id(token[:-1] + 'x', self.name), None)
+
+    def test_api_links_sign_protected_files_only(self):
+        self.assertNotIn('token=', signed_url(self.student, 'course_images/cover.png'))
+        self.client.force_authenticate(user=self.student)
+        content = Content.objects.get()
+        response = self.client.get(reverse('courses:api_public_course_detail', kwargs={'pk': content.module.course_id}))
+        self.assertIn('token=', response.data['modules'][0]['contents'][0]['item']['file'])
+
+    def test_uploader_reads_an_unsent_chat_attachment(self):
+        self.client.force_authenticate(user=self.student)
+        response = self.client.post(reverse('chat:api_chat_file_upload'), {
+            'file': SimpleUploadedFile('notes.pdf', b'%PDF-1.4 draft', content_type='application/pdf'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        url = response.data['url'].split('?')[0]
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        self.client.force_login(self.outsider)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_public_images_need_no_login(self):
+        name = default_storage.save('course_images/cover.png', ContentFile(png_bytes(20, 10)))
+        response = self.client.get('/media/' + name)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('public', response['Cache-Control'])
+
+    @override_settings(MEDIA_ACCEL='x-accel')
+    def test_transfer_is_handed_to_nginx(self):
+        self.client.force_login(self.teacher)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.name)
+        self.assertEqual(response.content, b'')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA)
+class BlobStorageTests(APITestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA, ignore_errors=True)
+
+    def setUp(self):
+        self.teacher = CustomUserFactory(role='teacher')
+        self.client.force_authenticate(user=self.teacher)
+        self.modules = [ModuleFactory(course=CourseFactory(owner=self.teacher)) for _ in range(2)]
+        self.data = b'%PDF-1.4 the same handout'
+
+    def upload(self, module, filename='handout.pdf'):
+        url = reverse('courses:api_teacher_content_create', kwargs={'module_id': module.id, 'model_name': 'file'})
+        response = self.client.post(url, {'title': filename, 'file': SimpleUploadedFile(filename, self.data)})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return File.objects.get(title=filename)
+
+    def test_identical_uploads_are_stored_once(self):
+        first = self.upload(self.modules[0], 'handout.pdf')
+        second = self.upload(self.modules[1], 'copy.pdf')
+        self.assertEqual(first.file.name, second.file.name)
+        blob = Blob.objects.get()
+        self.assertEqual((blob.sha256, blob.ref_count), (hashlib.sha256(self.data).hexdigest(), 2))
+
+        second.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+
+    def test_unreferenced_blobs_are_collected(self):
+        item = self.upload(self.modules[0])
+        name = item.file.name
+        item.delete()
+        # still inside the grace period
+        self.assertEqual(collect_garbage(), 0)
+        Blob.objects.update(updated=timezone.now() - timedelta(days=2))
+        self.assertEqual(collect_garbage(), 1)
+        self.assertFalse(default_storage.exists(name))
+
+    def test_blob_urls_are_immutable(self):
+        name = self.upload(self.modules[0]).file.name
+        self.client.force_login(self.teacher)
+        response = self.client.get('/media/' + name)
+        self.assertEqual(response['ETag'], f'"{hashlib.sha256(self.data).hexdigest()}"')
+        self.assertIn('immutable', response['Cache-Control'])
@@ -0,0 +1,15 @@
+from django.urls import path
+from . import views
+
+app_name = 'uploads'
+
+urlpatterns = [
+    # resized copy of an uploaded image, rendered on first request if missing
+    path('variants/<int:width>/<str:fmt>/<path:source>', views.ImageVariantAPIView.as_view(), name='image_variant'),
+
+    # chunked, resumable uploads: start, send chunks, complete
+    path('sessions/', views.UploadSessionCreateAPIView.as_view(), name='api_upload_session_create'),
+    path('sessions/<uuid:pk>/', views.UploadSessionDetailAPIView.as_view(), name='api_upload_session_detail'),
+    path('sessions/<uuid:pk>/chunks/<int:index>/', views.UploadChunkAPIView.as_view(), name='api_upload_chunk'),
+    path('sessions/<uuid:pk>/complete/', views.UploadCompleteAPIView.as_view(), name='api_upload_complete'),
+]
@@ -0,0 +1,158 @@
+import io
+from django.http import Http404, HttpResponseRedirect
+from django.views import View
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed, Throttled
+from rest_framework.throttling import SimpleRateThrottle
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from django.core.files.storage import default_storage
+from django.shortcuts import get_object_or_404
+from rest_framework import generics, permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .images import VARIANT_WIDTHS, VARIANT_FORMATS, get_or_render_variant, recorded_variant, is_image_source, VariantError
+from .models import UploadSession
+from .serializers import UploadSessionSerializer
+from .chunked import write_chunk, complete_session, UploadError
+from .fields import variant_urls
+from .tasks import queue_image_variants
+from .delivery import check_access, file_stat, serve, token_user, signed_url, is_public
+
+class VariantRenderThrottle(SimpleRateThrottle):
+    """
+    Limits the variants one client may have rendered on request, per user or IP.
+    Variants already recorded are not counted.
+    """
+    scope = 'variant_render'
+
+    def get_rate(self):
+        return settings.IMAGE_VARIANT_RENDER_RATE
+
+    def get_cache_key(self, request, view):
+        ident = request.user.pk if request.user.is_authenticated else self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+class ImageVariantAPIView(APIView):
+    """
+    GET /api/uploads/variants/<width>/<format>/<source>
+    Redirects to a resized copy of an uploaded image, rendering it on the first request
+    when the background task has not produced it yet. Variants of protected images
+    need the same access as the original (login or ?token= for the original).
+    """
+    permission_classes = [permissions.AllowAny]
+    # variants never change for a given source name
+    cache_max_age = 60 * 60 * 24
+
+    def get(self, request, width, fmt, source):
+        if width not in VARIANT_WIDTHS or fmt not in VARIANT_FORMATS or not is_image_source(source):
+            raise Http404
+        user = request.user
+        if not user.is_authenticated and request.GET.get('token'):
+            user = token_user(request.GET['token'], source) or user
+        # checked before anything is rendered, a protected name is not confirmed
+        if not check_access(user, source):
+            raise Http404
+
+        variant = recorded_variant(source, width, fmt)
+        if variant is None:
+            # decoding and resizing is heavy, cold renders are rate limited
+            throttle = VariantRenderThrottle()
+            if not throttle.allow_request(request, self):
+                raise Throttled(throttle.wait())
+            try:
+                variant = get_or_render_variant(source, width, fmt)
+            except VariantError:
+                raise Http404
+        response = HttpResponseRedirect(signed_url(user, variant.file))
+        response['Cache-Control'] = f"{'public' if is_public(source) else 'private'}, max-age={self.cache_max_age}"
+        return response
+
+class UploadSessionCreateAPIView(generics.CreateAPIView):
+    """
+    POST /api/uploads/sessions/
+    Starts a chunked upload: {'purpose': 'file'|'image'|'chat', 'filename', 'size', 'sha256'?, 'chunk_size'?}.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def perform_create(self, serializer):
+        serializer.save(owner=self.request.user)
+
+class UploadSessionDetailAPIView(generics.RetrieveAPIView):
+    """
+    GET /api/uploads/sessions/<id>/
+    Progress of an upload, a client resuming after a disconnect sends the missing chunks.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(owner=self.request.user)
+
+class UploadChunkAPIView(APIView):
+    """
+    PUT /api/uploads/sessions/<id>/chunks/<index>/
+    Raw chunk bytes as the request body, optionally with an X-Chunk-SHA256 header.
+    The body is streamed to disk, never read into memory at once.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def put(self, request, pk, index):
+        session = get_object_or_404(UploadSession, pk=pk, owner=request.user)
+        # None for an empty body
+        stream = request.stream or io.BytesIO()
+        try:
+            chunk = write_chunk(session, index, stream, checksum=request.headers.get('X-Chunk-SHA256'))
+        except UploadError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"index": chunk.index, "size": chunk.size, "sha256": chunk.sha256}, status=status.HTTP_200_OK)
+
+class UploadCompleteAPIView(APIView):
+    """
+    POST /api/uploads/sessions/<id>/complete/
+    Assembles the chunks, verifies the checksum and moves the file into media storage.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk):
+        get_object_or_404(UploadSession, pk=pk, owner=request.user)
+        try:
+            session = complete_session(pk, request.user)
+        except UploadError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = UploadSessionSerializer(session, context={'request': request}).data
+        data['url'] = default_storage.url(session.stored_name)
+        if session.purpose in ('image', 'chat'):
+            queue_image_variants(session.stored_name)
+            data['variants'] = variant_urls(session.stored_name, request)
+        return Response(data, status=status.HTTP_200_OK)
+
+class ProtectedMediaView(View):
+    """
+    GET /media/<name>
+    Serves uploaded files after checking who may read them (see delivery.can_access).
+    Links opened by the browser cannot carry the Authorization header, protected
+    files are linked with ?token=, a short-lived token for that one file
+    (see delivery.signed_url) rather than the JWT.
+    """
+    def get(self, request, name):
+        user = self.get_user(request, name)
+        found = file_stat(name)
+        # a file the user may not read is reported as missing, its name is not confirmed
+        if found is None or not check_access(user, name):
+            raise Http404
+        path, stat = found
+        return serve(request, name, path, stat)
+
+    def get_user(self, request, name):
+        if request.user.is_authenticated:
+            return request.user
+        if request.GET.get('token'):
+            return token_user(request.GET['token'], name) or request.user
+        try:
+            result = JWTAuthentication().authenticate(request)
+        except (AuthenticationFailed, InvalidToken, TokenError):
+            result = None
+        return result[0] if result else request.user
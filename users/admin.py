@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, ProfileStatus, Notification
+from .models import CustomUser, ProfileStatus, Notification, Announcement, AnnouncementReceipt
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
@@ -36,4 +36,17 @@ class NotificationAdmin(admin.ModelAdmin):
     """Admin configuration for system notifications."""
     list_display = ['recipient', 'title', 'is_read', 'created_at']
     list_filter = ['is_read', 'created_at']
-    search_fields = ['recipient__username', 'title', 'message']
\ No newline at end of file
+    search_fields = ['recipient__username', 'title', 'message']
+
+@admin.register(Announcement)
+class AnnouncementAdmin(admin.ModelAdmin):
+    """Admin configuration for course announcements."""
+    list_display = ['course', 'title', 'created_at']
+    list_filter = ['created_at']
+    search_fields = ['course__title', 'title', 'message']
+
+@admin.register(AnnouncementReceipt)
+class AnnouncementReceiptAdmin(admin.ModelAdmin):
+    """Admin configuration for per-user announcement state."""
+    list_display = ['user', 'announcement', 'dismissed']
+    list_filter = ['dismissed']
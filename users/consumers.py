@@ -0,0 +1,40 @@
+import logging
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from channels.db import database_sync_to_async
+from .push import user_group, course_group
+
+logger = logging.getLogger(__name__)
+
+class NotificationConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Pushes new notifications to the signed-in user, replacing the polling of the
+    notification list. The socket joins the user's own group and the announcement
+    group of every course they are enrolled in (courses joined later are picked
+    up on the next connection).
+    """
+    async def connect(self):
+        user = self.scope['user']
+        if not user.is_authenticated:
+            await self.close()
+            return
+
+        self.groups_joined = [user_group(user.id)]
+        self.groups_joined += [course_group(course_id) for course_id in await self.enrolled_course_ids(user)]
+        for group in self.groups_joined:
+            await self.channel_layer.group_add(group, self.channel_name)
+        await self.accept()
+        logger.info(f"Notification socket connected for user {user.id}")
+
+    async def disconnect(self, close_code):
+        for group in getattr(self, 'groups_joined', []):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def notification_push(self, event):
+        await self.send_json({
+            'count': event['count'],
+            'notifications': event['notifications'],
+        })
+
+    @database_sync_to_async
+    def enrolled_course_ids(self, user):
+        return list(user.enrollments.values_list('course_id', flat=True))
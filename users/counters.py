@@ -0,0 +1,102 @@
+import logging
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from .models import UserCounters, Notification
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = ['unread_notifications', 'enrolled_courses', 'completed_contents', 'unread_messages']
+# counter rows fetched per batch by reconcile()
+RECONCILE_BATCH_SIZE = 500
+
+
+def compute_counters(user):
+    '''
+    count every counter of a user from the underlying rows.
+    used for the first read of a user and by reconcile(), never per request
+    '''
+    # imported here because these apps depend on users.models
+    from students.models import Enrollment, UserContentProgress
+    from chat.models import PrivateMessage
+    from students.completion import legacy_marks
+    from .notifications import announcements_for
+
+    personal = Notification.objects.filter(recipient=user, is_read=False).count()
+    broadcast = announcements_for(user).filter(is_read=False).count()
+    # a content completed in both tables counts once (UNION, not UNION ALL)
+    marked = legacy_marks().filter(customuser=user).values_list('content_id', flat=True).order_by()
+    progressed = UserContentProgress.objects.filter(student=user, completed=True).values_list('content_id', flat=True).order_by()
+    return {
+        'unread_notifications': personal + broadcast,
+        'enrolled_courses': Enrollment.objects.filter(user=user).count(),
+        'completed_contents': marked.union(progressed).count(),
+        'unread_messages': PrivateMessage.objects.filter(recipient=user, is_read=False).count(),
+    }
+
+
+def get_counters(user):
+    '''
+    return the counters of a user as a dict, one primary key lookup.
+    the row is created from compute_counters() the first time
+    '''
+    row = UserCounters.objects.filter(user=user).first()
+    if row is None:
+        values = compute_counters(user)
+        try:
+            with transaction.atomic():
+                row = UserCounters.objects.create(user=user, **values)
+        except IntegrityError:
+            # created by a concurrent request in the meantime
+            row = UserCounters.objects.get(user=user)
+    # a counter can briefly go below zero when a delta races a recount
+    return {field: max(getattr(row, field), 0) for field in COUNTER_FIELDS}
+
+
+def add(user_ids, field, delta=1):
+    '''
+    move one counter of several users by delta with a single UPDATE.
+    user_ids can be a list or a values() queryset (used as a subquery).
+    users without a counters row are skipped, their first read counts from scratch
+    '''
+    if not delta:
+        return
+    if isinstance(user_ids, (list, set, tuple)) and not user_ids:
+        return
+    UserCounters.objects.filter(user_id__in=user_ids).update(**{field: F(field) + delta})
+
+
+def reset(user_id, field):
+    UserCounters.objects.filter(user_id=user_id).update(**{field: 0})
+
+
+def refresh(user_ids, fields=None):
+    '''
+    recount some counters of the given users, for changes that are
+    hard to express as a delta (e.g. leaving a course hides its announcements)
+    '''
+    from django.contrib.auth import get_user_model
+    fields = fields or COUNTER_FIELDS
+    existing = UserCounters.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True)
+    for user in get_user_model().objects.filter(pk__in=list(existing)):
+        values = compute_counters(user)
+        UserCounters.objects.filter(user=user).update(**{field: values[field] for field in fields})
+
+
+def reconcile(user_ids=None):
+    '''
+    recount the stored counters (of the given users, or everyone) and fix
+    the ones that drifted. users without a row are left alone, they are
+    counted on first read. returns the number of rows corrected
+    '''
+    rows = UserCounters.objects.select_related('user').order_by('pk')
+    if user_ids:
+        rows = rows.filter(user_id__in=user_ids)
+    corrected = 0
+    for row in rows.iterator(chunk_size=RECONCILE_BATCH_SIZE):
+        values = compute_counters(row.user)
+        drift = {field: value for field, value in values.items() if getattr(row, field) != value}
+        if drift:
+            logger.info(f"Counter drift for user {row.user_id}: {drift}")
+            UserCounters.objects.filter(pk=row.pk).update(**values)
+            corrected += 1
+    return corrected
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from users.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recount the stored unread/dashboard counters of users and correct any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user_ids', nargs='*', type=int, help='only reconcile these users (default: all)')
+
+    def handle(self, *args, **options):
+        corrected = reconcile(options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(f'Corrected the counters of {corrected} user(s).'))
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-17 22:09
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_user_counters'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='notification',
+            name='notif_unique_recipient_event',
+        ),
+        migrations.RemoveField(
+            model_name='notification',
+            name='event_key',
+        ),
+    ]
@@ -25,6 +25,12 @@ class CustomUser(AbstractUser):
     # profile image
     photo = models.ImageField(upload_to='profile_photos/', blank=True, null=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # keyset pagination of the admin user list
+            models.Index(fields=['-date_joined', '-id'], name='user_date_joined_idx'),
+        ]
+
     @property
     def is_student(self):
         return self.role == 'student'
@@ -76,7 +82,82 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # keyset pagination of a user's notifications
+            models.Index(fields=['recipient', '-created_at', '-id'], name='notif_recipient_created_idx'),
+        ]
 
     def __str__(self):
         return f"Notification for {self.recipient.username}: {self.title}"
 
+
+class Announcement(models.Model):
+    '''
+    a notification addressed to every student of a course.
+    stored once per course event and merged into each student's
+    notification list when it is read (fan-out on read)
+    '''
+    course = models.ForeignKey('courses.Course', on_delete=models.CASCADE, related_name='announcements')
+    title = models.CharField(max_length=255)
+    message = models.TextField()
+    link = models.CharField(max_length=255, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # identifies the event behind the announcement (e.g. "content:42"), announced once
+    event_key = models.CharField(max_length=100, unique=True, blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['course', '-created_at', '-id'], name='announcement_course_idx'),
+        ]
+
+    def __str__(self):
+        return f"Announcement for {self.course_id}: {self.title}"
+
+class NotificationCursor(models.Model):
+    '''
+    per-user read position in the announcements: everything created
+    up to read_until counts as read, "mark all as read" only moves it
+    '''
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                                related_name='notification_cursor', primary_key=True)
+    read_until = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.user_id} read until {self.read_until}"
+
+class AnnouncementReceipt(models.Model):
+    '''
+    per-user state of a single announcement that was read or dismissed
+    before the cursor reached it
+    '''
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='announcement_receipts')
+    announcement = models.ForeignKey(Announcement, on_delete=models.CASCADE, related_name='receipts')
+    # dismissed announcements are hidden from the user's list
+    dismissed = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ['user', 'announcement']
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.announcement_id}"
+
+class UserCounters(models.Model):
+    '''
+    badge and dashboard counters of a user, kept up to date with F() deltas
+    by the signals and views that change the counted rows.
+    a missing row is computed on first read, the reconcile_counters command
+    corrects any drift
+    '''
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                                related_name='counters', primary_key=True)
+    # personal notifications plus course announcements not read yet
+    unread_notifications = models.IntegerField(default=0)
+    enrolled_courses = models.IntegerField(default=0)
+    completed_contents = models.IntegerField(default=0)
+    # private messages received and not read yet
+    unread_messages = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Counters of {self.user_id}"
@@ -0,0 +1,24 @@
+from django.db.models import F, Exists, OuterRef, Case, When, Value, BooleanField
+from .models import Announcement, AnnouncementReceipt, NotificationCursor
+
+
+def announcements_for(user):
+    '''
+    announcements of the user's courses made since they enrolled,
+    minus the dismissed ones, annotated with is_read
+    '''
+    receipts = AnnouncementReceipt.objects.filter(user=user, announcement=OuterRef('pk'))
+    read = [When(Exists(receipts), then=Value(True))]
+    cursor = NotificationCursor.objects.filter(user=user).first()
+    if cursor is not None and cursor.read_until is not None:
+        read.append(When(created_at__lte=cursor.read_until, then=Value(True)))
+
+    return Announcement.objects.filter(
+        # both conditions go through the same enrollment row
+        course__enrollments__user=user,
+        created_at__gte=F('course__enrollments__date_joined'),
+    ).exclude(
+        Exists(receipts.filter(dismissed=True))
+    ).annotate(
+        is_read=Case(*read, default=Value(False), output_field=BooleanField())
+    )
@@ -0,0 +1,70 @@
+import logging
+from collections import defaultdict
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# notifications sent in full per push message, a bigger batch only sends its count
+# and the newest items, the client refetches the list if it needs the rest
+PUSH_PREVIEW_LIMIT = 20
+
+
+def user_group(user_id):
+    return f'notifications_user_{user_id}'
+
+
+def course_group(course_id):
+    return f'notifications_course_{course_id}'
+
+
+def compact(notification, kind='personal'):
+    ''' the fields a client needs to show a badge, a toast and the list entry '''
+    return {
+        'id': notification.pk,
+        'kind': kind,
+        'title': notification.title,
+        'message': notification.message,
+        'link': notification.link,
+        'created_at': notification.created_at.isoformat(),
+    }
+
+
+def push(items):
+    '''
+    send (group, payload) pairs to the notification sockets once the current
+    transaction commits (a rolled back write pushes nothing).
+    the batch is coalesced into one layer message per group, so a bulk
+    fan-out costs one message per recipient, not one per notification
+    '''
+    batch = defaultdict(list)
+    for group, payload in items:
+        batch[group].append(payload)
+    if batch:
+        transaction.on_commit(lambda: send(batch))
+
+
+def push_to_users(notifications):
+    push((user_group(n.recipient_id), compact(n)) for n in notifications)
+
+
+def push_to_course(announcement):
+    ''' one message for the whole course, every enrolled socket listens to its group '''
+    push([(course_group(announcement.course_id), compact(announcement, kind='broadcast'))])
+
+
+def send(batch):
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    for group, payloads in batch.items():
+        try:
+            async_to_sync(layer.group_send)(group, {
+                'type': 'notification.push',
+                'count': len(payloads),
+                'notifications': payloads[-PUSH_PREVIEW_LIMIT:],
+            })
+        except Exception as e:
+            # pushing is best effort, the list endpoint stays the source of truth
+            logger.warning(f"Could not push notifications to {group}: {e}")
@@ -0,0 +1,7 @@
+from django.urls import re_path
+from . import consumers
+
+websocket_urlpatterns = [
+    # Match ws://127.0.0.1:8000/ws/notifications/?token=<jwt>
+    re_path(r'ws/notifications/$', consumers.NotificationConsumer.as_asgi()),
+]
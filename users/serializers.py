@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.exceptions import AuthenticationFailed
-from .models import CustomUser, ProfileStatus, Notification
+from .models import CustomUser, ProfileStatus, Notification, Announcement
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -116,6 +116,24 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
 
 class NotificationSerializer(serializers.ModelSerializer):
     '''serializer for user notification'''
+    kind = serializers.SerializerMethodField()
+
     class Meta:
         model = Notification
-        fields = ['id', 'title', 'message', 'is_read', 'created_at', 'link']
\ No newline at end of file
+        fields = ['id', 'kind', 'title', 'message', 'is_read', 'created_at', 'link']
+
+    def get_kind(self, obj) -> str:
+        return 'personal'
+
+class AnnouncementSerializer(serializers.ModelSerializer):
+    '''serializer for course announcements, listed with the personal notifications'''
+    kind = serializers.SerializerMethodField()
+    # annotated by the notification list from the read cursor and receipts
+    is_read = serializers.BooleanField(read_only=True, default=False)
+
+    class Meta:
+        model = Announcement
+        fields = ['id', 'kind', 'title', 'message', 'is_read', 'created_at', 'link']
+
+    def get_kind(self, obj) -> str:
+        return 'broadcast'
\ No newline at end of file
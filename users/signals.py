@@ -0,0 +1,101 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from courses.models import Course, Content
+from students.models import Enrollment, UserContentProgress
+from students.completion import legacy_marks
+from chat.models import PrivateMessage
+from .models import Notification, Announcement
+from . import counters, push
+
+# keep users.UserCounters in step with the rows it counts and push new
+# notifications to the open notification sockets.
+# bulk paths (bulk_create, queryset.update) bypass these handlers and
+# adjust the counters themselves, reconcile_counters fixes anything missed
+
+
+@receiver(post_save, sender=Notification)
+def count_new_notification(sender, instance, created, **kwargs):
+    if created and not instance.is_read:
+        counters.add([instance.recipient_id], 'unread_notifications')
+    if created:
+        push.push_to_users([instance])
+
+
+@receiver(post_delete, sender=Notification)
+def uncount_deleted_notification(sender, instance, **kwargs):
+    if not instance.is_read:
+        counters.add([instance.recipient_id], 'unread_notifications', -1)
+
+
+@receiver(post_save, sender=Announcement)
+def count_new_announcement(sender, instance, created, **kwargs):
+    '''
+    one UPDATE for every student of the course, the announcement itself is not copied
+    '''
+    if created:
+        recipients = Enrollment.objects.filter(
+            course_id=instance.course_id, date_joined__lte=instance.created_at
+        ).values('user_id')
+        counters.add(recipients, 'unread_notifications')
+        push.push_to_course(instance)
+
+
+@receiver(m2m_changed, sender=Course.students.through)
+def count_enrollments(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+    # course.students.add(user) gives user ids, user.courses_joined.add(course) course ids
+    user_ids = [instance.pk] if reverse else list(pk_set)
+    delta = len(pk_set) if reverse else 1
+    if action == 'post_add':
+        counters.add(user_ids, 'enrolled_courses', delta)
+    else:
+        counters.add(user_ids, 'enrolled_courses', -delta)
+        # announcements of a course left are no longer listed
+        counters.refresh(user_ids, ['unread_notifications'])
+
+
+def completed_elsewhere(model, user_id, content_id):
+    '''
+    completion is recorded in two tables, a content counts once whichever holds it
+    '''
+    if model is UserContentProgress:
+        return legacy_marks().filter(customuser_id=user_id, content_id=content_id).exists()
+    return UserContentProgress.objects.filter(student_id=user_id, content_id=content_id, completed=True).exists()
+
+
+@receiver(post_save, sender=UserContentProgress)
+def count_progress(sender, instance, created, **kwargs):
+    # synced changes are written in bulk and recounted by students.sync
+    if created and instance.completed and not completed_elsewhere(UserContentProgress, instance.student_id, instance.content_id):
+        counters.add([instance.student_id], 'completed_contents')
+
+
+@receiver(post_delete, sender=UserContentProgress)
+def uncount_progress(sender, instance, **kwargs):
+    if instance.completed and not completed_elsewhere(UserContentProgress, instance.student_id, instance.content_id):
+        counters.add([instance.student_id], 'completed_contents', -1)
+
+
+@receiver(m2m_changed, sender=Content.completed_users.through)
+def count_completed_users(sender, instance, action, reverse, pk_set, **kwargs):
+    # post_clear carries no pk_set, it is left to reconcile_counters
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+    delta = 1 if action == 'post_add' else -1
+    for pk in pk_set:
+        user_id, content_id = (instance.pk, pk) if reverse else (pk, instance.pk)
+        if not completed_elsewhere(Content, user_id, content_id):
+            counters.add([user_id], 'completed_contents', delta)
+
+
+@receiver(post_save, sender=PrivateMessage)
+def count_private_message(sender, instance, created, **kwargs):
+    if created and not instance.is_read:
+        counters.add([instance.recipient_id], 'unread_messages')
+
+
+@receiver(post_delete, sender=PrivateMessage)
+def uncount_private_message(sender, instance, **kwargs):
+    if not instance.is_read:
+        counters.add([instance.recipient_id], 'unread_messages', -1)
@@ -2,7 +2,17 @@ from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from .factories import CustomUserFactory, AdminUserFactory
-from users.models import CustomUser
+from users.models import CustomUser, Notification, Announcement, AnnouncementReceipt, UserCounters
+from courses.tests.factories import CourseFactory, ModuleFactory, ContentFactory, TextFactory
+from chat.tests.factories import PrivateMessageFactory
+from students.models import UserContentProgress
+from users.counters import reconcile
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from rest_framework_simplejwt.tokens import AccessToken
+from chat.middleware import JWTAuthMiddleware
+from users.consumers import NotificationConsumer
 
 class UserAPIIntegrationTests(APITestCase):
     
@@ -29,4 +39,148 @@ class UserAPIIntegrationTests(APITestCase):
         """Security: Ensure students receive a 403 Forbidden when accessing the admin dashboard."""
         self.client.force_authenticate(user=self.student)
         response = self.client.get(self.dashboard_url)
-        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+class NotificationFeedTests(APITestCase):
+
+    def setUp(self):
+        self.student = CustomUserFactory(role='student')
+        self.outsider = CustomUserFactory(role='student')
+        self.course = CourseFactory()
+        self.course.students.add(self.student)
+        self.personal = Notification.objects.create(recipient=self.student, title='Welcome', message='Hello.')
+        self.announcement = Announcement.objects.create(course=self.course, title='New Course Material!', message='Read it.')
+        self.list_url = reverse('users:notification-list')
+
+    def test_announcement_is_merged_with_personal_notifications(self):
+        """Enrolled students see the course announcement next to their own notifications, newest first."""
+        self.client.force_authenticate(user=self.student)
+        response = self.client.get(self.list_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        kinds = [(row['kind'], row['id'], row['is_read']) for row in response.data['results']]
+        self.assertEqual(kinds, [('broadcast', self.announcement.id, False), ('personal', self.personal.id, False)])
+
+    def test_announcement_not_shown_outside_the_course(self):
+        self.client.force_authenticate(user=self.outsider)
+        response = self.client.get(self.list_url)
+        self.assertEqual(response.data['results'], [])
+
+    def test_cursor_walks_the_merged_feed(self):
+        """Paging one row at a time returns every notification once."""
+        self.client.force_authenticate(user=self.student)
+        response = self.client.get(self.list_url, {'page_size': 1})
+        seen = [row['kind'] for row in response.data['results']]
+        response = self.client.get(response.data['next'])
+        seen += [row['kind'] for row in response.data['results']]
+        self.assertEqual(seen, ['broadcast', 'personal'])
+        self.assertIsNone(response.data['next'])
+
+    def test_mark_all_read_advances_the_cursor(self):
+        self.client.force_authenticate(user=self.student)
+        self.client.post(reverse('users:notification-mark-all-read'))
+        response = self.client.get(self.list_url)
+        self.assertTrue(all(row['is_read'] for row in response.data['results']))
+        # nothing was written per announcement
+        self.assertFalse(AnnouncementReceipt.objects.exists())
+
+    def test_dismissed_announcement_is_hidden(self):
+        self.client.force_authenticate(user=self.student)
+        url = reverse('users:notification-dismiss-announcement', kwargs={'announcement_id': self.announcement.id})
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_200_OK)
+        response = self.client.get(self.list_url)
+        self.assertEqual([row['kind'] for row in response.data['results']], ['personal'])
+
+
+class UserCountersTests(APITestCase):
+
+    def setUp(self):
+        self.student = CustomUserFactory(role='student')
+        self.course = CourseFactory()
+        self.course.students.add(self.student)
+        Notification.objects.create(recipient=self.student, title='Welcome', message='Hello.')
+        self.url = reverse('users:api_user_counters')
+        self.client.force_authenticate(user=self.student)
+
+    def counters(self):
+        return self.client.get(self.url).data
+
+    def test_first_read_counts_from_the_rows(self):
+        self.assertEqual(self.counters(), {
+            'unread_notifications': 1, 'enrolled_courses': 1, 'completed_contents': 0, 'unread_messages': 0,
+        })
+        self.assertTrue(UserCounters.objects.filter(user=self.student).exists())
+
+    def test_counters_follow_writes(self):
+        """Once stored, the counters are moved by the signals and views, not recounted."""
+        self.counters()
+        Announcement.objects.create(course=self.course, title='New Course Material!', message='Read it.')
+        CourseFactory().students.add(self.student)
+        content = ContentFactory(module=ModuleFactory(course=self.course), item=TextFactory())
+        UserContentProgress.objects.create(student=self.student, content=content)
+        # completed in both tables, still one completed content
+        content.completed_users.add(self.student)
+        PrivateMessageFactory(recipient=self.student)
+
+        with self.assertNumQueries(1):
+            data = self.counters()
+        self.assertEqual(data, {
+            'unread_notifications': 2, 'enrolled_courses': 2, 'completed_contents': 1, 'unread_messages': 1,
+        })
+
+    def test_reading_resets_counters(self):
+        self.counters()
+        message = PrivateMessageFactory(recipient=self.student)
+        self.client.post(reverse('users:notification-mark-all-read'))
+        self.client.get(reverse('chat:api_private_chat_history', kwargs={'target_user_id': message.sender_id}))
+        data = self.counters()
+        self.assertEqual((data['unread_notifications'], data['unread_messages']), (0, 0))
+
+    def test_reconcile_corrects_drift(self):
+        self.counters()
+        UserCounters.objects.filter(user=self.student).update(unread_notifications=42, enrolled_courses=0)
+        self.assertEqual(reconcile(), 1)
+        self.assertEqual(self.counters()['unread_notifications'], 1)
+        self.assertEqual(self.counters()['enrolled_courses'], 1)
+
+
+class NotificationPushTests(APITestCase):
+
+    def setUp(self):
+        self.student = CustomUserFactory(role='student')
+        self.course = CourseFactory()
+        self.course.students.add(self.student)
+
+    async def open_socket(self, user):
+        application = JWTAuthMiddleware(NotificationConsumer.as_asgi())
+        communicator = WebsocketCommunicator(application, f'/ws/notifications/?token={AccessToken.for_user(user)}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def run_after_commit(self, write):
+        def commit():
+            with self.captureOnCommitCallbacks(execute=True):
+                write()
+        await database_sync_to_async(commit)()
+
+    def test_new_notifications_are_pushed(self):
+        """A personal notification and a course announcement each arrive as one message."""
+        async def scenario():
+            socket = await self.open_socket(self.student)
+            await self.run_after_commit(lambda: Notification.objects.create(recipient=self.student, title='Welcome', message='Hello.'))
+            single = await socket.receive_json_from()
+            await self.run_after_commit(lambda: Announcement.objects.create(course=self.course, title='News', message='Read it.'))
+            broadcast = await socket.receive_json_from()
+            await socket.disconnect()
+            return single, broadcast
+
+        single, broadcast = async_to_sync(scenario)()
+        self.assertEqual((single['count'], single['notifications'][0]['title'], single['notifications'][0]['message']), (1, 'Welcome', 'Hello.'))
+        self.assertEqual(broadcast['notifications'][0]['kind'], 'broadcast')
+
+    def test_anonymous_socket_is_refused(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(JWTAuthMiddleware(NotificationConsumer.as_asgi()), '/ws/notifications/')
+            connected, _ = await communicator.connect()
+            return connected
+        self.assertFalse(async_to_sync(scenario)())
@@ -17,6 +17,9 @@ urlpatterns = [
     # retrieve or update the current user endpoint
     path('me/', views.UserMeAPIView.as_view(), name='api_user_me'),
     
+    # unread / dashboard counters of the current user
+    path('me/counters/', views.UserCountersAPIView.as_view(), name='api_user_counters'),
+
     # changing password endpoint
     path('me/change-password/', views.ChangePasswordAPIView.as_view(), name='api_change_password'),
     
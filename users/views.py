@@ -3,13 +3,17 @@ from rest_framework import generics, viewsets, status, permissions
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from .models import CustomUser, Notification
+from .models import CustomUser, Notification, AnnouncementReceipt, NotificationCursor
+from .notifications import announcements_for
+from . import counters
 from courses.models import Course
 from .api_permissions import IsSiteAdminAPI
-from .serializers import ProfileStatusSerializer, CustomTokenObtainPairSerializer,UserProfileSerializer, UserRegistrationSerializer, UserEditSerializer,AdminUserSerializer,NotificationSerializer, ChangePasswordSerializer
+from .serializers import ProfileStatusSerializer, CustomTokenObtainPairSerializer,UserProfileSerializer, UserRegistrationSerializer, UserEditSerializer,AdminUserSerializer,NotificationSerializer, AnnouncementSerializer, ChangePasswordSerializer
 from django.contrib.auth import get_user_model
 from django.db.models import Count
+from django.utils import timezone
 from rest_framework_simplejwt.views import TokenObtainPairView
+from config.pagination import KeysetPagination, MergedKeysetPagination
 
 User = get_user_model()
 
@@ -72,6 +76,16 @@ class UserMeAPIView(generics.RetrieveUpdateAPIView):
         # 强制获取当前登录的用户，完美防御 IDOR
         return self.request.user
 
+class UserCountersAPIView(APIView):
+    """
+    GET /api/users/me/counters/
+    Badge and dashboard counters of the current user, read from one stored row.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return Response(counters.get_counters(request.user), status=status.HTTP_200_OK)
+
 class AdminDashboardAPIView(APIView):
     """
     GET /api/users/admin/dashboard/
@@ -99,6 +113,8 @@ class AdminUserListAPIView(generics.ListAPIView):
     """
     serializer_class = AdminUserSerializer
     permission_classes = [IsSiteAdminAPI]
+    pagination_class = KeysetPagination
+    cursor_timestamp_field = 'date_joined'
 
     def get_queryset(self):
         return User.objects.exclude(id=self.request.user.id).order_by('-date_joined')
@@ -125,27 +141,75 @@ class AdminUserToggleAPIView(APIView):
 class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     """
     user only can view their notif
+    the list merges personal notifications with the announcements
+    of the courses the user is enrolled in, newest first
     """
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    cursor_timestamp_field = 'created_at'
 
     def get_queryset(self):
         return Notification.objects.filter(recipient=self.request.user)
 
+    def get_announcement_queryset(self):
+        return announcements_for(self.request.user)
+
+    def get_feed_sources(self):
+        # index order is part of the cursor, append new sources at the end
+        return [self.get_queryset(), self.get_announcement_queryset()]
+
+    def list(self, request, *args, **kwargs):
+        """ GET /api/notifications/ """
+        paginator = MergedKeysetPagination()
+        page = paginator.paginate_queryset(None, request, view=self)
+        serializers = [NotificationSerializer, AnnouncementSerializer]
+        context = self.get_serializer_context()
+        data = [serializers[row.feed_source](row, context=context).data for row in page]
+        return paginator.get_paginated_response(data)
+
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
         """ POST /api/notifications/mark_all_read/ """
-        self.get_queryset().update(is_read=True)
+        self.get_queryset().filter(is_read=False).update(is_read=True)
+        # announcements are not copied per user, moving the cursor marks them all
+        NotificationCursor.objects.update_or_create(user=request.user, defaults={'read_until': timezone.now()})
+        counters.reset(request.user.id, 'unread_notifications')
         return Response({'status': 'all marked as read'})
 
     @action(detail=True, methods=['post'])
     def mark_read(self, request, pk=None):
         """ POST /api/notifications/{id}/mark_read/ """
         notification = self.get_object()
-        notification.is_read = True
-        notification.save()
+        if not notification.is_read:
+            notification.is_read = True
+            notification.save()
+            counters.add([request.user.id], 'unread_notifications', -1)
+        return Response({'status': 'marked as read'})
+
+    def get_announcement(self, announcement_id):
+        return get_object_or_404(self.get_announcement_queryset(), pk=announcement_id)
+
+    @action(detail=False, methods=['post'], url_path=r'announcements/(?P<announcement_id>\d+)/mark_read')
+    def mark_announcement_read(self, request, announcement_id=None):
+        """ POST /api/notifications/announcements/{id}/mark_read/ """
+        announcement = self.get_announcement(announcement_id)
+        _, created = AnnouncementReceipt.objects.get_or_create(user=request.user, announcement=announcement)
+        if created and not announcement.is_read:
+            counters.add([request.user.id], 'unread_notifications', -1)
         return Response({'status': 'marked as read'})
 
+    @action(detail=False, methods=['post'], url_path=r'announcements/(?P<announcement_id>\d+)/dismiss')
+    def dismiss_announcement(self, request, announcement_id=None):
+        """ POST /api/notifications/announcements/{id}/dismiss/ """
+        announcement = self.get_announcement(announcement_id)
+        AnnouncementReceipt.objects.update_or_create(
+            user=request.user, announcement=announcement, defaults={'dismissed': True}
+        )
+        if not announcement.is_read:
+            counters.add([request.user.id], 'unread_notifications', -1)
+        return Response({'status': 'dismissed'})
+
 class ChangePasswordAPIView(generics.UpdateAPIView):
     """
     PUT /api/users/change-password/